@@ -132,20 +132,30 @@ def del_files_from_disk(path):
 
 def del_files_from_db(dbh, relpath, archive):
     """ delete files from file_archive_info table """
+    (pathsql, params) = dbutils.path_clause(dbh, 'path', relpath)
+    params['archive_name'] = archive
     cur = dbh.cursor()
-    cur.execute("delete from file_archive_info where archive_name='%s' and path like '%s%%'" %
-                (archive, relpath))
+    cur.execute("delete from file_archive_info where archive_name=%s and %s" %
+                (dbh.get_named_bind_string('archive_name'), pathsql), params)
     dbh.commit()
     #dbh.rollback()
 
 
 def del_part_files_from_db_by_name(dbh, relpath, archive, delfiles):
+    (pathsql, params) = dbutils.path_clause(dbh, 'path', relpath)
+    params['archive_name'] = archive
+    sql = "delete from file_archive_info where archive_name=%s and %s and filename=%s" % (
+        dbh.get_named_bind_string('archive_name'), pathsql, dbh.get_named_bind_string('filename'))
     cur = dbh.cursor()
-    cur.prepare("delete from file_archive_info where archive_name='%s' and path like '%s%%' and filename=:1" % (
-        archive, relpath))
-    print("delete from file_archive_info where archive_name='%s' and path like '%s%%' and filename=:1" % (archive, relpath))
+    cur.prepare(sql)
+    print(sql)
     print(delfiles)
-    cur.executemany(None, delfiles)
+    rows = []
+    for fname in delfiles:
+        row = dict(params)
+        row['filename'] = fname
+        rows.append(row)
+    cur.executemany(None, rows)
     print("ROWS", cur.rowcount)
     if cur.rowcount != len(delfiles):
         print("Inconsistency detected: %i rows removed from db and %i files deleted, these should match." % (cur.rowcount, len(delfiles)))
@@ -159,7 +169,8 @@ def del_part_files_from_db(dbh, archive, delfileid):
     tid = dbh.load_id_gtt(delfileid)
     cur = dbh.cursor()
     cur.execute(
-        "delete from file_archive_info fai where archive_name='%s' and fai.desfile_id in (select id from %s)" % (archive, tid))
+        "delete from file_archive_info fai where archive_name=%s and fai.desfile_id in (select id from %s)" %
+        (dbh.get_named_bind_string('archive_name'), tid), {'archive_name': archive})
     if len(delfileid) != cur.rowcount:
         print("Inconsistency detected: %i rows removed from db and %i files deleted, these should match." % (cur.rowcount, len(delfileid)))
     dbh.commit()
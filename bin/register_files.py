@@ -11,6 +11,9 @@ import time
 import despymisc.miscutils as miscutils
 import filemgmt.filemgmt_defs as fmdefs
 import filemgmt.errors as fmerrors
+import filemgmt.dirwalk as dirwalk
+import filemgmt.reg_journal as regjournal
+import filemgmt.reg_pipeline as regpipeline
 
 
 def create_list_of_files(filemgmt, args):
@@ -21,6 +24,12 @@ def create_list_of_files(filemgmt, args):
     if args['filetype'] is not None:
         if not filemgmt.is_valid_filetype(args['filetype']):
             miscutils.fwdie("Error:  Invalid filetype (%s)" % args['filetype'], 1)
+        if args['pipeline']:
+            # files are found while the pipeline runs
+            filelist = {args['filetype']:
+                        regpipeline.walk_files(get_ingest_path(args['path']))}
+            print("DONE (%0.2f secs)" % (time.time() - starttime))
+            return filelist
         filelist = get_list_filenames(args['path'], args['filetype'])
     elif args['list'] is not None:
         filelist = parse_provided_list(args['list'])
@@ -74,8 +83,8 @@ def parse_provided_list(listname):
     return filelist
 
 
-def get_list_filenames(ingestpath, filetype):
-    """Create a dictionary by filetype of files in given path.
+def get_ingest_path(ingestpath):
+    """Return absolute version of given ingest path after checking it exists.
     """
     if ingestpath[0] != '/':
         cwd = os.getenv('PWD')  # don't use getcwd as it canonicallizes path
@@ -85,127 +94,95 @@ def get_list_filenames(ingestpath, filetype):
     if not os.path.exists(ingestpath):
         miscutils.fwdie("Error:   could not find ingestpath:  %s" % ingestpath, 1)
 
-    filelist = []
-    for (dirpath, _, filenames) in os.walk(ingestpath):
-        for fname in filenames:
-            filelist.append(dirpath+'/'+fname)
-
-    return {filetype: filelist}
+    return ingestpath
 
 
-def list_missing_metadata(filemgmt, ftype, filelist):
-    """Return list of files from given set which are missing metadata.
+def get_list_filenames(ingestpath, filetype):
+    """Create a dictionary by filetype of files in given path.
     """
-    # filelist = list of file dicts
-
-    if miscutils.fwdebug_check(6, "REGISTER_FILES_DEBUG"):
-        miscutils.fwdebug_print("filelist=%s" % (filelist))
-
-    print("\tChecking which files already have metadata registered", end=' ')
-    starttime = time.time()
-    results = filemgmt.has_metadata_ingested(ftype, filelist)
-    endtime = time.time()
-    print("(%0.2f secs)" % (endtime - starttime))
+    ingestpath = get_ingest_path(ingestpath)
 
-    # no metadata if results[name] == False
-    havelist = [fname for fname in results if results[fname]]
-    misslist = [fname for fname in results if not results[fname]]
-
-    print("\t\t%0d file(s) already have metadata ingested" % (len(havelist)))
-    print("\t\t%0d file(s) still to have metadata ingested" % (len(misslist)))
+    filelist = []
+    for (dirpath, _, files) in dirwalk.walk(ingestpath):
+        for entry in files:
+            filelist.append(dirpath+'/'+entry.name)
 
-    if miscutils.fwdebug_check(6, "REGISTER_FILES_DEBUG"):
-        miscutils.fwdebug_print("misslist=%s" % (misslist))
+    return {filetype: filelist}
 
-    return misslist
 
+def get_registration_work(filemgmt, ftype, filelist, archive_name):
+    """Return lists of files still needing metadata, contents and archive location.
 
-def list_missing_contents(filemgmt, ftype, filelist):
-    """Return list of files from given set which still need contents ingested.
+    Files needing metadata aren't in the contents list as their contents
+    are ingested when their metadata is saved.
     """
-    # filelist = list of file dicts
+    # filelist = list of fullnames
 
     if miscutils.fwdebug_check(6, "REGISTER_FILES_DEBUG"):
         miscutils.fwdebug_print("filelist=%s" % (filelist))
 
-    print("\tChecking which files still need contents ingested", end=' ')
+    print("\tChecking which files are already registered", end=' ')
     starttime = time.time()
-    results = filemgmt.has_contents_ingested(ftype, filelist)
+    status = filemgmt.get_registration_status(ftype, filelist, archive_name)
     endtime = time.time()
     print("(%0.2f secs)" % (endtime - starttime))
 
-    # no metadata if results[name] == False
-    misslist = [fname for fname in results if not results[fname]]
+    metalist = [fname for fname in filelist if not status[fname][fmdefs.FM_STATUS_METADATA]]
+    contentlist = [fname for fname in filelist if status[fname][fmdefs.FM_STATUS_METADATA] and
+                   not status[fname][fmdefs.FM_STATUS_CONTENTS]]
+    archivelist = [fname for fname in filelist if not status[fname][fmdefs.FM_STATUS_ARCHIVE]]
 
-    print("\t\t%0d file(s) already have content ingested" % (len(filelist) - len(misslist)))
-    print("\t\t%0d file(s) still to have content ingested" % len(misslist))
+    print("\t\t%0d file(s) already have metadata ingested" % (len(filelist) - len(metalist)))
+    print("\t\t%0d file(s) still to have metadata ingested" % (len(metalist)))
+    print("\t\t%0d file(s) with metadata still to have content ingested" % len(contentlist))
+    print("\t\t%0d file(s) already in archive" % (len(filelist) - len(archivelist)))
+    print("\t\t%0d file(s) still to be registered to archive" % len(archivelist))
 
     if miscutils.fwdebug_check(6, "REGISTER_FILES_DEBUG"):
-        miscutils.fwdebug_print("misslist=%s" % (misslist))
-
-    return misslist
-
-
-def list_missing_archive(filemgmt, filelist, archive_name):
-    """Return list of files from given list which are not listed in archive.
-    """
-    print("\tChecking which files are already registered in archive", end=' ')
-    starttime = time.time()
-    existing = filemgmt.is_file_in_archive(filelist, archive_name)
-    endtime = time.time()
-    print("(%0.2f secs)" % (endtime - starttime))
+        miscutils.fwdebug_print("metalist=%s" % (metalist))
+        miscutils.fwdebug_print("contentlist=%s" % (contentlist))
+        miscutils.fwdebug_print("archivelist=%s" % (archivelist))
 
-    filenames = {}
-    for fullname in filelist:
-        fname = miscutils.parse_fullname(fullname, miscutils.CU_PARSE_BASENAME)
-        filenames[fname] = fullname
+    return metalist, contentlist, archivelist
 
-    missing_basenames = set(filenames.keys()) - set(existing)
-    misslist = [filenames[f] for f in missing_basenames]
 
-    print("\t\t%0d file(s) already in archive" % len(existing))
-    print("\t\t%0d file(s) still to be registered to archive" % len(misslist))
-    return misslist
-
-
-def save_file_info(filemgmt, task_id, ftype, filelist):
+def save_file_info(filemgmt, task_id, ftype, metalist, contentlist, num_workers=1):
     """Save file metadata and contents.
+
+    metalist are files missing metadata (contents are saved with it) and
+    contentlist files only missing contents.  Returns set of fullnames
+    which had problems being saved.
     """
-    # filelist = list of file dicts
+    problemfiles = set()
 
-    # check which files already have metadata in database
     #     don't bother with updating existing data, as files should be immutable
-    misslist = list_missing_metadata(filemgmt, ftype, filelist)
-
-    if len(misslist) != 0:
-        print("\tSaving file metadata/contents on %0d files...." % len(misslist), end=' ')
+    if len(metalist) != 0:
+        print("\tSaving file metadata/contents on %0d files...." % len(metalist), end=' ')
         starttime = time.time()
         try:
-            filemgmt.register_file_data(ftype, misslist, None, task_id, False, None, None)
+            results = filemgmt.register_file_data(ftype, metalist, None, task_id, False,
+                                                  None, None, num_workers)
         except fmerrors.RequiredMetadataMissingError as err:
             miscutils.fwdie("Error: %s" % err, 1)
 
+        if results is not None:
+            problemfiles = set([fname for fname in results if results[fname] is None])
         endtime = time.time()
         print("DONE (%0.2f secs)" % (endtime - starttime))
 
-    # check which files already have contents in database
-    #     don't bother with updating existing data, as files should be immutable
-    misslist = list_missing_contents(filemgmt, ftype, filelist)
-
-    if len(misslist) != 0:
-        print("\tSaving file contents on %0d files...." % len(misslist), end=' ')
+    if len(contentlist) != 0:
+        print("\tSaving file contents on %0d files...." % len(contentlist), end=' ')
         starttime = time.time()
-        filemgmt.ingest_contents(ftype, misslist)
+        filemgmt.ingest_contents(ftype, contentlist)
         endtime = time.time()
         print("DONE (%0.2f secs)" % (endtime - starttime))
 
+    return problemfiles
 
-def save_archive_location(filemgmt, filelist, archive_name):
-    """Save location in archive.
-    """
-    # check which files already are in archive
-    missing_files = list_missing_archive(filemgmt, filelist, archive_name)
 
+def save_archive_location(filemgmt, missing_files, archive_name):
+    """Save location in archive of files not yet registered there.
+    """
     # create input list of files that need to be registered in archive
     if len(missing_files) > 0:
         print("\tRegistering %s file(s) in archive..." % len(missing_files), end=' ')
@@ -221,8 +198,13 @@ def save_archive_location(filemgmt, filelist, archive_name):
         print("DONE (%0.2f secs)" % (endtime - starttime))
 
 
-def process_files(filelist, filemgmt, task_id, archive_name, do_commit):
+def process_files(filelist, filemgmt, task_id, archive_name, do_commit, num_workers=1,
+                  journal=None, commit_every=None):
     """Ingests file metadata for all files in filelist.
+
+    If commit_every is given, commits after every that many files of a
+    filetype instead of once per filetype.  Files the journal says are
+    completely registered are skipped.
     """
     # filelist[fullname] = {'path': path, 'filetype': filetype, 'fullname':fullname,
     #                       'filename', 'compression'}
@@ -232,16 +214,82 @@ def process_files(filelist, filemgmt, task_id, archive_name, do_commit):
     if miscutils.fwdebug_check(6, "REGISTER_FILES_DEBUG"):
         miscutils.fwdebug_print("filelist=%s" % (filelist))
 
+    donefiles = set()
+    if journal is not None:
+        donefiles = journal.done_files()
+        print("\t%0d file(s) already registered according to journal %s" %
+              (len(donefiles), journal.journalname))
+
     # work in sets defined by filetype
     for ftype in sorted(filelist.keys()):
         print("\n%s:" % ftype)
         print("\tTotal: %s file(s) of this type" % len(filelist[ftype]))
 
-        save_file_info(filemgmt, task_id, ftype, filelist[ftype])
-        save_archive_location(filemgmt, filelist[ftype], archive_name)
+        todolist = [fname for fname in filelist[ftype] if fname not in donefiles]
+        if len(todolist) != len(filelist[ftype]):
+            print("\tSkipping %0d file(s) completed in earlier run" %
+                  (len(filelist[ftype]) - len(todolist)))
+
+        chunksize = commit_every
+        if chunksize is None or chunksize <= 0:
+            chunksize = max(len(todolist), 1)
+
+        for start in range(0, len(todolist), chunksize):
+            chunk = todolist[start:start+chunksize]
+            if len(chunk) != len(todolist):
+                print("\n\tFiles %0d-%0d of %0d" % (start+1, start+len(chunk), len(todolist)))
+
+            # load chunk's names into the filename GTT once for all the checks
+            with filemgmt.file_set(chunk):
+                (metalist, contentlist, archivelist) = get_registration_work(
+                    filemgmt, ftype, chunk, archive_name)
+                problemfiles = save_file_info(filemgmt, task_id, ftype, metalist,
+                                              contentlist, num_workers)
+                goodlist = [fname for fname in chunk if fname not in problemfiles]
+                save_archive_location(filemgmt,
+                                      [fname for fname in archivelist
+                                       if fname not in problemfiles], archive_name)
+
+                if do_commit:
+                    filemgmt.commit()
+                    # only record files as done once the DB has them
+                    if journal is not None:
+                        journal.mark_done(goodlist, ftype, regjournal.ALL_STAGES)
+
+            if problemfiles:
+                print("\tWarning: %0d file(s) could not be saved:" % len(problemfiles))
+                for fname in sorted(problemfiles):
+                    print("\t\t%s" % fname)
+
+
+def process_files_pipeline(filelist, filemgmt, task_id, archive_name, do_commit,
+                           num_workers=1, journal=None, commit_every=None):
+    """Register files with scanning, reading and DB writes overlapping.
+    """
+    # filelist[filetype] = iterable of fullnames
 
-        if do_commit:
-            filemgmt.commit()
+    skip = None
+    if journal is not None:
+        skip = journal.done_files()
+        print("\t%0d file(s) already registered according to journal %s" %
+              (len(skip), journal.journalname))
+
+    pipeline = regpipeline.RegistrationPipeline(filemgmt, task_id, archive_name, do_commit,
+                                                num_workers, commit_every, None, journal)
+    totfilecnt = 0
+    for ftype in sorted(filelist.keys()):
+        print("\n%s:" % ftype)
+        starttime = time.time()
+        problemfiles = pipeline.run(ftype, filelist[ftype], skip)
+        totfilecnt += pipeline.numfound
+        print("\tTotal: %s file(s) of this type, %s skipped, %s registered (%0.2f secs)" %
+              (pipeline.numfound, pipeline.numskipped, pipeline.numdone,
+               time.time() - starttime))
+        if problemfiles:
+            print("\tWarning: %0d file(s) could not be saved:" % len(problemfiles))
+            for fname in sorted(problemfiles):
+                print("\t\t%s" % fname)
+    return totfilecnt
 
 
 def parse_cmdline(argv):
@@ -266,6 +314,23 @@ def parse_cmdline(argv):
                         help='single value, must also specify search path')
     parser.add_argument('--path', action='store',
                         help='single value, must also specify filetype')
+    parser.add_argument('--workers', action='store', type=int, default=1,
+                        help='number of parallel workers reading metadata/md5sums from files')
+    parser.add_argument('--journal', action='store',
+                        help='local file recording finished files so an interrupted run can resume')
+    parser.add_argument('--commit-every', action='store', type=int, default=None,
+                        help='commit after this many files instead of once per filetype')
+    parser.add_argument('--pipeline', action='store_true', default=False,
+                        help='scan, read and save files at the same time (commits every '
+                             '--commit-every files, default %s)' % fmdefs.FM_REGISTER_BATCH_SIZE)
+    parser.add_argument('--fits-header-backend', action='store',
+                        choices=[fmdefs.FITS_BACKEND_ASTROPY, fmdefs.FITS_BACKEND_SCAN],
+                        help='how FITS headers are read for metadata (default %s)' %
+                        fmdefs.FITS_BACKEND_ASTROPY)
+    parser.add_argument('--no-config-cache', action='store_true', default=False,
+                        help='always read config from DB instead of local config cache')
+    parser.add_argument('--lazy-config', action='store_true', default=False,
+                        help='read definitions of only the filetypes used from DB')
     parser.add_argument('--version', action='store_true', default=False)
 
     args = vars(parser.parse_args(argv))   # convert to dict
@@ -351,6 +416,12 @@ def main(argv):
 
     # tell filemgmt class to get config from DB
     args['get_db_config'] = True
+    args['use_config_cache'] = not args['no_config_cache']
+    args['lazy_filetype_metadata'] = args['lazy_config']
+
+    # args are part of filemgmt config, don't hide a value set in wcl file
+    if args['fits_header_backend'] is None:
+        del args['fits_header_backend']
 
     # figure out which python class to use for filemgmt
     filemgmt_class = get_filemgmt_class(args)
@@ -392,17 +463,30 @@ def main(argv):
 \tfiles are treated as same file (no checking is done).
 \tBut when tracking file locations within archive,
 \tthey are tracked as 2 independent files.\n""")
+    journal = None
+    if args['journal'] is not None:
+        journal = regjournal.RegistrationJournal(args['journal'], archive, args['section'])
+
     try:
-        process_files(filelist, filemgmt, task_id, archive, do_commit)
+        if args['pipeline']:
+            totfilecnt = process_files_pipeline(filelist, filemgmt, task_id, archive,
+                                                do_commit, args['workers'], journal,
+                                                args['commit_every'])
+        else:
+            process_files(filelist, filemgmt, task_id, archive, do_commit, args['workers'],
+                          journal, args['commit_every'])
+            totfilecnt = sum([len(x) for x in list(filelist.values())])
         filemgmt.end_task(task_id, fmdefs.FM_EXIT_SUCCESS, do_commit)
         if not do_commit:
             print("Skipping commit")
     except:
         filemgmt.end_task(task_id, fmdefs.FM_EXIT_FAILURE, do_commit)
         raise
+    finally:
+        if journal is not None:
+            journal.close()
 
     endtime = time.time()
-    totfilecnt = sum([len(x) for x in list(filelist.values())])
     print("\n\nTotal time with %s files: %0.2f secs" % (totfilecnt, (endtime - starttime)))
 
 
@@ -5,6 +5,7 @@ import sys
 import time
 import despymisc.miscutils as miscutils
 import filemgmt.filemgmt_defs as fmdefs
+import filemgmt.dbpool as dbpool
 
 
 def get_config_vals(archive_info, config, keylist):
@@ -37,7 +38,7 @@ def archive_copy(src_archive_info, dst_archive_info, archive_transfer_info, file
     dstfilemgmt_class = miscutils.dynamically_load_class(dst_archive_info['filemgmt'])
 
     valDict = get_config_vals(dst_archive_info, config, dstfilemgmt_class.requested_config_vals())
-    dstfilemgmt = dstfilemgmt_class(config=valDict)
+    dstfilemgmt = dbpool.acquire(dstfilemgmt_class, valDict)
 
     if miscutils.fwdebug_check(0, "ARCHIVE_TRANSFER_UTILS_DEBUG"):
         miscutils.fwdebug_print("dst_archive = %s" % dst_archive)
@@ -59,11 +60,12 @@ def archive_copy(src_archive_info, dst_archive_info, archive_transfer_info, file
         # dynamically load filemgmt class for src
         srcfilemgmt_class = miscutils.dynamically_load_class(src_archive_info['filemgmt'])
         valDict = get_config_vals(src_archive_info, config, srcfilemgmt_class.requested_config_vals())
-        srcfilemgmt = srcfilemgmt_class(config=valDict)
+        srcfilemgmt = dbpool.acquire(srcfilemgmt_class, valDict)
 
         # get archive paths for files in home archive
         src_file_archive_info = srcfilemgmt.get_file_archive_info(
             files2stage, src_archive, fmdefs.FM_PREFER_COMPRESSED)
+        dbpool.release(srcfilemgmt)
         missing_files = set(files2stage) - set(src_file_archive_info.keys())
 
         if missing_files is not None and len(missing_files) > 0:
@@ -141,6 +143,8 @@ def archive_copy(src_archive_info, dst_archive_info, archive_transfer_info, file
         # if db, save staging info to DB
         # todo
 
+    dbpool.release(dstfilemgmt)
+
     if miscutils.fwdebug_check(3, "ARCHIVE_TRANSFER_UTILS_DEBUG"):
         miscutils.fwdebug_print("END\n\n")
 
@@ -160,7 +164,7 @@ def archive_copy_dir(src_archive_info, dst_archive_info, archive_transfer_info,
     dstfilemgmt_class = miscutils.dynamically_load_class(dst_archive_info['filemgmt'])
 
     valDict = get_config_vals(dst_archive_info, config, dstfilemgmt_class.requested_config_vals())
-    dstfilemgmt = dstfilemgmt_class(config=valDict)
+    dstfilemgmt = dbpool.acquire(dstfilemgmt_class, valDict)
 
     if miscutils.fwdebug_check(3, "ARCHIVE_TRANSFER_UTILS_DEBUG"):
         miscutils.fwdebug_print("dst_archive = %s" % dst_archive)
@@ -235,5 +239,7 @@ def archive_copy_dir(src_archive_info, dst_archive_info, archive_transfer_info,
         # if db, save staging info to DB
         # todo
 
+    dbpool.release(dstfilemgmt)
+
     if miscutils.fwdebug_check(3, "ARCHIVE_TRANSFER_UTILS_DEBUG"):
         miscutils.fwdebug_print("END\n\n")
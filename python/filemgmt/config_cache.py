@@ -0,0 +1,80 @@
+"""On-disk cache of filemgmt config read from the DB.
+
+Reading the archive, filetype metadata and file header definitions from
+the OPS_* tables (FileMgmtDB with get_db_config) takes seconds.  The
+values are saved in a pickle file per DB (des_services file and section)
+under $XDG_CACHE_HOME/filemgmt (default ~/.cache/filemgmt) together with
+a fingerprint of the tables (see FileMgmtDB.get_config_fingerprint).  The
+file is used while the fingerprint stays the same.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+import despymisc.miscutils as miscutils
+import filemgmt.filemgmt_defs as fmdefs
+
+# change when the format of the saved values or of the fingerprint changes
+CACHE_VERSION = 2
+
+
+def cache_dir():
+    """Return directory holding the config cache files.
+    """
+    base = os.environ.get('XDG_CACHE_HOME')
+    if base is None or len(base) == 0:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, fmdefs.FM_CONFIG_CACHE_SUBDIR)
+
+
+def cache_filename(desservices, section):
+    """Return name of config cache file for DB given by des_services file and section.
+    """
+    if desservices is not None:
+        desservices = os.path.realpath(os.path.expanduser(desservices))
+    dbkey = hashlib.sha1(("%s:%s" % (desservices, section)).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir(), "config_%s_%s.pickle" % (section, dbkey))
+
+
+def read_config(filename, fingerprint):
+    """Return cached config values if saved with the same fingerprint, else None.
+    """
+    try:
+        with open(filename, 'rb') as cachefh:
+            saved = pickle.load(cachefh)
+    except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as err:
+        if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+            miscutils.fwdebug_print("Can't read config cache %s: %s" % (filename, err))
+        return None
+
+    if not isinstance(saved, dict) or saved.get('version') != CACHE_VERSION or \
+       saved.get('fingerprint') != fingerprint:
+        if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+            miscutils.fwdebug_print("Config cache %s is stale" % filename)
+        return None
+    return saved['config']
+
+
+def write_config(filename, fingerprint, config):
+    """Save config values with fingerprint (replacing the file atomically).
+
+    Problems are only reported as the cache is optional.
+    """
+    tmpname = None
+    try:
+        dirname = os.path.dirname(filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname, 0o700)
+        (tmpfd, tmpname) = tempfile.mkstemp(dir=dirname, prefix='.tmp_config_')
+        with os.fdopen(tmpfd, 'wb') as cachefh:
+            pickle.dump({'version': CACHE_VERSION, 'fingerprint': fingerprint,
+                         'config': config}, cachefh, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpname, filename)
+        tmpname = None
+    except (IOError, OSError, TypeError, pickle.PicklingError) as err:
+        miscutils.fwdebug_print("WARN: Couldn't save config cache %s: %s" % (filename, err))
+    finally:
+        if tmpname is not None and os.path.exists(tmpname):
+            os.remove(tmpname)
@@ -2,24 +2,76 @@ import sys
 import os
 import time
 
+import despydmdb.dmdb_defs as dmdbdefs
+import filemgmt.filemgmt_db as fmdb
+
+
+def path_clause(dbh, column, relpath, recursive=True):
+    """Return (sql, binds) selecting rows whose column is relpath.
+
+    With recursive, rows in any directory under relpath match too.  The
+    prefix is compared as a string range (instead of like or a regex) so
+    an index on column can be used.  Bind names are path, path_dir and
+    path_end.
+
+    An empty relpath ('' or '/') is the archive root: recursive gives a
+    condition without binds matching every row, otherwise ValueError is
+    raised (an empty string would be bound as NULL and match nothing).
+    """
+    path = relpath.rstrip('/')
+    if path == '':
+        if recursive:
+            return '1=1', {}
+        raise ValueError("Empty path (%s) given for non-recursive match on %s" %
+                         (repr(relpath), column))
+    binds = {'path': path, 'path_dir': path + '/'}
+    if recursive:
+        # '0' is the character after '/', so the range is everything under path/
+        binds['path_end'] = path + '0'
+        sql = "(%s = %s or (%s >= %s and %s < %s))" % \
+              (column, dbh.get_named_bind_string('path'),
+               column, dbh.get_named_bind_string('path_dir'),
+               column, dbh.get_named_bind_string('path_end'))
+    else:
+        # paths can be stored with trailing /
+        sql = "%s in (%s, %s)" % (column, dbh.get_named_bind_string('path'),
+                                  dbh.get_named_bind_string('path_dir'))
+    return sql, binds
+
 
 def check_db_duplicates(dbh, filelist, archive):  #including compression
-    table = dbh.load_filename_gtt(filelist)
-    sql = "select fai.path, art.filename, art.compression,art.id, art.md5sum, art.filesize from desfile art, file_archive_info fai, %s gtt where fai.desfile_id=art.id and fai.archive_name='%s' and gtt.filename=art.filename and coalesce(fai.compression,'x') = coalesce(gtt.compression,'x')" % (
-        table, archive)
+    # FileMgmtDB shares the filename GTT with an active file set
+    if isinstance(dbh, fmdb.FileMgmtDB):
+        table = dbh.acquire_filename_gtt(filelist)
+    else:
+        dbh.empty_gtt(dmdbdefs.DB_GTT_FILENAME)
+        table = dbh.load_filename_gtt(filelist)
+    sql = "select fai.path, art.filename, art.compression,art.id, art.md5sum, art.filesize from desfile art, file_archive_info fai, %s gtt where fai.desfile_id=art.id and fai.archive_name=%s and gtt.filename=art.filename and coalesce(fai.compression,'x') = coalesce(gtt.compression,'x')" % (
+        table, dbh.get_named_bind_string('archive_name'))
 
     curs = dbh.cursor()
-    curs.execute(sql)
-    results = curs.fetchall()
+    curs.execute(sql, {'archive_name': archive})
+    desc = [d[0].lower() for d in curs.description]
+    # GTT may hold more files (file set)
+    wanted = set([fmdb.filename_gtt_key(fname) for fname in filelist])
+    results = []
+    for row in curs:
+        fdict = dict(list(zip(desc, row)))
+        if (fdict['filename'], fdict['compression']) in wanted:
+            results.append(fdict)
+    curs.close()
+    if isinstance(dbh, fmdb.FileMgmtDB):
+        dbh.release_filename_gtt(table)
+    else:
+        dbh.empty_gtt(table)
 
-    if len(results) == len(filelist):
+    # no file has more than one row
+    if len(results) == len(set([(fdict['filename'], fdict['compression']) for fdict in results])):
         return {}
     duplicates = {}
     templist = []
-    desc = [d[0].lower() for d in curs.description]
 
-    for row in results:
-        fdict = dict(list(zip(desc, row)))
+    for fdict in results:
         fname = fdict['filename']
         if fdict['compression'] is not None:
             fname += fdict['compression']
@@ -185,33 +237,39 @@ def get_files_from_db(dbh, relpath, archive, pfwid, filetype=None, debug=False,
     if debug:
         print("Getting file information from db: BEG")
 
+    cols = "select fai.path, art.filename, art.compression, art.id, art.md5sum, art.filesize from desfile art, file_archive_info fai where fai.desfile_id=art.id and fai.archive_name=%s" % \
+           dbh.get_named_bind_string('archive_name')
+    params = {'archive_name': archive}
     if filetype is not None:
-        sql = "select fai.path, art.filename, art.compression, art.id, art.md5sum, art.filesize from desfile art, file_archive_info fai where art.pfw_attempt_id=%i and fai.desfile_id=art.id and art.filetype='%s' and fai.archive_name='%s'" % (
-            pfwid, filetype, archive)
+        sql = cols + " and art.pfw_attempt_id=%s and art.filetype=%s" % \
+              (dbh.get_named_bind_string('pfwid'), dbh.get_named_bind_string('filetype'))
+        params.update({'pfwid': pfwid, 'filetype': filetype})
     else:
         if pfwid is not None:
             if quick:
-                sql = "select fai.path, art.filename, art.compression,art.id, art.md5sum, art.filesize from desfile art, file_archive_info fai where art.pfw_attempt_id=%i and fai.desfile_id=art.id and fai.archive_name='%s'" % (
-                    pfwid, archive)
-
+                sql = cols + " and art.pfw_attempt_id=%s" % dbh.get_named_bind_string('pfwid')
+                params['pfwid'] = pfwid
             else:
                 # when remove filesize from fai, need to change NVL(art.filesize,fai.filesize) as filesize to art.filesize
-                sql = "select fai.path, art.filename, art.compression,art.id, art.md5sum, art.filesize from desfile art, file_archive_info fai where (art.pfw_attempt_id=%i or fai.path like '%s%%') and fai.desfile_id=art.id and fai.archive_name='%s'" % (
-                    pfwid, relpath, archive)
+                (pathsql, pathbinds) = path_clause(dbh, 'fai.path', relpath)
+                sql = cols + " and (art.pfw_attempt_id=%s or %s)" % \
+                      (dbh.get_named_bind_string('pfwid'), pathsql)
+                params['pfwid'] = pfwid
+                params.update(pathbinds)
         else:
             if quick:
-                sql = "select fai.path, art.filename, art.compression,art.id, art.md5sum, art.filesize from desfile art, file_archive_info fai where fai.desfile_id=art.id and fai.archive_name='%s'" % (
-                    archive)
-
+                sql = cols
             else:
-                sql = "select fai.path, art.filename, art.compression,art.id, art.md5sum, art.filesize from desfile art, file_archive_info fai where fai.desfile_id=art.id and fai.archive_name='%s' and fai.path like '%s%%'" % (
-                    archive, relpath)
+                (pathsql, pathbinds) = path_clause(dbh, 'fai.path', relpath)
+                sql = cols + " and " + pathsql
+                params.update(pathbinds)
 
     if debug:
         print("\nsql = %s\n" % sql)
+        print("params = %s\n" % params)
 
     curs = dbh.cursor()
-    curs.execute(sql)
+    curs.execute(sql, params)
     if debug:
         print("executed")
     desc = [d[0].lower() for d in curs.description]
@@ -0,0 +1,207 @@
+"""Process-wide pool of DB handles (FileMgmtDB, TransferStatsDB, ...).
+
+Creating one of these classes opens a new DB connection (and can read
+config from the DB), which can take seconds.  Code that needs one per
+call (e.g., archive_transfer_utils.archive_copy) gets it from the pool
+instead:
+
+    filemgmt = dbpool.acquire(filemgmt_class, config)
+    ...
+    dbpool.release(filemgmt)
+
+Handles are pooled by (class, des_services, section).  Only classes with a
+refresh_config(config) method are pooled, it is called with the new config
+values when a handle is reused.  Other classes are just created.
+"""
+
+import os
+import threading
+import time
+
+import despymisc.miscutils as miscutils
+import filemgmt.filemgmt_defs as fmdefs
+
+
+def pool_key(cls, config):
+    """Return key of handles of cls that can be used for given config.
+    """
+    desservices = None
+    section = None
+    if config is not None:
+        desservices = config.get('des_services')
+        section = config.get('des_db_section', config.get('section'))
+    return (cls, desservices, section)
+
+
+def is_healthy(dbh):
+    """Whether handle's connection still works.
+    """
+    try:
+        curs = dbh.cursor()
+        curs.execute("select 1 %s" % dbh.from_dual())
+        curs.fetchall()
+        curs.close()
+    except Exception as err:
+        if miscutils.fwdebug_check(3, 'DBPOOL_DEBUG'):
+            miscutils.fwdebug_print("Dropping handle with failed health check: %s" % err)
+        return False
+    return True
+
+
+def close_handle(dbh):
+    """Close handle's connection ignoring errors.
+    """
+    try:
+        dbh.close()
+    except Exception:
+        pass
+
+
+class DBPool(object):
+    """Idle DB handles by pool key.
+
+    Handles idle longer than max_idle_time seconds are closed, at most
+    max_idle handles per key are kept.
+    """
+
+    def __init__(self, max_idle_time=None, max_idle=None):
+        if max_idle_time is None:
+            max_idle_time = fmdefs.FM_DBPOOL_MAX_IDLE_TIME
+        if max_idle is None:
+            max_idle = fmdefs.FM_DBPOOL_MAX_IDLE
+        self.max_idle_time = max_idle_time
+        self.max_idle = max_idle
+        self.idle = {}      # key -> list of (handle, time released)
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.created = 0
+        self.reused = 0
+
+    def _check_process(self):
+        """Forget handles of parent process (caller holds lock).
+        """
+        if self.pid != os.getpid():
+            # connections belong to parent, don't close them
+            self.idle = {}
+            self.pid = os.getpid()
+
+    def _evict(self, now):
+        """Return handles idle too long, removing them from pool (caller holds lock).
+        """
+        expired = []
+        for key in list(self.idle.keys()):
+            keep = []
+            for (dbh, since) in self.idle[key]:
+                if now - since > self.max_idle_time:
+                    expired.append(dbh)
+                else:
+                    keep.append((dbh, since))
+            if len(keep) > 0:
+                self.idle[key] = keep
+            else:
+                del self.idle[key]
+        return expired
+
+    def acquire(self, cls, config):
+        """Return handle of class cls for config, reusing an idle one if possible.
+        """
+        if not hasattr(cls, 'refresh_config'):
+            return cls(config)
+
+        key = pool_key(cls, config)
+        dbh = None
+        while True:
+            with self.lock:
+                self._check_process()
+                expired = self._evict(time.time())
+                candidate = None
+                if key in self.idle:
+                    (candidate, _) = self.idle[key].pop()
+                    if len(self.idle[key]) == 0:
+                        del self.idle[key]
+            for old in expired:
+                close_handle(old)
+
+            if candidate is None:
+                break
+            if is_healthy(candidate):
+                dbh = candidate
+                break
+            close_handle(candidate)
+
+        if dbh is None:
+            if miscutils.fwdebug_check(3, 'DBPOOL_DEBUG'):
+                miscutils.fwdebug_print("Creating new %s handle" % cls.__name__)
+            dbh = cls(config)
+            dbh.pool_key = key
+            self.created += 1
+        else:
+            if miscutils.fwdebug_check(3, 'DBPOOL_DEBUG'):
+                miscutils.fwdebug_print("Reusing %s handle" % cls.__name__)
+            dbh.refresh_config(config)
+            self.reused += 1
+        return dbh
+
+    def release(self, dbh):
+        """Give handle back to pool, rolling back any uncommitted work.
+        """
+        key = getattr(dbh, 'pool_key', None)
+        if key is None:
+            return
+
+        try:
+            dbh.rollback()
+        except Exception as err:
+            if miscutils.fwdebug_check(3, 'DBPOOL_DEBUG'):
+                miscutils.fwdebug_print("Dropping handle that failed rollback: %s" % err)
+            close_handle(dbh)
+            return
+
+        with self.lock:
+            self._check_process()
+            expired = self._evict(time.time())
+            handles = self.idle.setdefault(key, [])
+            if len(handles) < self.max_idle:
+                handles.append((dbh, time.time()))
+            else:
+                expired.append(dbh)
+        for old in expired:
+            close_handle(old)
+
+    def close_all(self):
+        """Close all idle handles.
+        """
+        with self.lock:
+            self._check_process()
+            handles = [dbh for idle in self.idle.values() for (dbh, _) in idle]
+            self.idle = {}
+        for dbh in handles:
+            close_handle(dbh)
+
+    def stats(self):
+        """Return dict of handles created, reused and currently idle.
+        """
+        with self.lock:
+            return {'created': self.created, 'reused': self.reused,
+                    'idle': sum([len(idle) for idle in self.idle.values()])}
+
+
+_POOL = DBPool()
+
+
+def acquire(cls, config):
+    """Return handle of class cls for config from the process-wide pool.
+    """
+    return _POOL.acquire(cls, config)
+
+
+def release(dbh):
+    """Give handle back to the process-wide pool.
+    """
+    _POOL.release(dbh)
+
+
+def close_all():
+    """Close all idle handles in the process-wide pool.
+    """
+    _POOL.close_all()
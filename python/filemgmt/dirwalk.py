@@ -0,0 +1,95 @@
+"""Walk directory trees reading several directories at the same time.
+
+Directories are listed with os.scandir in a pool of threads, ahead of
+the caller needing them.  Results are still returned in a stable order:
+top-down and depth first like os.walk, with the entries of each
+directory sorted by name.
+"""
+
+import os
+import concurrent.futures
+
+import despymisc.miscutils as miscutils
+import filemgmt.filemgmt_defs as fmdefs
+
+
+def scan_dir(path, stat_files=False):
+    """List a directory returning (subdirs, files) as sorted lists of DirEntry.
+
+    Like os.walk, symlinks to directories count as directories.  With
+    stat_files, each file's stat is done (and cached in its DirEntry) here.
+    """
+    dirs = []
+    files = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                isdir = entry.is_dir()
+            except OSError:
+                isdir = False
+            if isdir:
+                dirs.append(entry)
+            else:
+                if stat_files:
+                    try:
+                        entry.stat()
+                    except OSError:
+                        pass    # e.g., broken link, caller finds out when it stats
+                files.append(entry)
+    dirs.sort(key=lambda entry: entry.name)
+    files.sort(key=lambda entry: entry.name)
+    return dirs, files
+
+
+def walk(top, followlinks=False, stat_files=False, num_threads=None, prefetch=None):
+    """Generator yielding (dirpath, subdirs, files) for every directory under top.
+
+    subdirs and files are lists of DirEntry.   Up to prefetch of the
+    directories walked next are listed by num_threads threads while the
+    caller works on the current one.  Like os.walk, directories which
+    can't be listed are skipped and symlinks to directories are only
+    followed if followlinks.
+    """
+    if num_threads is None:
+        num_threads = fmdefs.FM_WALK_THREADS
+    if prefetch is None:
+        prefetch = num_threads * 4
+
+    with concurrent.futures.ThreadPoolExecutor(num_threads) as pool:
+        # [path, future listing path or None]; last is walked next
+        stack = [[top, pool.submit(scan_dir, top, stat_files)]]
+        try:
+            while stack:
+                (dirpath, future) = stack.pop()
+                if future is None:
+                    future = pool.submit(scan_dir, dirpath, stat_files)
+
+                try:
+                    (dirs, files) = future.result()
+                except OSError as err:
+                    if miscutils.fwdebug_check(1, 'DIRWALK_DEBUG'):
+                        miscutils.fwdebug_print("Skipping directory %s: %s" % (dirpath, err))
+                    continue
+
+                yield dirpath, dirs, files
+
+                for entry in reversed(dirs):
+                    if followlinks or not entry.is_symlink():
+                        stack.append([entry.path, None])
+
+                # start listing the directories that will be walked next
+                for node in stack[-prefetch:]:
+                    if node[1] is None:
+                        node[1] = pool.submit(scan_dir, node[0], stat_files)
+        finally:
+            for node in stack:
+                if node[1] is not None:
+                    node[1].cancel()
+
+
+def walk_files(top, followlinks=False, stat_files=False, num_threads=None, prefetch=None):
+    """Generator yielding DirEntry of every non-directory under top (see walk).
+    """
+    for (_, _, files) in walk(top, followlinks, stat_files, num_threads, prefetch):
+        for entry in files:
+            yield entry
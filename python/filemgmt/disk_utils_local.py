@@ -10,6 +10,7 @@ import time
 import copy
 
 import despymisc.miscutils as miscutils
+import filemgmt.dirwalk as dirwalk
 
 
 def get_md5sum_file(fullname, blksize=2**15):
@@ -33,7 +34,11 @@ def get_file_disk_info(arg):
         miscutils.fwdie("Error:  argument to get_file_disk_info isn't a list or a path (%s)" % type(arg), 1)
 
 
-def get_single_file_disk_info(fname, save_md5sum=False, archive_root=None):
+def get_single_file_disk_info(fname, save_md5sum=False, archive_root=None, filesize=None):
+    """Returns information about a single file on disk.
+
+    filesize can be given if already known (e.g., from a DirEntry's stat).
+    """
     if miscutils.fwdebug_check(3, "DISK_UTILS_LOCAL_DEBUG"):
         miscutils.fwdebug_print("fname=%s, save_md5sum=%s, archive_root=%s" %
                                 (fname, save_md5sum, archive_root))
@@ -44,11 +49,14 @@ def get_single_file_disk_info(fname, save_md5sum=False, archive_root=None):
     if miscutils.fwdebug_check(3, "DISK_UTILS_LOCAL_DEBUG"):
         miscutils.fwdebug_print("path=%s, filename=%s, compress=%s" % (path, filename, compress))
 
+    if filesize is None:
+        filesize = os.path.getsize(fname)
+
     fdict = {
         'filename': filename,
         'compression': compress,
         'path': path,
-        'filesize': os.path.getsize(fname)
+        'filesize': filesize
     }
 
     if save_md5sum:
@@ -89,10 +97,11 @@ def get_file_disk_info_path(path, save_md5sum=False):
         miscutils.fwdie("Error:  path does not exist (%s)" % (path), 1)
 
     fileinfo = {}
-    for (dirpath, dirnames, filenames) in os.walk(path):
-        for name in filenames:
-            fname = os.path.join(dirpath, name)
-            fileinfo[fname] = get_single_file_disk_info(fname, save_md5sum)
+    for (dirpath, _, files) in dirwalk.walk(path, stat_files=True):
+        for entry in files:
+            fname = os.path.join(dirpath, entry.name)
+            fileinfo[fname] = get_single_file_disk_info(fname, save_md5sum,
+                                                        filesize=entry.stat().st_size)
 
     return fileinfo
 
@@ -195,10 +204,13 @@ def get_files_from_disk(relpath, archive_root, check_md5sum=False, debug=False):
 
     files_from_disk = {}
     duplicates = {}
-    for (dirpath, dirnames, filenames) in os.walk(os.path.join(archive_root, relpath)):
-        for filename in filenames:
+    for (dirpath, _, files) in dirwalk.walk(os.path.join(archive_root, relpath),
+                                            stat_files=True):
+        for entry in files:
+            filename = entry.name
             fullname = '%s/%s' % (dirpath, filename)
-            data = get_single_file_disk_info(fullname, check_md5sum, archive_root)
+            data = get_single_file_disk_info(fullname, check_md5sum, archive_root,
+                                             entry.stat().st_size)
             if filename in files_from_disk:
                 if filename not in duplicates:
                     duplicates[filename] = [copy.deepcopy(files_from_disk[filename])]
@@ -7,17 +7,222 @@
 import os
 import re
 import sys
+import itertools
+import collections
+import concurrent.futures
+import multiprocessing
 from collections import OrderedDict
 
 from intgutils.wcl import WCL
 import despydmdb.desdmdbi as desdmdbi
+import despydmdb.dmdb_defs as dmdbdefs
 import despymisc.miscutils as miscutils
 import filemgmt.disk_utils_local as diskutils
+import filemgmt.db_utils_local as dbutils
+import filemgmt.config_cache as configcache
+import filemgmt.header_cache as headercache
+import filemgmt.lazy_mapping as lazymapping
+import filemgmt.location_cache as locationcache
 import despymisc.provdefs as provdefs
 import filemgmt.filemgmt_defs as fmdefs
 import traceback
 
 
+# filetype mgmt object used by metadata worker processes (see gather_file_data)
+_WORKER_FTMGMT = None
+
+
+def _init_metadata_worker(ftmgmt):
+    """Save the filetype mgmt object once per metadata worker process.
+    """
+    global _WORKER_FTMGMT
+    _WORKER_FTMGMT = ftmgmt
+
+
+def _worker_cache_put(headers):
+    """Put headers from the parent's header cache into the worker's.
+    """
+    if headers is not None and _WORKER_FTMGMT.header_cache is not None:
+        _WORKER_FTMGMT.header_cache.put(headers)
+
+
+def _worker_cache_pop(fullname, given):
+    """Remove file's headers from the worker's header cache.
+
+    Returns them for the parent to cache if the filetype reuses them and
+    the parent doesn't already have them (else None).
+    """
+    if _WORKER_FTMGMT.header_cache is None:
+        return None
+    headers = _WORKER_FTMGMT.header_cache.pop(fullname)
+    if given or not _WORKER_FTMGMT.reuses_headers():
+        headers = None
+    return headers
+
+
+def _worker_metadata_tasks(fullname, do_update, update_info, headers=None):
+    """Read metadata for a single file inside a metadata worker process.
+
+    headers are the file's headers from the parent's header cache (or None).
+    Returns (metadata, headers to cache or None).
+    """
+    _worker_cache_put(headers)
+    metadata = _WORKER_FTMGMT.perform_metadata_tasks(fullname, do_update, update_info)
+    return metadata, _worker_cache_pop(fullname, headers is not None)
+
+
+def _worker_metadata_disk_info(fullname, do_update, update_info, headers=None):
+    """Read metadata and disk info (incl md5sum) inside a worker process.
+
+    Returns (metadata, fileinfo, headers to cache or None).
+    """
+    _worker_cache_put(headers)
+    metadata, fileinfo = _read_file_data(_WORKER_FTMGMT, fullname, do_update, update_info)
+    return metadata, fileinfo, _worker_cache_pop(fullname, headers is not None)
+
+
+def _read_file_data(ftmgmt, fullname, do_update, update_info):
+    """Read metadata and disk info (incl md5sum) for a single file.
+
+    The md5sum comes from reading the metadata if the filetype can do it
+    in the same pass, else the file is read again (after any update).
+    """
+    metadata, md5sum = ftmgmt.perform_metadata_tasks_md5(fullname, do_update, update_info)
+    fileinfo = diskutils.get_single_file_disk_info(fullname, save_md5sum=(md5sum is None),
+                                                   archive_root=None)
+    if md5sum is not None:
+        fileinfo['md5sum'] = md5sum
+    return metadata, fileinfo
+
+
+def filename_gtt_key(onefile):
+    """Return (filename, compression) a file has in the filename GTT.
+
+    onefile is a fullname/filename or a dict with fullname or filename
+    and compression (as accepted by load_filename_gtt).
+    """
+    if isinstance(onefile, dict):
+        if 'filename' in onefile and 'compression' in onefile:
+            return (onefile['filename'], onefile['compression'])
+        onefile = onefile['fullname']
+    return miscutils.parse_fullname(onefile, miscutils.CU_PARSE_FILENAME |
+                                    miscutils.CU_PARSE_COMPRESSION)
+
+
+class FileSet(object):
+    """Files loaded into the filename GTT once for several queries.
+
+    Use as a context manager (see FileMgmtDB.file_set).  While active,
+    FileMgmtDB and filetype mgmt queries about any of its files use the
+    loaded GTT (see acquire_filename_gtt) instead of loading their own
+    list.  The GTT is emptied at exit.
+    """
+
+    def __init__(self, dbh, filelist):
+        self.dbh = dbh
+        self.filelist = list(filelist)
+        self.keys = set([filename_gtt_key(onefile) for onefile in self.filelist])
+        self.filenames = set([key[0] for key in self.keys])
+        self.gtt_name = None    # GTT holding the files, None if not (or no longer) loaded
+        self.committed = False  # whether the load has been committed
+        self.previous = None    # file set active before this one
+
+    def __len__(self):
+        return len(self.filelist)
+
+    def covers(self, filelist, with_compression=True):
+        """Whether all given files are in the set.
+
+        Without with_compression, only the filenames are compared.
+        """
+        if with_compression:
+            return all(filename_gtt_key(onefile) in self.keys for onefile in filelist)
+        return all(filename_gtt_key(onefile)[0] in self.filenames for onefile in filelist)
+
+    def enclosing(self):
+        """Yield this set and the sets active before it (innermost first).
+        """
+        fset = self
+        while fset is not None:
+            yield fset
+            fset = fset.previous
+
+    def __enter__(self):
+        self.previous = self.dbh.active_file_set
+        self.dbh.active_file_set = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        self.dbh.active_file_set = self.previous
+        if self.gtt_name is not None:
+            self.dbh.empty_gtt(self.gtt_name)
+            self.gtt_name = None
+        return False
+
+
+class ArchiveFileInfo(object):
+    """Location in an archive and DESFILE info of a single file.
+
+    Compact (slotted) record used instead of a dict per row when reading
+    many files' archive info (see FileMgmtDB.get_file_archive_records).
+    """
+
+    __slots__ = ('filetype', 'path', 'filename', 'compression', 'filesize', 'md5sum')
+
+    # order of columns in query results and of keys in as_dict
+    COLUMNS = ['filetype', 'path', 'filename', 'compression', 'filesize', 'md5sum']
+
+    def __init__(self, filetype, path, filename, compression, filesize, md5sum):
+        self.filetype = filetype
+        self.path = path
+        self.filename = filename
+        self.compression = compression
+        self.filesize = filesize
+        self.md5sum = md5sum
+
+    @property
+    def rel_filename(self):
+        """Path of file relative to archive root (incl compression extension).
+        """
+        if self.compression is None:
+            return "%s/%s" % (self.path, self.filename)
+        return "%s/%s%s" % (self.path, self.filename, self.compression)
+
+    def as_dict(self):
+        """Return info as dict (as returned by get_file_archive_info).
+        """
+        info = dict([(col, getattr(self, col)) for col in self.COLUMNS])
+        info['rel_filename'] = self.rel_filename
+        return info
+
+
+class IngestPlan(object):
+    """What FileMgmtDB needs to ingest metadata for one filetype.
+
+    Built once per filetype and metadata table from filetype_metadata and
+    the metadata table's column types (see FileMgmtDB.get_ingest_plan).
+    """
+
+    def __init__(self, filetype, ftdict, required, optional, column_map, column_types):
+        self.filetype = filetype
+        self.source = ftdict        # used to notice that config was replaced
+        self.metadata_table = ftdict['metadata_table']
+        self.required = required
+        self.optional = optional
+        self.column_map = column_map
+
+        # (column, header, position in comma-separated value or None, type conversion)
+        self.steps = []
+        for column, header in column_map.items():
+            compheader = header.split(':')
+            if len(compheader) > 1:
+                self.steps.append((column, compheader[0], int(compheader[1]),
+                                   column_types.get(column)))
+            else:
+                self.steps.append((column, header, None, column_types.get(column)))
+        self.headers = set([step[1] for step in self.steps])
+
+
 class FileMgmtDB(desdmdbi.DesDmDbi):
     """Extend core DM db class with functionality for managing files.
     """
@@ -50,11 +255,20 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
             miscutils.fwdie(("Error: problem connecting to database: %s\n"
                              "\tCheck desservices file and environment variables") % err, 1)
 
+        self.filetype = None
+        self.ftmgmt = None
+        self.filepat = None
+        self.ftmgmt_registry = OrderedDict()   # (filetype, filepat, class name) -> object
+
         # precedence - db, file, params
         self.config = WCL()
+        self.ingest_plans = {}
 
         if miscutils.checkTrue('get_db_config', initvals, False):
-            self._get_config_from_db()
+            if miscutils.checkTrue('lazy_filetype_metadata', initvals, False):
+                self._get_lazy_config_from_db()
+            else:
+                self._get_config_from_db(miscutils.checkTrue('use_config_cache', initvals, True))
 
         if 'wclfile' in initvals and initvals['wclfile'] is not None:
             fileconfig = WCL()
@@ -66,18 +280,284 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
             self.config.update(fullconfig)
         self.config.update(initvals)
 
-        self.filetype = None
-        self.ftmgmt = None
-        self.filepat = None
+        # headers read from files, shared by the filetype mgmt objects
+        self.header_cache = headercache.HeaderCache(
+            int(self.config.get('header_cache_size', fmdefs.FM_HEADER_CACHE_SIZE)))
+
+        # archive locations of files (see get_file_archive_records)
+        self.location_cache = None
+        cachesize = int(self.config.get('location_cache_size', fmdefs.FM_LOCATION_CACHE_SIZE))
+        if cachesize > 0:
+            self.location_cache = locationcache.LocationCache(
+                cachesize, int(self.config.get('location_cache_ttl', fmdefs.FM_LOCATION_CACHE_TTL)))
+
+        self.active_file_set = None   # see file_set
+        self.desfile_ids = OrderedDict()   # (filename, compression) -> DESFILE id, see get_desfile_ids
+        self.desfile_ids_written = set()   # keys of DESFILE rows inserted since last commit
+
+    def refresh_config(self, initvals):
+        """Apply new config values when reusing this object (see dbpool).
+
+        Config read from the DB or wclfile when created is kept.
+        """
+        # callers usually pass back the same definitions (get_config_vals)
+        changed = False
+        for key in [fmdefs.FILETYPE_METADATA, fmdefs.FILE_HEADER_INFO]:
+            if key in initvals and initvals[key] is not self.config.get(key):
+                changed = True
+        self.config.update(initvals)
+        if changed:
+            self.clear_ingest_plans()
+            self.invalidate_ftmgmt()
+
+    def file_set(self, filelist):
+        """Return FileSet loading given files into the filename GTT once.
 
-    def _get_config_from_db(self):
+            with filemgmt.file_set(fullnames):
+                filemgmt.has_metadata_ingested(ftype, fullnames)
+                filemgmt.is_file_in_archive(fullnames, archive_name)
+                ...
+        """
+        return FileSet(self, filelist)
+
+    def acquire_filename_gtt(self, filelist, with_compression=True):
+        """Return name of filename GTT loaded with (at least) the given files.
+
+        If the active file set has all the files, its GTT is used (loaded
+        the first time), so query results must be limited to the given
+        files.  Without with_compression, only the filenames need to be in
+        the GTT.  Call release_filename_gtt when done with the GTT.
+        """
+        fset = self.active_file_set
+        if fset is not None and fset.covers(filelist, with_compression):
+            if fset.gtt_name is None:
+                self._drop_file_set_gtts()
+                self.empty_gtt(dmdbdefs.DB_GTT_FILENAME)
+                fset.gtt_name = self.load_filename_gtt(fset.filelist)
+                fset.committed = False
+                if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+                    miscutils.fwdebug_print("Loaded file set of %s files into %s" %
+                                            (len(fset), fset.gtt_name))
+            return fset.gtt_name
+
+        self._drop_file_set_gtts()
+        self.empty_gtt(dmdbdefs.DB_GTT_FILENAME)
+        return self.load_filename_gtt(filelist)
+
+    def _drop_file_set_gtts(self):
+        """Forget the active and enclosing file sets' GTT (it is being reloaded).
+        """
+        if self.active_file_set is not None:
+            for fset in self.active_file_set.enclosing():
+                fset.gtt_name = None
+
+    def release_filename_gtt(self, gtt_name):
+        """Empty the filename GTT unless it holds the active file set.
+        """
+        fset = self.active_file_set
+        if fset is None or fset.gtt_name != gtt_name:
+            self.empty_gtt(gtt_name)
+
+    def commit(self):
+        """Commit transaction (a loaded file set stays in the GTT).
+        """
+        desdmdbi.DesDmDbi.commit(self)
+        if self.active_file_set is not None:
+            for fset in self.active_file_set.enclosing():
+                if fset.gtt_name is not None:
+                    fset.committed = True
+        if self.location_cache is not None:
+            self.location_cache.commit()
+        self.desfile_ids_written.clear()
+
+    def rollback(self):
+        """Rollback transaction (an uncommitted file set load is lost).
+        """
+        desdmdbi.DesDmDbi.rollback(self)
+        if self.active_file_set is not None:
+            for fset in self.active_file_set.enclosing():
+                if not fset.committed:
+                    fset.gtt_name = None
+        if self.location_cache is not None:
+            # locations of files registered or deleted in this transaction
+            self.location_cache.rollback()
+        # ids of rows inserted in this transaction are gone
+        self.forget_desfile_ids(self.desfile_ids_written)
+        self.desfile_ids_written.clear()
+
+    def invalidate_file_location(self, filenames, arname=None):
+        """Remove files from the location cache (e.g., after moving or deleting them).
+
+        If arname is None, the files are removed for every archive.
+        """
+        if self.location_cache is not None:
+            self.location_cache.invalidate(filenames, arname)
+
+    def _mark_locations_written(self, filenames, arname=None):
+        """Remove files written in current transaction from location cache until commit.
+        """
+        if self.location_cache is not None:
+            self.location_cache.mark_written(filenames, arname)
+
+    def location_cache_stats(self):
+        """Return dict of location cache hits, misses and size (None if no cache).
+        """
+        if self.location_cache is None:
+            return None
+        return self.location_cache.stats()
+
+    def get_config_fingerprint(self):
+        """Return cheap summary of the config tables that changes when they do.
+
+        Row count of each table and, on Oracle, its highest ora_rowscn.
+        """
+        if self.type == 'oracle':
+            colstr = "count(*), max(ora_rowscn)"
+        else:
+            colstr = "count(*), 0"
+        sql = " union all ".join(["select '%s', %s from %s" % (table, colstr, table)
+                                  for table in fmdefs.FM_CONFIG_TABLES])
+        curs = self.cursor()
+        curs.execute(sql)
+        fingerprint = tuple(sorted([tuple(row) for row in curs]))
+        curs.close()
+        return fingerprint
+
+    def _get_config_from_db(self, use_cache=True):
         """Reads some configuration values from the database.
+
+        With use_cache, the values are read from the on-disk config cache
+        while the config tables haven't changed (see config_cache).
+        """
+        self.config = WCL()
+        self.clear_ingest_plans()
+        self.invalidate_ftmgmt()
+
+        cachename = None
+        fingerprint = None
+        dbconfig = None
+        if use_cache:
+            try:
+                fingerprint = self.get_config_fingerprint()
+                cachename = configcache.cache_filename(self.desservices, self.section)
+                dbconfig = configcache.read_config(cachename, fingerprint)
+            except Exception as err:
+                miscutils.fwdebug_print("WARN: Not using config cache: %s" % err)
+                desdmdbi.DesDmDbi.rollback(self)
+                cachename = None
+
+        if dbconfig is None:
+            dbconfig = {'archive': self.get_archive_info(),
+                        'filetype_metadata': self.get_all_filetype_metadata(),
+                        fmdefs.FILE_HEADER_INFO: self.query_results_dict(
+                            'select * from OPS_FILE_HEADER', 'name')}
+            if cachename is not None:
+                configcache.write_config(cachename, fingerprint, dbconfig)
+        elif miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+            miscutils.fwdebug_print("Using config cache %s" % cachename)
+
+        for key, val in dbconfig.items():
+            self.config[key] = val
+
+    def _get_lazy_config_from_db(self):
+        """Reads archive config from the database, the other values as used.
+
+        filetype_metadata and file_header are LazyMappings reading a
+        filetype's definition (and the file headers it uses) the first time
+        the filetype is used.
         """
         self.config = WCL()
+        self.clear_ingest_plans()
+        self.invalidate_ftmgmt()
         self.config['archive'] = self.get_archive_info()
-        self.config['filetype_metadata'] = self.get_all_filetype_metadata()
-        self.config[fmdefs.FILE_HEADER_INFO] = self.query_results_dict(
-            'select * from OPS_FILE_HEADER', 'name')
+        self.config[fmdefs.FILE_HEADER_INFO] = lazymapping.LazyMapping(
+            self.get_file_header_info,
+            lambda: self.query_results_dict('select * from OPS_FILE_HEADER', 'name'))
+        self.config[fmdefs.FILETYPE_METADATA] = lazymapping.LazyMapping(
+            self.get_filetype_metadata, self.get_all_filetype_metadata)
+
+    def get_filetype_metadata(self, filetype):
+        """Return metadata definition of a single filetype (None if unknown).
+
+        Same structure as the filetype's entry in get_all_filetype_metadata
+        (no hdus if the filetype has no metadata definitions).  If config file_header is a LazyMapping, the filetype's file header
+        definitions are read too.
+        """
+        if filetype != filetype.lower():
+            return None   # filetypes are lower case in config
+
+        sql = """select f.metadata_table, f.filetype_mgmt,
+                        coalesce(fm.file_hdu, 'primary'), fm.status, fm.derived,
+                        fm.file_header_name, m.column_name
+                 from OPS_METADATA m, OPS_FILETYPE f, OPS_FILETYPE_METADATA fm
+                 where lower(f.filetype)=%s and fm.filetype=f.filetype and
+                       m.file_header_name=fm.file_header_name and
+                       m.table_name=f.metadata_table
+                 order by 3, 4, 5, 6, m.position""" % self.get_named_bind_string('filetype')
+        curs = self.cursor()
+        curs.execute(sql, {'filetype': filetype})
+        ftdict = None
+        for (table, mgmt, hdu, status, derived, header, column) in curs:
+            if ftdict is None:
+                ftdict = OrderedDict()
+                ftdict['filetype_mgmt'] = mgmt
+                ftdict['metadata_table'] = table.lower()
+                ftdict['hdus'] = OrderedDict()
+            hdudict = ftdict['hdus'].setdefault(hdu.lower(), OrderedDict())
+            statdict = hdudict.setdefault(status.lower(), OrderedDict())
+            catdict = statdict.setdefault(derived.lower(), OrderedDict())
+            if header.lower() in catdict:
+                catdict[header.lower()] += ',' + column.lower()
+            else:
+                catdict[header.lower()] = column.lower()
+
+        if ftdict is None:
+            # filetypes without metadata definitions are valid too
+            sql = """select metadata_table, filetype_mgmt from OPS_FILETYPE
+                     where lower(filetype)=%s""" % self.get_named_bind_string('filetype')
+            curs.execute(sql, {'filetype': filetype})
+            for (table, mgmt) in curs:
+                ftdict = OrderedDict()
+                ftdict['filetype_mgmt'] = mgmt
+                if table is not None:
+                    ftdict['metadata_table'] = table.lower()
+                else:
+                    ftdict['metadata_table'] = None
+        curs.close()
+
+        if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+            miscutils.fwdebug_print("Read metadata definition of filetype %s (found=%s)" %
+                                    (filetype, ftdict is not None))
+
+        hdrinfo = self.config.get(fmdefs.FILE_HEADER_INFO)
+        if ftdict is not None and isinstance(hdrinfo, lazymapping.LazyMapping):
+            sql = """select h.* from OPS_FILE_HEADER h where h.name in
+                     (select fm.file_header_name from OPS_FILETYPE_METADATA fm
+                      where lower(fm.filetype)=%s)""" % self.get_named_bind_string('filetype')
+            hdrinfo.update_loaded(self._read_file_header_info(sql, {'filetype': filetype}))
+        return ftdict
+
+    def get_file_header_info(self, name):
+        """Return definition of a single file header (None if unknown).
+        """
+        if name != name.lower():
+            return None   # names are lower case in config
+        sql = "select * from OPS_FILE_HEADER where lower(name)=%s" % \
+              self.get_named_bind_string('name')
+        return self._read_file_header_info(sql, {'name': name}).get(name)
+
+    def _read_file_header_info(self, sql, params):
+        """Return dict of lower case name to row dict for OPS_FILE_HEADER query.
+        """
+        curs = self.cursor()
+        curs.execute(sql, params)
+        desc = [d[0].lower() for d in curs.description]
+        result = OrderedDict()
+        for row in curs:
+            rowdict = dict(list(zip(desc, row)))
+            result[rowdict['name'].lower()] = rowdict
+        curs.close()
+        return result
 
     def register_file_in_archive(self, filelist, archive_name):
         """Saves filesystem information about file.
@@ -102,17 +582,8 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
 
         if len(filelist) != 0:
             # get id from desfile table
-            gtt_name = self.load_filename_gtt(filelist)
-            idsql = """select d.filename, d.compression, d.id
-                       from desfile d, %s g
-                       where d.filename=g.filename and
-                       nullcmp(d.compression, g.compression) = 1""" % (gtt_name)
-            ids = {}
-            curs = self.cursor()
-            curs.execute(idsql)
-            for row in curs:
-                ids[row[0]] = {row[1]: row[2]}
-            self.empty_gtt(gtt_name)
+            ids = self.get_desfile_ids(filelist)
+            idnames = set([key[0] for key in ids])
 
             # create dict of info to insert into file_archive_info
             insfilelist = []
@@ -143,9 +614,10 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
                     nfiledict['compression'] = '.' + nfiledict['compression']
 
                 # get matching desfile id
-                if nfiledict['filename'] in ids:
-                    if nfiledict['compression'] in ids[nfiledict['filename']]:
-                        nfiledict['desfile_id'] = int(ids[nfiledict['filename']][nfiledict['compression']])
+                if nfiledict['filename'] in idnames:
+                    idkey = (nfiledict['filename'], nfiledict['compression'])
+                    if idkey in ids:
+                        nfiledict['desfile_id'] = ids[idkey]
                     else:
                         raise ValueError(
                             'Missing desfile id for file - no matching compression (%s)' % onefile)
@@ -186,6 +658,8 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
                 print("colnames =", colnames)
                 print("filelist =", insfilelist)
                 raise
+            self._mark_locations_written([fdict['filename'] for fdict in insfilelist],
+                                         archive_name)
 
     def has_metadata_ingested(self, filetype, fullnames):
         """Check whether metadata has been ingested for given file.
@@ -250,16 +724,24 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
 
     def is_file_in_archive(self, filelist, archive_name):
         """Checks whether given files are in the specified archive according to the DB.
+
+        Returns list of filenames (incl compression extension) of the given
+        files having a location with the same compression in the archive
+        (as the archive status of get_registration_status).
         """
         # TODO change to return count(*) = 0 or 1 which would preserve array
         #      another choice is to return path, but how to make it return null for path that doesn't exist
 
-        gtt_name = self.load_filename_gtt(filelist)
+        gtt_name = self.acquire_filename_gtt(filelist)
+
+        # GTT may hold more files (file set)
+        wanted = set([filename_gtt_key(onefile) for onefile in filelist])
 
         # join to GTT_FILENAME for query
-        sql = ("select filename||compression from %(gtt)s g where exists "
+        sql = ("select g.filename, g.compression from %(gtt)s g where exists "
                "(select filename from file_archive_info fai where "
-               "fai.archive_name=%(ar)s and fai.filename=g.filename)") % \
+               "fai.archive_name=%(ar)s and fai.filename=g.filename and "
+               "nullcmp(fai.compression, g.compression) = 1)") % \
             ({'ar': self.get_named_bind_string('archive_name'), 'gtt': gtt_name})
         if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
             miscutils.fwdebug_print("sql = %s" % sql)
@@ -267,10 +749,86 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
         curs = self.cursor()
         curs.execute(sql, {'archive_name': archive_name})
         existslist = []
-        for row in curs:
-            existslist.append(row[0])
+        for (filename, compression) in curs:
+            if (filename, compression) in wanted:
+                existslist.append(filename + (compression or ''))
+        curs.close()
+        self.release_filename_gtt(gtt_name)
         return existslist
 
+    def get_registration_status(self, filetype, fullnames, archive_name):
+        """Return which registration steps were done for each given file.
+
+        Returns dict fullname -> {FM_STATUS_METADATA: bool,
+        FM_STATUS_CONTENTS: bool, FM_STATUS_ARCHIVE: bool} from a single
+        query.  Like has_metadata_ingested, compressed and uncompressed
+        versions of a file share metadata and contents, but the archive
+        location must be of the file with the same compression.
+        """
+        self.dynam_load_ftmgmt(filetype)
+
+        listfullnames = fullnames
+        if isinstance(fullnames, str):
+            listfullnames = [fullnames]
+
+        metadata_table = self.config['filetype_metadata'][filetype]['metadata_table']
+        if metadata_table.lower() == 'genfile':
+            metadata_table = 'desfile'
+        contents_table = self.ftmgmt.get_contents_table()
+
+        bykey = {}
+        for fname in listfullnames:
+            key = filename_gtt_key(fname)
+            if key not in bykey:
+                bykey[key] = []
+            bykey[key].append(fname)
+
+        results = {}
+        if len(bykey) > 0:
+            gtt_name = self.acquire_filename_gtt(listfullnames)
+
+            contents_expr = '1'
+            if contents_table is not None:
+                contents_expr = ("case when exists (select 1 from %s c where c.%s=g.filename) "
+                                 "then 1 else 0 end" % contents_table)
+            sql = ("select g.filename, g.compression, "
+                   "case when exists (select 1 from %(meta)s m where m.filename=g.filename) "
+                   "then 1 else 0 end, %(cont)s, "
+                   "case when exists (select 1 from file_archive_info fai where "
+                   "fai.archive_name=%(ar)s and fai.filename=g.filename and "
+                   "nullcmp(fai.compression, g.compression) = 1) then 1 else 0 end "
+                   "from %(gtt)s g") % \
+                  ({'meta': metadata_table, 'cont': contents_expr, 'gtt': gtt_name,
+                    'ar': self.get_named_bind_string('archive_name')})
+            if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+                miscutils.fwdebug_print("sql = %s" % sql)
+
+            curs = self.cursor()
+            curs.execute(sql, {'archive_name': archive_name})
+            for (filename, compression, hasmeta, hascont, inarch) in curs:
+                # GTT may hold more files (file set)
+                for fname in bykey.get((filename, compression), []):
+                    results[fname] = {fmdefs.FM_STATUS_METADATA: hasmeta == 1,
+                                      fmdefs.FM_STATUS_CONTENTS: hascont == 1,
+                                      fmdefs.FM_STATUS_ARCHIVE: inarch == 1}
+            curs.close()
+            self.release_filename_gtt(gtt_name)
+
+            for fname in listfullnames:
+                if fname not in results:
+                    results[fname] = {fmdefs.FM_STATUS_METADATA: False,
+                                      fmdefs.FM_STATUS_CONTENTS: False,
+                                      fmdefs.FM_STATUS_ARCHIVE: False}
+
+            if contents_table is None:
+                contents = self.ftmgmt.has_contents_ingested(listfullnames)
+                for fname in results:
+                    results[fname][fmdefs.FM_STATUS_CONTENTS] = contents[fname]
+
+        if isinstance(fullnames, str):
+            results = results[fullnames]
+        return results
+
     @staticmethod
     def _get_required_headers(filetype_dict):
         """Collects the list of required header values.
@@ -326,88 +884,16 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
         will also throw an error if the filetype given in the input data is
         not found in <dbdict>. Any exception will abort the entire upload.
         """
-        dbdict = self.config[fmdefs.FILETYPE_METADATA]
-        FILETYPE = "filetype"
-        FILENAME = "filename"
-        metatable = "metadata_table"
-        COLMAP = "column_map"
-        ROWS = "rows"
         metadataTables = OrderedDict()
 
         try:
-            if not isinstance(filemeta, dict):
-                raise TypeError("Invalid type for filemeta (should be dict): %s" % type(filemeta))
-
-            if FILENAME not in list(filemeta.keys()):
-                raise KeyError("File metadata missing FILENAME")
-
-            if FILETYPE not in list(filemeta.keys()):
-                raise KeyError("File metadata missing FILETYPE (file: %s)" % filemeta[FILENAME])
-
-            if filemeta[FILETYPE] not in dbdict:
-                raise ValueError("Unknown FILETYPE (file: %s, filetype: %s)" %
-                                 (filemeta[FILENAME], filemeta[FILETYPE]))
-
-            # if debugging turned on, print message about missing optional metadata values
-            if miscutils.fwdebug_check(1, "FILEMGMT_DEBUG"):
-                all_opt_meta = self._get_optional_metadata(dbdict[filemeta[FILETYPE]])
-                for dbkey in all_opt_meta:
-                    if dbkey not in list(filemeta.keys()) or filemeta[dbkey] == "":
-                        miscutils.fwdebug_print("WARN: %s missing optional metadata %s" %
-                                                (filemeta[FILENAME], dbkey))
-
-            # check that all required are present
-            all_req_headers = self._get_required_headers(dbdict[filemeta[FILETYPE]])
-            for dbkey in all_req_headers:
-                if dbkey not in list(filemeta.keys()) or filemeta[dbkey] == "":
-                    raise KeyError("Missing required data (%s) (file: %s)" % (dbkey, filemeta[FILENAME]))
-
-            # now load structures needed for upload
-            rowdata = OrderedDict()
-            mapped_headers = set()
-            filemetatable = dbdict[filemeta[FILETYPE]][metatable]
-
-            if filemetatable not in list(metadataTables.keys()):
-                metadataTables[filemetatable] = OrderedDict()
-                metadataTables[filemetatable][COLMAP] = self._get_column_map(dbdict[filemeta[FILETYPE]])
-                metadataTables[filemetatable][ROWS] = []
-
-
-            column_types = self.get_column_types(filemetatable)
-            colmap = metadataTables[filemetatable][COLMAP]
-            for column, header in colmap.items():
-                compheader = header.split(':')
-                if len(compheader) > 1:
-                    hdr = compheader[0]
-                    pos = int(compheader[1])
-                    if hdr in filemeta:
-                        rowdata[column] = filemeta[hdr].split(',')[pos]
-                        mapped_headers.add(hdr)
-                else:
-                    if header in filemeta:
-                        rowdata[column] = filemeta[header]
-                        mapped_headers.add(header)
-                    else:
-                        rowdata[column] = None
-
-                # Convert data type to match DB column type
-                if rowdata[column] is not None:
-                    rowdata[column] = column_types[column](rowdata[column])
-
-            # report elements that were in the file that do not map to a DB column
-            for notmapped in set(filemeta.keys()) - mapped_headers:
-                if notmapped != 'fullname':
-                    print("WARN: file " + filemeta[FILENAME] + " header item " \
-                        + notmapped + " does not match column for filetype " \
-                        + filemeta[FILETYPE])
-
-            # add the new data to the table set of rows
-            metadataTables[filemetatable][ROWS].append(rowdata)
+            self._add_metadata_row(filemeta, metadataTables)
 
             for metatable, metadict in metadataTables.items():
                 if metatable.lower() != 'genfile' and metatable.lower() != 'desfile':
-                    #self.insert_many(metatable, metadict[COLMAP].keys(), metadict[ROWS])
-                    self.insert_many_indiv(metatable, list(metadict[COLMAP].keys()), metadict[ROWS])
+                    #self.insert_many(metatable, metadict['column_map'].keys(), metadict['rows'])
+                    self.insert_many_indiv(metatable, list(metadict['column_map'].keys()),
+                                           metadict['rows'])
 
         except (KeyError, ValueError, TypeError):
             print("filemeta:", filemeta)
@@ -415,6 +901,196 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
             raise
     # end ingest_file_metadata
 
+    def ingest_file_metadata_many(self, filemetas):
+        """Ingests the metadata for several files, one insert per metadata table.
+
+        Same checks as ingest_file_metadata (missing required values still
+        abort), but rows the DB rejects are reported instead of aborting the
+        rest of the batch.   Returns dict of filename to error message for
+        those rows.
+        """
+        metadataTables = OrderedDict()
+        rowfiles = {}
+        for filemeta in filemetas:
+            try:
+                metatable = self._add_metadata_row(filemeta, metadataTables)
+            except (KeyError, ValueError, TypeError):
+                print("filemeta:", filemeta)
+                raise
+            if metatable not in rowfiles:
+                rowfiles[metatable] = []
+            rowfiles[metatable].append(filemeta['filename'])
+
+        problems = {}
+        for metatable, metadict in metadataTables.items():
+            if metatable.lower() != 'genfile' and metatable.lower() != 'desfile':
+                rowprobs = self.insert_many_report(metatable, list(metadict['column_map'].keys()),
+                                                   metadict['rows'])
+                for idx, errmsg in rowprobs.items():
+                    problems[rowfiles[metatable][idx]] = errmsg
+        return problems
+
+    def _add_metadata_row(self, filemeta, metadataTables):
+        """Check metadata for a single file and add its row to metadataTables.
+
+        Returns the name of the metadata table the row belongs to.
+        """
+        dbdict = self.config[fmdefs.FILETYPE_METADATA]
+        FILETYPE = "filetype"
+        FILENAME = "filename"
+        COLMAP = "column_map"
+        ROWS = "rows"
+
+        if not isinstance(filemeta, dict):
+            raise TypeError("Invalid type for filemeta (should be dict): %s" % type(filemeta))
+
+        if FILENAME not in filemeta:
+            raise KeyError("File metadata missing FILENAME")
+
+        if FILETYPE not in filemeta:
+            raise KeyError("File metadata missing FILETYPE (file: %s)" % filemeta[FILENAME])
+
+        if filemeta[FILETYPE] not in dbdict:
+            raise ValueError("Unknown FILETYPE (file: %s, filetype: %s)" %
+                             (filemeta[FILENAME], filemeta[FILETYPE]))
+
+        plan = self.get_ingest_plan(filemeta[FILETYPE])
+
+        # if debugging turned on, print message about missing optional metadata values
+        if miscutils.fwdebug_check(1, "FILEMGMT_DEBUG"):
+            for dbkey in plan.optional:
+                if dbkey not in filemeta or filemeta[dbkey] == "":
+                    miscutils.fwdebug_print("WARN: %s missing optional metadata %s" %
+                                            (filemeta[FILENAME], dbkey))
+
+        # check that all required are present
+        for dbkey in plan.required:
+            if dbkey not in filemeta or filemeta[dbkey] == "":
+                raise KeyError("Missing required data (%s) (file: %s)" % (dbkey, filemeta[FILENAME]))
+
+        # now load structures needed for upload
+        if plan.metadata_table not in metadataTables:
+            metadataTables[plan.metadata_table] = OrderedDict()
+            metadataTables[plan.metadata_table][COLMAP] = plan.column_map
+            metadataTables[plan.metadata_table][ROWS] = []
+
+        rowdata = OrderedDict()
+        for column, header, position, convert in plan.steps:
+            value = None
+            if header in filemeta:
+                value = filemeta[header]
+                if position is not None:
+                    value = value.split(',')[position]
+
+            # Convert data type to match DB column type
+            if value is not None:
+                if convert is None:
+                    raise KeyError("Missing column type for %s.%s" % (plan.metadata_table, column))
+                value = convert(value)
+            rowdata[column] = value
+
+        # report elements that were in the file that do not map to a DB column
+        for notmapped in set(filemeta.keys()) - plan.headers:
+            if notmapped != 'fullname':
+                print("WARN: file " + filemeta[FILENAME] + " header item " \
+                    + notmapped + " does not match column for filetype " \
+                    + filemeta[FILETYPE])
+
+        # add the new data to the table set of rows
+        metadataTables[plan.metadata_table][ROWS].append(rowdata)
+        return plan.metadata_table
+
+    def get_ingest_plan(self, filetype):
+        """Return the IngestPlan for the given filetype, creating it if needed.
+
+        Plans are rebuilt if the filetype's definition in the config was
+        replaced (or after clear_ingest_plans).
+        """
+        ftdict = self.config[fmdefs.FILETYPE_METADATA][filetype]
+        key = (filetype, ftdict['metadata_table'])
+        plan = self.ingest_plans.get(key)
+        if plan is None or plan.source is not ftdict:
+            if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+                miscutils.fwdebug_print("Creating ingest plan for %s" % str(key))
+            plan = IngestPlan(filetype, ftdict,
+                              self._get_required_headers(ftdict),
+                              self._get_optional_metadata(ftdict),
+                              self._get_column_map(ftdict),
+                              self.get_column_types(ftdict['metadata_table']))
+            self.ingest_plans[key] = plan
+        return plan
+
+    def clear_ingest_plans(self):
+        """Forget all ingest plans (e.g., after changing filetype_metadata).
+        """
+        self.ingest_plans = {}
+
+    def insert_many_report(self, table, colnames, rows, returning=None):
+        """Insert rows into table with one array-bound executemany.
+
+        Rows the DB rejects are reported instead of aborting the whole batch.
+        Returns dict of row index to error message for those rows.  If
+        returning is the name of a numeric column (e.g., a generated id),
+        returns (problems, dict of row index to the inserted row's value).
+        """
+        problems = {}
+        values = {}
+        if len(rows) == 0:
+            if returning is not None:
+                return problems, values
+            return problems
+
+        sql = "insert into %s (%s) values (%s)" % \
+              (table, ','.join(colnames),
+               ','.join([self.get_named_bind_string(col) for col in colnames]))
+        if returning is not None:
+            if self.type == 'oracle':
+                sql += " returning %s into %s" % (returning, self.get_named_bind_string('returned'))
+            else:
+                sql += " returning %s" % returning
+        bindrows = []
+        for row in rows:
+            bindrows.append(dict([(col, row.get(col)) for col in colnames]))
+
+        if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+            miscutils.fwdebug_print("sql = %s (%s rows)" % (sql, len(bindrows)))
+
+        curs = self.cursor()
+        if self.type == 'oracle':
+            if returning is not None:
+                retvar = curs.var(int, arraysize=len(bindrows))
+                curs.setinputsizes(returned=retvar)
+            curs.executemany(sql, bindrows, batcherrors=True)
+            for err in curs.getbatcherrors():
+                problems[err.offset] = err.message
+            if returning is not None:
+                for idx in range(len(bindrows)):
+                    retvals = retvar.getvalue(idx)
+                    if idx not in problems and retvals:
+                        values[idx] = retvals[0]
+        else:
+            # a failed statement aborts the whole transaction (e.g., PostgreSQL)
+            # unless rolled back to a savepoint
+            dberror = curs.connection.Error
+            for idx, bindrow in enumerate(bindrows):
+                curs.execute("savepoint fm_insert_row")
+                try:
+                    curs.execute(sql, bindrow)
+                    if returning is not None:
+                        values[idx] = curs.fetchone()[0]
+                except dberror as err:
+                    curs.execute("rollback to savepoint fm_insert_row")
+                    problems[idx] = str(err)
+                curs.execute("release savepoint fm_insert_row")
+        curs.close()
+
+        for idx, errmsg in problems.items():
+            print("Error: problems saving row to table %s: %s" % (table, errmsg))
+            print("\trow =", bindrows[idx])
+        if returning is not None:
+            return problems, values
+        return problems
+
     def is_valid_filetype(self, ftype):
         """Checks filetype definitions to determine if given filetype exists.
         """
@@ -447,6 +1123,20 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
 
         E.g., filename, size, rel_filename, ...
         """
+        records = self.get_file_archive_records(filelist, arname, compress_order)
+
+        # go through given list of filenames in order
+        archiveinfo = {}
+        for name in filelist:
+            if name in records:
+                archiveinfo[name] = records[name].as_dict()
+
+        #print "archiveinfo = ", archiveinfo
+        return archiveinfo
+
+    def _check_archive_query_args(self, arname, compress_order):
+        """Die if archive or compress_order is invalid.
+        """
         # sanity checks
         if 'archive' not in self.config:
             miscutils.fwdie('Error: Missing archive section in config', 1)
@@ -462,12 +1152,66 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
             miscutils.fwdie('Error:  Invalid compress_order.  '
                             'It must be a list of compression extensions (including None)', 1)
 
+    def _fetch_archive_records(self, curs, compress_order, arraysize=None):
+        """Read query rows (ArchiveFileInfo.COLUMNS) keeping best file per filename.
+
+        Rows are fetched arraysize at a time (config archive_info_arraysize)
+        and only the one whose compression comes first in compress_order is
+        kept for each filename.  Returns dict filename -> ArchiveFileInfo.
+        """
+        if arraysize is None:
+            arraysize = int(self.config.get('archive_info_arraysize',
+                                            fmdefs.FM_ARCHIVE_INFO_ARRAYSIZE))
+        curs.arraysize = arraysize
+
+        rank = {}
+        for pos, comp in enumerate(compress_order):
+            if comp not in rank:
+                rank[comp] = pos
+
+        best = {}
+        rows = curs.fetchmany()
+        while rows:
+            for row in rows:
+                comprank = rank.get(row[3])
+                if comprank is None:
+                    continue   # compression not wanted
+                current = best.get(row[2])
+                if current is None or comprank < rank[current.compression]:
+                    best[row[2]] = ArchiveFileInfo(*row)
+            rows = curs.fetchmany()
+        return best
+
+    def get_file_archive_records(self, filelist, arname,
+                                 compress_order=fmdefs.FM_PREFER_COMPRESSED, arraysize=None):
+        """Return dict filename -> ArchiveFileInfo for given files in archive.
+
+        Like get_file_archive_info, but streams the query results keeping a
+        compact record per file (the one with the preferred compression).
+        """
+        self._check_archive_query_args(arname, compress_order)
+
+        # use cached locations, only querying for the other files
+        records = {}
+        queryfiles = filelist
+        if self.location_cache is not None:
+            queryfiles = []
+            for name in filelist:
+                record = self.location_cache.get(arname, name, compress_order)
+                if record is None:
+                    queryfiles.append(name)
+                else:
+                    records[name] = record
+            if len(queryfiles) == 0:
+                return records
+
         # query DB getting all files regardless of compression
         #     Can't just use 'in' expression because could be more than 1000 filenames in list
         #           ORA-01795: maximum number of expressions in a list is 1000
 
         # insert filenames into filename global temp table to use in join for query
-        gtt_name = self.load_filename_gtt(filelist)
+        #     (compression doesn't matter as all compressions of the files are found)
+        gtt_name = self.acquire_filename_gtt(queryfiles, with_compression=False)
 
         # join to GTT_FILENAME for query
         sql = ("select d.filetype,fai.path,fai.filename,fai.compression, "
@@ -477,69 +1221,42 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
               ({'ar': self.get_named_bind_string('archive_name'), 'gtt': gtt_name})
         curs = self.cursor()
         curs.execute(sql, {'archive_name': arname})
-        desc = [d[0].lower() for d in curs.description]
-
-        fullnames = {}
-        for comp in compress_order:
-            fullnames[comp] = {}
-
-        for line in curs:
-            ldict = dict(list(zip(desc, line)))
-
-            if ldict['compression'] is None:
-                compext = ""
-            else:
-                compext = ldict['compression']
-            ldict['rel_filename'] = "%s/%s%s" % (ldict['path'], ldict['filename'], compext)
-            fullnames[ldict['compression']][ldict['filename']] = ldict
+        found = self._fetch_archive_records(curs, compress_order, arraysize)
         curs.close()
 
-        self.empty_gtt(gtt_name)
+        self.release_filename_gtt(gtt_name)
 
-        #print "uncompressed:", len(fullnames[None])
-        #print "compressed:", len(fullnames['.fz'])
+        if self.location_cache is not None:
+            for record in found.values():
+                self.location_cache.put(arname, compress_order, record)
+        records.update(found)
 
-        # go through given list of filenames and find archive location and compreesion
-        archiveinfo = {}
-        for name in filelist:
-            #print name
-            for cmpord in compress_order:    # follow compression preference
-                #print "cmpord = ", cmpord
-                if name in fullnames[cmpord]:
-                    archiveinfo[name] = fullnames[cmpord][name]
-                    break
-
-        #print "archiveinfo = ", archiveinfo
-        return archiveinfo
+        if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+            miscutils.fwdebug_print("found %s of %s files in archive %s" %
+                                    (len(records), len(filelist), arname))
+        return records
 
-    def get_file_archive_info_path(self, path, arname, compress_order=fmdefs.FM_PREFER_COMPRESSED):
-        """Return information about file stored in archive
+    def get_file_archive_info_path(self, path, arname, compress_order=fmdefs.FM_PREFER_COMPRESSED,
+                                   recursive=True):
+        """Return information about files stored in archive under path
 
-        E.g., filename, size, rel_filename, ...
+        E.g., filename, size, rel_filename, ...  With recursive (default),
+        includes files in all directories under path, otherwise only files
+        directly in path.
         """
-        # sanity checks
-        if 'archive' not in self.config:
-            miscutils.fwdie('Error: Missing archive section in config', 1)
-
-        if arname not in self.config['archive']:
-            miscutils.fwdie('Error: Invalid archive name (%s)' % arname, 1)
-
-        if 'root' not in self.config['archive'][arname]:
-            miscutils.fwdie('Error: Missing root in archive def (%s)' %
-                            self.config['archive'][arname], 1)
+        self._check_archive_query_args(arname, compress_order)
 
-        if not isinstance(compress_order, list):
-            miscutils.fwdie('Error:  Invalid compress_order.  '
-                            'It must be a list of compression extensions (including None)', 1)
-
-        likestr = self.get_regex_clause('path', '%s/.*' % path)
+        (pathsql, params) = dbutils.path_clause(self, 'file_archive_info.path', path, recursive)
+        params['archive_name'] = arname
 
         # query DB getting all files regardless of compression
         sql = ("select filetype,file_archive_info.* from desfile, file_archive_info "
-               "where archive_name='%s' and desfile.id=file_archive_info.desfile_id "
-               "and %s") % (arname, likestr)
+               "where archive_name=%s and desfile.id=file_archive_info.desfile_id "
+               "and %s") % (self.get_named_bind_string('archive_name'), pathsql)
+        if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+            miscutils.fwdebug_print("sql = %s, params = %s" % (sql, params))
         curs = self.cursor()
-        curs.execute(sql)
+        curs.execute(sql, params)
         desc = [d[0].lower() for d in curs.description]
 
         fullnames = {}
@@ -549,6 +1266,8 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
         list_by_name = {}
         for line in curs:
             ldict = dict(list(zip(desc, line)))
+            if ldict['compression'] not in fullnames:
+                continue   # compression not wanted
 
             #print "line = ", line
             if ldict['compression'] is None:
@@ -577,22 +1296,31 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
 
     def dynam_load_ftmgmt(self, filetype, filepat=None):
         """Dynamically load a filetype mgmt class.
+
+        Objects are kept by (filetype, filepat, class name) so switching back
+        to a filetype reuses its object (see invalidate_ftmgmt).  Without
+        filepat, the current object of the filetype is kept whatever its
+        filepat.
         """
         if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
             miscutils.fwdebug_print("filetype = %s" % self.filetype)
 
-        if self.filetype is None or filetype != self.filetype or \
-           self.ftmgmt is None:
-            classname = 'filemgmt.ftmgmt_generic.FtMgmtGeneric'
-            if filetype in self.config['filetype_metadata']:
-                if 'filetype_mgmt' in self.config['filetype_metadata'][filetype] and \
-                        self.config['filetype_metadata'][filetype]['filetype_mgmt'] is not None:
-                    classname = self.config['filetype_metadata'][filetype]['filetype_mgmt']
-                else:
-                    miscutils.fwdie('Error: Invalid filetype (%s)' % filetype, 1)
+        if self.ftmgmt is not None and filetype == self.filetype and \
+           (filepat is None or filepat == self.filepat):
+            return
+
+        classname = 'filemgmt.ftmgmt_generic.FtMgmtGeneric'
+        if filetype in self.config['filetype_metadata']:
+            if 'filetype_mgmt' in self.config['filetype_metadata'][filetype] and \
+                    self.config['filetype_metadata'][filetype]['filetype_mgmt'] is not None:
+                classname = self.config['filetype_metadata'][filetype]['filetype_mgmt']
+            else:
+                miscutils.fwdie('Error: Invalid filetype (%s)' % filetype, 1)
 
+        key = (filetype, filepat, classname)
+        filetype_mgmt = self.ftmgmt_registry.get(key)
+        if filetype_mgmt is None:
             # dynamically load class for the filetype
-            filetype_mgmt = None
             filetype_mgmt_class = miscutils.dynamically_load_class(classname)
             try:
                 filetype_mgmt = filetype_mgmt_class(filetype, self, self.config, filepat)
@@ -600,40 +1328,179 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
                 print("ERROR\nError: creating filemgmt object\n%s" % err)
                 raise
 
-            self.filetype = filetype
-            self.filepat = filepat
-            self.ftmgmt = filetype_mgmt
+            filetype_mgmt.header_cache = self.header_cache
+            self.ftmgmt_registry[key] = filetype_mgmt
+        elif miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+            miscutils.fwdebug_print("Reusing filetype mgmt object for %s" % str(key))
+
+        self.filetype = filetype
+        self.filepat = filepat
+        self.ftmgmt = filetype_mgmt
+
+    def invalidate_ftmgmt(self, filetype=None):
+        """Forget filetype mgmt objects of filetype (default all filetypes).
+
+        E.g., after changing the filetype's definition in config or DB.
+        """
+        for key in list(self.ftmgmt_registry.keys()):
+            if filetype is None or key[0] == filetype:
+                del self.ftmgmt_registry[key]
+        if filetype is None or filetype == self.filetype:
+            self.filetype = None
+            self.filepat = None
+            self.ftmgmt = None
+
+    def gather_file_data(self, fullnames, do_update, update_info, num_workers=1):
+        """Read metadata and disk info (incl md5sum) for given files.
+
+        Generator yielding (fullname, metadata, fileinfo, err) in the same
+        order as fullnames (which may be any iterable, it is consumed
+        lazily).  err is the IOError raised while reading the file
+        (metadata and fileinfo are then None).   Nothing is written to the DB.
+
+        With num_workers > 1, metadata is read in a pool of worker processes
+        while md5sums are computed in a pool of threads.   When updating
+        headers, the md5sum is computed by the worker after the update.
+        Filetypes which compute the md5sum while reading the metadata (see
+        reads_md5sum) do it all in the worker.
+        """
+        if num_workers is None or num_workers <= 1 or \
+                (hasattr(fullnames, '__len__') and len(fullnames) <= 1):
+            for fname in fullnames:
+                try:
+                    metadata, fileinfo = _read_file_data(self.ftmgmt, fname, do_update,
+                                                         update_info)
+                except IOError as err:
+                    yield fname, None, None, err
+                else:
+                    yield fname, metadata, fileinfo, None
+            return
+
+        # limit number of files in flight so memory doesn't grow with len(fullnames)
+        window = num_workers * 4
+        pending = collections.deque()
+        mpcontext = multiprocessing.get_context(fmdefs.FM_WORKER_START_METHOD)
+        with concurrent.futures.ProcessPoolExecutor(num_workers, mp_context=mpcontext,
+                                                    initializer=_init_metadata_worker,
+                                                    initargs=(self.ftmgmt,)) as procpool, \
+                concurrent.futures.ThreadPoolExecutor(num_workers) as threadpool:
+
+            def submit(fname):
+                """Start reading metadata and disk info for a single file.
+                """
+                # worker starts with headers already read here (e.g., check_valid)
+                headers = self.header_cache.get(fname)
+                if do_update or self.ftmgmt.reads_md5sum(fname, do_update):
+                    mdfuture = procpool.submit(_worker_metadata_disk_info, fname,
+                                               do_update, update_info, headers)
+                    diskfuture = None
+                else:
+                    mdfuture = procpool.submit(_worker_metadata_tasks, fname,
+                                               do_update, update_info, headers)
+                    diskfuture = threadpool.submit(diskutils.get_single_file_disk_info,
+                                                   fname, True, None)
+                pending.append((fname, mdfuture, diskfuture))
+
+            names = iter(fullnames)
+            for fname in itertools.islice(names, window):
+                submit(fname)
+
+            while pending:
+                fname, mdfuture, diskfuture = pending.popleft()
+                nextname = next(names, None)
+                if nextname is not None:
+                    submit(nextname)
+
+                try:
+                    if diskfuture is None:
+                        metadata, fileinfo, headers = mdfuture.result()
+                    else:
+                        metadata, headers = mdfuture.result()
+                        fileinfo = diskfuture.result()
+                except IOError as err:
+                    yield fname, None, None, err
+                else:
+                    self.header_cache.put(headers)
+                    yield fname, metadata, fileinfo, None
 
     def register_file_data(self, ftype, fullnames, pfw_attempt_id, wgb_task_id,
-                           do_update, update_info=None, filepat=None):
+                           do_update, update_info=None, filepat=None, num_workers=1,
+                           batch_size=None):
         """Save artifact, metadata, wgb provenance, and simple contents for
         given files.
+
+        num_workers > 1 reads the files in parallel (see gather_file_data),
+        all DB writes still happen in this process on this connection.
+        DESFILE and metadata rows are saved batch_size files at a time.
+        Files whose rows the DB rejected have None as their result.
         """
         self.dynam_load_ftmgmt(ftype, filepat)
 
+        if batch_size is None:
+            batch_size = fmdefs.FM_REGISTER_BATCH_SIZE
+
         results = {}
         if len(fullnames) == 1:
             single = True
         else:
             single = False
-        for fname in fullnames:
-            metadata = {}
-            fileinfo = {}
 
-            try:
-                metadata = self.ftmgmt.perform_metadata_tasks(fname, do_update, update_info)
-                if miscutils.fwdebug_check(6, 'FILEMGMT_DEBUG'):
-                    miscutils.fwdebug_print("INFO: metadata to ingest" % metadata)
-                fileinfo = diskutils.get_single_file_disk_info(fname,
-                                                               save_md5sum=True,
-                                                               archive_root=None)
-            except IOError:
+        # check once for all files which already have metadata/contents in the DB
+        listfullnames = list(fullnames)
+        metadata_status = self.has_metadata_ingested(ftype, listfullnames)
+        contents_status = self.ftmgmt.has_contents_ingested(listfullnames)
+
+        self._save_gathered_file_data(ftype, self.gather_file_data(fullnames, do_update,
+                                                                   update_info, num_workers),
+                                      pfw_attempt_id, wgb_task_id, metadata_status,
+                                      contents_status, batch_size, single, results)
+        return results
+
+    def register_gathered_file_data(self, ftype, gathered, pfw_attempt_id, wgb_task_id):
+        """Save artifact, metadata and simple contents for files already read.
+
+        gathered is a list of tuples as yielded by gather_file_data.  Checks
+        which of them already have metadata/contents in the DB, then saves
+        the rest as a single batch.  Returns results like register_file_data.
+        """
+        self.dynam_load_ftmgmt(ftype)
+
+        results = {}
+        readnames = [fname for (fname, _, _, err) in gathered if err is None]
+        metadata_status = {}
+        contents_status = {}
+        if len(readnames) > 0:
+            metadata_status = self.has_metadata_ingested(ftype, readnames)
+            contents_status = self.ftmgmt.has_contents_ingested(readnames)
+
+        self._save_gathered_file_data(ftype, gathered, pfw_attempt_id, wgb_task_id,
+                                      metadata_status, contents_status, len(gathered) + 1,
+                                      False, results)
+        return results
+
+    def _save_gathered_file_data(self, ftype, gathered, pfw_attempt_id, wgb_task_id,
+                                 metadata_status, contents_status, batch_size, single,
+                                 results):
+        """Save DESFILE, metadata and contents of gathered files in batches.
+
+        Fills in results (see register_file_data).
+        """
+        savelist = []           # (fullname, fileinfo, metadata) to save in next batch
+        savenames = set()       # filenames saved in this call (metadata ignores compression)
+        contentlist = []        # files to ingest contents after next batch is saved
+        contentnames = set()    # filenames with contents ingested in this call
+        for fname, metadata, fileinfo, err in gathered:
+            if err is not None:
                 miscutils.fwdebug_print("\n\nError: Problem gathering data for file %s" % fname)
-                traceback.print_exc(1, sys.stdout)
+                traceback.print_exception(type(err), err, err.__traceback__, 1, sys.stdout)
                 print("\n\n")
                 if single:
-                    raise
+                    raise err
                 results[fname] = None
+                continue
+
+            if miscutils.fwdebug_check(6, 'FILEMGMT_DEBUG'):
+                miscutils.fwdebug_print("INFO: metadata to ingest %s" % metadata)
 
             #basename = fileinfo['filename']
             #if fileinfo['compression'] is not None:
@@ -647,20 +1514,47 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
                 fileinfo['pfw_attempt_id'] = int(pfw_attempt_id)
 
             del fileinfo['path']
+            results[fname] = {'diskinfo': fileinfo, 'metadata': metadata}
 
-            has_metadata = self.has_metadata_ingested(ftype, fname)
+            has_metadata = metadata_status[fname] or fileinfo['filename'] in savenames
             if not has_metadata:
-                self.save_file_info(fileinfo, metadata)
+                if single:
+                    self.save_file_info(fileinfo, metadata)
+                else:
+                    savelist.append((fname, fileinfo, metadata))
+                    savenames.add(fileinfo['filename'])
             elif miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
                 miscutils.fwdebug_print("INFO: %s already has metadata ingested" % fname)
 
-            has_contents = self.ftmgmt.has_contents_ingested([fname])
-            if not has_contents[fname]:
-                self.ftmgmt.ingest_contents([fname])
+            has_contents = contents_status[fname] or fileinfo['filename'] in contentnames
+            if not has_contents:
+                contentlist.append(fname)
+                contentnames.add(fileinfo['filename'])
             elif miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
                 miscutils.fwdebug_print("INFO: %s already has contents ingested" % fname)
-            results[fname] = {'diskinfo': fileinfo, 'metadata': metadata}
-        return results
+
+            if len(savelist) >= batch_size:
+                self._save_file_batch(savelist, contentlist, results)
+                savelist = []
+                contentlist = []
+
+        self._save_file_batch(savelist, contentlist, results)
+
+    def _save_file_batch(self, savelist, contentlist, results):
+        """Save a batch of files' info and then ingest their contents.
+
+        Files that had problems saving get None in results and their
+        contents aren't ingested.
+        """
+        problems = {}
+        if len(savelist) > 0:
+            problems = self.save_file_info_many(savelist)
+            for fname in problems:
+                results[fname] = None
+
+        contentlist = [fname for fname in contentlist if fname not in problems]
+        if len(contentlist) > 0:
+            self.ftmgmt.ingest_contents(contentlist)
 
     def save_file_info(self, fileinfo, metadata):
         """Save non-location information about file.
@@ -674,6 +1568,128 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
         if metadata is not None and len(metadata) > 0:
             self.ingest_file_metadata(metadata)
 
+    def save_file_info_many(self, filelist):
+        """Save non-location information about several files in batches.
+
+        filelist is a list of (fullname, fileinfo, metadata).   DESFILE rows
+        are saved with one insert, then metadata rows with one insert per
+        metadata table.   Rows the DB rejects are reported instead of aborting
+        the rest of the batch.   If a file's metadata can't be saved, its
+        DESFILE row is removed again.   Returns dict of fullname to error
+        message for files that weren't saved.
+        """
+        if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+            miscutils.fwdebug_print("Saving info for %s files" % len(filelist))
+
+        problems = {}
+        rowprobs = self.save_desfile_many([fileinfo for (_, fileinfo, _) in filelist])
+        for idx, errmsg in rowprobs.items():
+            problems[filelist[idx][0]] = errmsg
+
+        metalist = []
+        metafiles = {}
+        for fname, fileinfo, metadata in filelist:
+            if fname not in problems and metadata is not None and len(metadata) > 0:
+                metalist.append(metadata)
+                metafiles[metadata['filename']] = (fname, fileinfo)
+
+        metaprobs = self.ingest_file_metadata_many(metalist)
+        if len(metaprobs) > 0:
+            delrows = []
+            for filename, errmsg in metaprobs.items():
+                (fname, fileinfo) = metafiles[filename]
+                problems[fname] = errmsg
+                delrows.append({'filename': fileinfo['filename'],
+                                'compression': fileinfo['compression']})
+            sql = "delete from desfile where filename=%s and nullcmp(compression, %s) = 1" % \
+                  (self.get_named_bind_string('filename'),
+                   self.get_named_bind_string('compression'))
+            curs = self.cursor()
+            curs.executemany(sql, delrows)
+            curs.close()
+            self._mark_locations_written([row['filename'] for row in delrows])
+            self.forget_desfile_ids([(row['filename'], row['compression']) for row in delrows])
+
+        return problems
+
+    def save_desfile_many(self, fileinfos):
+        """Save non-location information about files with a single insert.
+
+        The ids of the new rows are remembered (see get_desfile_ids).
+        Returns dict of index in fileinfos to error message for rows the
+        DB rejected.
+        """
+        colnames = ['pfw_attempt_id', 'filetype', 'filename', 'compression',
+                    'filesize', 'md5sum', 'wgb_task_id']
+        (problems, ids) = self.insert_many_report('DESFILE', colnames, fileinfos, returning='id')
+        items = [((fileinfos[idx]['filename'], fileinfos[idx]['compression']), desfile_id)
+                 for idx, desfile_id in ids.items()]
+        self.desfile_ids_written.update([key for key, _ in items])
+        self._remember_desfile_ids(items)
+        return problems
+
+    def _remember_desfile_ids(self, items):
+        """Save ((filename, compression), DESFILE id) pairs in the id map.
+        """
+        maxsize = int(self.config.get('desfile_id_map_size', fmdefs.FM_DESFILE_ID_MAP_SIZE))
+        for key, desfile_id in items:
+            self.desfile_ids[key] = int(desfile_id)
+            self.desfile_ids.move_to_end(key)
+        while len(self.desfile_ids) > maxsize:
+            self.desfile_ids.popitem(last=False)
+
+    def forget_desfile_ids(self, keys=None):
+        """Remove (filename, compression) keys (default all) from the DESFILE id map.
+        """
+        if keys is None:
+            self.desfile_ids.clear()
+        else:
+            for key in keys:
+                self.desfile_ids.pop(key, None)
+
+    def get_desfile_ids(self, filelist):
+        """Return dict of (filename, compression) to DESFILE id for given files.
+
+        filelist is as for load_filename_gtt.  Ids of files saved (or
+        looked up) in this session come from memory, only the other files
+        are queried.  Files without a DESFILE row are missing from the dict.
+        """
+        ids = {}
+        queryfiles = []
+        for onefile in filelist:
+            (filename, compression) = filename_gtt_key(onefile)
+            if compression is not None and not compression.startswith('.'):
+                compression = '.' + compression
+            key = (filename, compression)
+            if key in self.desfile_ids:
+                ids[key] = self.desfile_ids[key]
+            elif key not in ids:
+                ids[key] = None
+                queryfiles.append(onefile)
+
+        if len(queryfiles) > 0:
+            if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
+                miscutils.fwdebug_print("querying ids of %s of %s files" %
+                                        (len(queryfiles), len(filelist)))
+            gtt_name = self.acquire_filename_gtt(queryfiles)
+            idsql = """select d.filename, d.compression, d.id
+                       from desfile d, %s g
+                       where d.filename=g.filename and
+                       nullcmp(d.compression, g.compression) = 1""" % (gtt_name)
+            curs = self.cursor()
+            curs.execute(idsql)
+            found = []
+            for row in curs:
+                key = (row[0], row[1])
+                if key in ids:   # GTT may hold more files (file set)
+                    ids[key] = row[2]
+                    found.append((key, row[2]))
+            curs.close()
+            self.release_filename_gtt(gtt_name)
+            self._remember_desfile_ids(found)
+
+        return dict([(key, int(val)) for key, val in ids.items() if val is not None])
+
     def save_desfile(self, fileinfo):
         """Save non-location information about files.
         """
@@ -684,6 +1700,8 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
                     'filesize', 'md5sum', 'wgb_task_id']
         try:
             self.insert_many_indiv('DESFILE', colnames, [fileinfo])
+            # id could be looked up (and remembered) before commit
+            self.desfile_ids_written.add((fileinfo['filename'], fileinfo['compression']))
         except:
             print("Error: problems saving to table desfile")
             print("colnames =", colnames)
@@ -700,8 +1718,7 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
         allfiles = set()
         if provdefs.PROV_USED in prov:
             for filenames in list(prov[provdefs.PROV_USED].values()):
-                for fname in filenames.split(provdefs.PROV_DELIM):
-                    allfiles.add(fname.strip())
+                allfiles.update(self._prov_filenames(filenames))
         #if provdefs.PROV_WGB in prov:
         #    for filenames in prov[provdefs.PROV_WGB].values():
         #        for fname in filenames.split(provdefs.PROV_DELIM):
@@ -709,37 +1726,84 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
         if provdefs.PROV_WDF in prov:
             for tuples in list(prov[provdefs.PROV_WDF].values()):
                 for filenames in list(tuples.values()):
-                    for fname in filenames.split(provdefs.PROV_DELIM):
-                        allfiles.add(fname.strip())
+                    allfiles.update(self._prov_filenames(filenames))
 
         result = []
         if len(allfiles) > 0:
             # build a map between filenames (with compression extension) and desfile ID
-            gtt_name = self.load_filename_gtt(allfiles)
-            sqlstr = """SELECT f.filename || f.compression, d.ID
-                FROM DESFILE d, %s f
-                WHERE d.filename=f.filename and
-                      nullcmp(d.compression, f.compression) = 1""" % (gtt_name)
-            cursor = self.cursor()
-            cursor.execute(sqlstr)
-            result = cursor.fetchall()
-            cursor.close()
-            self.empty_gtt(gtt_name)
-
-            return dict(result)
+            ids = self.get_desfile_ids(allfiles)
+            filemap = {}
+            for fname in allfiles:
+                (filename, compression) = filename_gtt_key(fname)
+                if (filename, compression) in ids:
+                    filemap[fname] = ids[(filename, compression)]
+            return filemap
         else:
             return result
     # end get_filename_id_map
 
+    @staticmethod
+    def _prov_filenames(filenames):
+        """Split PROV_DELIM separated filenames, removing repeats and blanks.
+        """
+        names = OrderedDict()
+        for fname in filenames.split(provdefs.PROV_DELIM):
+            fname = fname.strip()
+            if len(fname) > 0:
+                names[fname] = True
+        return list(names.keys())
+
+    def _get_existing_prov_pairs(self, table, cols, pairs):
+        """Return set of given (cols[0], cols[1]) id pairs already in table.
+
+        Queries once for the rows having ids of the given pairs in both
+        columns (a file used by many jobs, e.g. a flat, has many rows
+        with other files).
+        """
+        if len(pairs) == 0:
+            return set()
+
+        ids = set([pair[0] for pair in pairs]) | set([pair[1] for pair in pairs])
+        self.empty_gtt(dmdbdefs.DB_GTT_ID)
+        gtt_name = self.load_id_gtt(list(ids))
+        sql = """select t.%s, t.%s from %s t
+                 where t.%s in (select id from %s) and t.%s in (select id from %s)""" % \
+              (cols[0], cols[1], table, cols[0], gtt_name, cols[1], gtt_name)
+        curs = self.cursor()
+        curs.execute(sql)
+        existing = set()
+        for row in curs:
+            pair = (int(row[0]), int(row[1]))
+            if pair in pairs:
+                existing.add(pair)
+        curs.close()
+        self.empty_gtt(gtt_name)
+        return existing
+
+    def _insert_new_prov_pairs(self, table, cols, pairs):
+        """Insert given id pairs not already in table.
+
+        Returns number of rows inserted.
+        """
+        existing = self._get_existing_prov_pairs(table, cols, pairs)
+        data = [list(pair) for pair in pairs if pair not in existing]
+        if miscutils.fwdebug_check(6, 'FILEMGMT_DEBUG'):
+            miscutils.fwdebug_print("%s: %s pairs, %s already in table" %
+                                    (table, len(pairs), len(existing)))
+        if len(data) > 0:
+            sql = "insert into %s (%s,%s) values (%s,%s)" % \
+                  (table, cols[0], cols[1], self.get_positional_bind_string(1),
+                   self.get_positional_bind_string(2))
+            curs = self.cursor()
+            curs.executemany(sql, data)
+            curs.close()
+        return len(data)
+
     def ingest_provenance(self, prov, execids):
         """Save provenance to OPM tables.
-        """
-        insert_sql = """insert into %s d (%s) select %s,%s %s where not exists(
-                    select * from %s n where n.%s=%s and n.%s=%s)"""
 
-        data = []
-        bind_str = self.get_positional_bind_string()
-        cursor = self.cursor()
+        Pairs already in the tables (or repeated in prov) are only saved once.
+        """
         filemap = self.get_filename_id_map(prov)
         if miscutils.fwdebug_check(6, 'FILEMGMT_DEBUG'):
             miscutils.fwdebug_print("filemap = %s" % filemap)
@@ -748,49 +1812,21 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
             if miscutils.fwdebug_check(6, 'FILEMGMT_DEBUG'):
                 miscutils.fwdebug_print("ingesting used provenance")
 
+            pairs = OrderedDict()
             for execname, filenames in prov[provdefs.PROV_USED].items():
-                for fname in filenames.split(provdefs.PROV_DELIM):
-                    rowdata = []
-                    rowdata.append(execids[execname])
-                    rowdata.append(filemap[fname.strip()])
-                    rowdata.append(execids[execname])
-                    rowdata.append(filemap[fname.strip()])
-                    data.append(rowdata)
+                for fname in self._prov_filenames(filenames):
+                    pairs[(int(execids[execname]), int(filemap[fname]))] = True
             if miscutils.fwdebug_check(6, 'FILEMGMT_DEBUG'):
-                miscutils.fwdebug_print("Number of used records to ingest = %s" % len(data))
-            exec_sql = insert_sql % (fmdefs.PROV_USED_TABLE,
-                                     fmdefs.PROV_TASK_ID + "," + fmdefs.PROV_FILE_ID,
-                                     bind_str, bind_str, self.from_dual(),
-                                     fmdefs.PROV_USED_TABLE, fmdefs.PROV_TASK_ID, bind_str,
-                                     fmdefs.PROV_FILE_ID, bind_str)
-            cursor.executemany(exec_sql, data)
+                miscutils.fwdebug_print("Number of used records to ingest = %s" % len(pairs))
+            cnt = self._insert_new_prov_pairs(fmdefs.PROV_USED_TABLE,
+                                              [fmdefs.PROV_TASK_ID, fmdefs.PROV_FILE_ID], pairs)
             if miscutils.fwdebug_check(6, 'FILEMGMT_DEBUG'):
-                miscutils.fwdebug_print("Number of used rows inserted = %s" % cursor.rowcount)
-            data = []
-
-#        if provdefs.PROV_WGB in prov:
-#            for execname, filenames in prov[provdefs.PROV_WGB].iteritems():
-#                if miscutils.fwdebug_check(6, 'FILEMGMT_DEBUG'):
-#                    miscutils.fwdebug_print("execname = %s" % execname)
-#                    miscutils.fwdebug_print("filenames = %s" % filenames)
-#                for fname in filenames.split(provdefs.PROV_DELIM):
-#                    rowdata = []
-#                    rowdata.append(execids[execname])
-#                    rowdata.append(filemap[fname.strip()])
-#                    rowdata.append(execids[execname])
-#                    rowdata.append(filemap[fname.strip()])
-#                    data.append(rowdata)
-#            exec_sql = insert_sql % (fmdefs.PROV_WGB_TABLE,
-#                                     fmdefs.PROV_TASK_ID + "," + fmdefs.DESFILE_ID,
-#                                     bind_str, bind_str, self.from_dual(),
-#                                     fmdefs.PROV_WGB_TABLE, fmdefs.PROV_TASK_ID, bind_str,
-#                                     fmdefs.DESFILE_ID, bind_str)
-#            cursor.executemany(exec_sql, data)
-#            data = []
+                miscutils.fwdebug_print("Number of used rows inserted = %s" % cnt)
 
         if provdefs.PROV_WDF in prov:
             if miscutils.fwdebug_check(3, 'FILEMGMT_DEBUG'):
                 miscutils.fwdebug_print("ingesting wdf provenance")
+            pairs = OrderedDict()
             for tuples in list(prov[provdefs.PROV_WDF].values()):
                 if miscutils.fwdebug_check(6, 'FILEMGMT_DEBUG'):
                     miscutils.fwdebug_print("tuples = %s" % tuples)
@@ -804,27 +1840,22 @@ class FileMgmtDB(desdmdbi.DesDmDbi):
                                     (provdefs.PROV_CHILDREN, provdefs.PROV_WDF),
                                     fmdefs.FM_EXIT_FAILURE)
                 else:
-                    for parentfile in tuples[provdefs.PROV_PARENTS].split(provdefs.PROV_DELIM):
-                        for childfile in tuples[provdefs.PROV_CHILDREN].split(provdefs.PROV_DELIM):
-                            rowdata = []
-                            rowdata.append(filemap[parentfile.strip()])
-                            rowdata.append(filemap[childfile.strip()])
-                            rowdata.append(filemap[parentfile.strip()])
-                            rowdata.append(filemap[childfile.strip()])
-                            data.append(rowdata)
-
-            exec_sql = insert_sql % (fmdefs.PROV_WDF_TABLE,
-                                     fmdefs.PROV_PARENT_ID + "," + fmdefs.PROV_CHILD_ID,
-                                     bind_str, bind_str, self.from_dual(),
-                                     fmdefs.PROV_WDF_TABLE, fmdefs.PROV_PARENT_ID,
-                                     bind_str, fmdefs.PROV_CHILD_ID,
-                                     bind_str)
-            if len(data) > 0:
+                    parentids = [int(filemap[fname]) for fname in
+                                 self._prov_filenames(tuples[provdefs.PROV_PARENTS])]
+                    childids = [int(filemap[fname]) for fname in
+                                self._prov_filenames(tuples[provdefs.PROV_CHILDREN])]
+                    for parentid in parentids:
+                        for childid in childids:
+                            pairs[(parentid, childid)] = True
+
+            if len(pairs) > 0:
                 if miscutils.fwdebug_check(6, 'FILEMGMT_DEBUG'):
-                    miscutils.fwdebug_print("Number of wdf rows to insert = %s" % len(data))
-                cursor.executemany(exec_sql, data)
+                    miscutils.fwdebug_print("Number of wdf rows to insert = %s" % len(pairs))
+                cnt = self._insert_new_prov_pairs(fmdefs.PROV_WDF_TABLE,
+                                                  [fmdefs.PROV_PARENT_ID, fmdefs.PROV_CHILD_ID],
+                                                  pairs)
                 if miscutils.fwdebug_check(6, 'FILEMGMT_DEBUG'):
-                    miscutils.fwdebug_print("Number of wdf rows inserted = %s" % cursor.rowcount)
+                    miscutils.fwdebug_print("Number of wdf rows inserted = %s" % cnt)
             else:
                 miscutils.fwdebug_print("Warn: %s section given but had 0 valid entries" %
                                         (provdefs.PROV_WDF))
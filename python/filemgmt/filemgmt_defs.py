@@ -3,12 +3,18 @@ META_HEADERS = 'h'
 META_COMPUTE = 'c'
 META_WCL = 'w'
 META_COPY = 'p'
+META_FILENAME = 'f'
 META_REQUIRED = 'r'
 META_OPTIONAL = 'o'
 
 FILETYPE_METADATA = 'filetype_metadata'
 FILE_HEADER_INFO = 'file_header'
 
+# config value choosing how FITS headers are read for metadata
+FITS_HEADER_BACKEND = 'fits_header_backend'
+FITS_BACKEND_ASTROPY = 'astropy'   # astropy HDUList/Header
+FITS_BACKEND_SCAN = 'scan'         # header blocks only (filemgmt.fits_headers)
+
 USE_HOME_ARCHIVE_INPUT = 'use_home_archive_input'
 USE_HOME_ARCHIVE_OUTPUT = 'use_home_archive_output'
 
@@ -17,6 +23,55 @@ FM_PREFER_COMPRESSED = ['.fz', '.gz', None]
 FM_UNCOMPRESSED_ONLY = [None]
 FM_COMPRESSED_ONLY = ['.fz', '.gz']
 
+# number of files whose DESFILE/metadata rows are inserted together
+FM_REGISTER_BATCH_SIZE = 500
+
+# max number of files waiting between stages of a registration pipeline
+FM_PIPELINE_QUEUE_SIZE = 1000
+
+# number of threads listing directories at the same time (see dirwalk)
+FM_WALK_THREADS = 8
+
+# default number of processes validating raw files (config raw_validate_workers)
+FM_RAW_VALIDATE_WORKERS = 4
+
+# how worker processes are started (not fork: the parent has a DB connection
+# and threads)
+FM_WORKER_START_METHOD = 'forkserver'
+
+# max number of files whose headers are kept in a HeaderCache
+FM_HEADER_CACHE_SIZE = 100
+
+# rows fetched at a time when reading archive info (config archive_info_arraysize)
+FM_ARCHIVE_INFO_ARRAYSIZE = 10000
+
+# max number of file locations kept by FileMgmtDB (config location_cache_size, 0 = no cache)
+FM_LOCATION_CACHE_SIZE = 0
+
+# seconds a cached file location is used (config location_cache_ttl, 0 = no expiry)
+FM_LOCATION_CACHE_TTL = 600
+
+# max number of DESFILE ids FileMgmtDB remembers (config desfile_id_map_size)
+FM_DESFILE_ID_MAP_SIZE = 100000
+
+# seconds a pooled DB handle can be idle before it is closed (see dbpool)
+FM_DBPOOL_MAX_IDLE_TIME = 300
+
+# max number of idle DB handles pooled per class, des_services and section
+FM_DBPOOL_MAX_IDLE = 2
+
+# directory under the user's cache dir holding DB config caches (see config_cache)
+FM_CONFIG_CACHE_SUBDIR = 'filemgmt'
+
+# tables whose contents FileMgmtDB reads as config (get_db_config)
+FM_CONFIG_TABLES = ['OPS_ARCHIVE', 'OPS_FILETYPE', 'OPS_FILETYPE_METADATA', 'OPS_METADATA',
+                    'OPS_FILE_HEADER']
+
+# registration status of a file (see FileMgmtDB.get_registration_status)
+FM_STATUS_METADATA = 'metadata'   # has DESFILE/metadata row
+FM_STATUS_CONTENTS = 'contents'   # contents ingested (always True if filetype has none)
+FM_STATUS_ARCHIVE = 'archive'     # location in FILE_ARCHIVE_INFO
+
 FM_EXIT_SUCCESS = 0
 FM_EXIT_FAILURE = 1
 FW_MSG_ERROR = 3
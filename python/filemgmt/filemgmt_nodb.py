@@ -13,6 +13,7 @@ import despymisc.miscutils as miscutils
 import filemgmt.filemgmt_defs as fmdefs
 import filemgmt.errors as fmerrs
 import filemgmt.utils as fmutils
+import filemgmt.dirwalk as dirwalk
 
 
 class FileMgmtNoDB ():
@@ -102,11 +103,11 @@ class FileMgmtNoDB ():
         root = self.config['archive'][arname]['root']
         root = root.rstrip("/")  # canonicalize - remove trailing / to ensure
 
-        for (dirpath, dirnames, filenames) in os.walk(root, followlinks=True):
-            for fname in filenames:
+        for (dirpath, _, files) in dirwalk.walk(root, followlinks=True, stat_files=True):
+            for entry in files:
                 d = {}
-                (d['filename'], d['compression']) = miscutils.parse_fullname(fname, 3)
-                d['filesize'] = os.path.getsize("%s/%s" % (dirpath, fname))
+                (d['filename'], d['compression']) = miscutils.parse_fullname(entry.name, 3)
+                d['filesize'] = entry.stat().st_size
                 d['path'] = dirpath[len(root)+1:]
                 if d['compression'] is None:
                     compext = ""
@@ -157,11 +158,11 @@ class FileMgmtNoDB ():
         root = root.rstrip("/")  # canonicalize - remove trailing / to ensure
 
         list_by_name = {}
-        for (dirpath, dirnames, filenames) in os.walk(root + '/' + path):
-            for fname in filenames:
+        for (dirpath, _, files) in dirwalk.walk(root + '/' + path, stat_files=True):
+            for entry in files:
                 d = {}
-                (d['filename'], d['compression']) = miscutils.parse_fullname(fname, 3)
-                d['filesize'] = os.path.getsize("%s/%s" % (dirpath, fname))
+                (d['filename'], d['compression']) = miscutils.parse_fullname(entry.name, 3)
+                d['filesize'] = entry.stat().st_size
                 d['path'] = dirpath[len(root)+1:]
                 if d['compression'] is None:
                     compext = ""
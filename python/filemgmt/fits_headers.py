@@ -0,0 +1,524 @@
+"""Read FITS headers without astropy HDU objects.
+
+read_headers_md5 reads the file once from start to end, giving every byte
+to the md5 digest, parsing header blocks and only checksumming data.
+scan_headers reads just the header blocks, seeking past the data.
+
+Headers are either astropy Headers or ScannedHeaders, a light-weight
+header which only parses the cards of keywords asked for.  The returned
+HeaderList can be used where metadata code expects an astropy HDUList
+(hdulist[0].header, hdulist['SCI'].header, ...).
+"""
+
+import hashlib
+import os
+import re
+
+from astropy.io import fits
+
+BLOCK_SIZE = 2880   # FITS logical record
+CARD_SIZE = 80
+
+COMMENTARY_KEYWORDS = ('COMMENT', 'HISTORY', '')
+
+_STRING_RE = re.compile(r"\s*'((?:[^']|'')*)'")
+_INT_RE = re.compile(r"[+-]?\d+$")
+
+# tile compressed image (BINTABLE with ZIMAGE = T) keywords holding the image's keywords
+_COMPRESSED_KEYWORDS = {'ZSIMPLE': 'SIMPLE', 'ZTENSION': 'XTENSION', 'ZBITPIX': 'BITPIX',
+                        'ZNAXIS': 'NAXIS', 'ZPCOUNT': 'PCOUNT', 'ZGCOUNT': 'GCOUNT',
+                        'ZEXTEND': 'EXTEND', 'ZBLOCKED': 'BLOCKED',
+                        'ZHECKSUM': 'CHECKSUM', 'ZDATASUM': 'DATASUM'}
+_COMPRESSED_ZNAXIS_RE = re.compile(r"ZNAXIS(\d+)$")
+# keywords which only describe the table of a tile compressed image
+_COMPRESSED_TABLE_RE = re.compile(r"(XTENSION|BITPIX|NAXIS\d*|PCOUNT|GCOUNT|TFIELDS|THEAP|"
+                                  r"CHECKSUM|DATASUM|ZIMAGE|ZCMPTYPE|ZQUANTIZ|ZDITHER0|"
+                                  r"ZMASKCMP|(TTYPE|TFORM|TUNIT|TNULL|TSCAL|TZERO|TDISP|"
+                                  r"TDIM|ZTILE|ZNAME|ZVAL)\d+)$")
+
+
+class HeaderHDU(object):
+    """Header (and where the data is) of a single HDU.
+    """
+
+    def __init__(self, fullname, index, header, header_offset, data_offset, data_size):
+        self.fullname = fullname
+        self.index = index
+        self.header = header
+        self.header_offset = header_offset
+        self.data_offset = data_offset
+        self.data_size = data_size     # padded to BLOCK_SIZE
+
+        if index == 0:
+            self.name = 'PRIMARY'
+        else:
+            self.name = str(header.get('EXTNAME', '')).strip().upper()
+        self.ver = header.get('EXTVER', 1)
+
+    @property
+    def data(self):
+        """Read data of this HDU from file (only done if asked for).
+        """
+        hdulist = fits.open(self.fullname, memmap=False)
+        try:
+            data = hdulist[self.index].data
+        finally:
+            hdulist.close()
+        return data
+
+
+class HeaderList(object):
+    """List of HeaderHDUs indexable like an astropy HDUList.
+
+    fileid is (inode, mtime in ns, size) of the file when it was read, and
+    complete is False if only the first HDUs were read.
+    """
+
+    def __init__(self, fullname, hdus, fileid=None, complete=True):
+        self.fullname = fullname
+        self.hdus = hdus
+        self.fileid = fileid
+        self.complete = complete
+
+    def __len__(self):
+        return len(self.hdus)
+
+    def __iter__(self):
+        return iter(self.hdus)
+
+    def __contains__(self, key):
+        try:
+            self.index_of(key)
+        except (KeyError, IndexError):
+            return False
+        return True
+
+    def __getitem__(self, key):
+        return self.hdus[self.index_of(key)]
+
+    def index_of(self, key):
+        """Return index of HDU given its index or (case-insensitive) EXTNAME.
+        """
+        if isinstance(key, int):
+            if key < -len(self.hdus) or key >= len(self.hdus):
+                raise IndexError("Extension %s is out of bound or not found." % key)
+            return key
+
+        name = str(key).strip().upper()
+        for hdu in self.hdus:
+            if hdu.name == name:
+                return hdu.index
+        raise KeyError("Extension '%s' not found." % key)
+
+    def close(self):
+        """Nothing to close (file is closed once read), for HDUList compatibility.
+        """
+        pass
+
+
+def normalize_keyword(key):
+    """Upper case keyword without any HIERARCH prefix.
+    """
+    key = key.strip().upper()
+    if key.startswith('HIERARCH '):
+        key = key[9:].strip()
+    return key
+
+
+def card_keyword(card):
+    """Return keyword of an 80 character card (HIERARCH prefix removed).
+    """
+    key = card[:8].rstrip().upper()
+    if key == 'HIERARCH':
+        equal = card.find('=')
+        if equal > 0:
+            key = card[9:equal].strip().upper()
+    return key
+
+
+def convert_value(valstr):
+    """Convert a non-string value as written in a card to python type.
+    """
+    if valstr == '':
+        return None
+    if valstr == 'T':
+        return True
+    if valstr == 'F':
+        return False
+    if _INT_RE.match(valstr):
+        return int(valstr)
+    try:
+        return float(valstr.replace('D', 'E').replace('d', 'e'))
+    except ValueError:
+        pass
+    if valstr.startswith('(') and valstr.endswith(')'):
+        try:
+            (real, imag) = valstr[1:-1].split(',')
+            return complex(convert_value(real.strip()), convert_value(imag.strip()))
+        except (ValueError, TypeError):
+            pass
+    return valstr
+
+
+def parse_value(valstr):
+    """Split the value part of a card into (value, comment).
+    """
+    match = _STRING_RE.match(valstr)
+    if match:
+        value = match.group(1).replace("''", "'").rstrip()
+        rest = valstr[match.end():]
+    else:
+        slash = valstr.find('/')
+        if slash < 0:
+            (value, rest) = (valstr, '')
+        else:
+            (value, rest) = (valstr[:slash], valstr[slash:])
+        value = convert_value(value.strip())
+
+    rest = rest.strip()
+    if rest.startswith('/'):
+        comment = rest[1:].strip()
+    else:
+        comment = ''
+    return value, comment
+
+
+def parse_card(card, nextcards=()):
+    """Return (keyword, value, comment) of an 80 character card.
+
+    Long string values are joined with their CONTINUE cards, which must
+    be at the start of nextcards (the cards following this one).   Commentary cards (and cards without a
+    value) return their text as value and None as comment.
+    """
+    key = card_keyword(card)
+    if card[:8].rstrip().upper() == 'HIERARCH' and '=' in card:
+        valstr = card[card.find('=') + 1:]
+    elif key not in COMMENTARY_KEYWORDS and card[8:10] == '= ':
+        valstr = card[10:]
+    else:
+        return key, card[8:].rstrip(), None
+
+    (value, comment) = parse_value(valstr)
+    continued = False
+    for nextcard in nextcards:
+        if not isinstance(value, str) or not value.endswith('&') or \
+                nextcard[:8].rstrip().upper() != 'CONTINUE':
+            break
+        (contvalue, contcomment) = parse_value(nextcard[8:])
+        if not isinstance(contvalue, str):
+            break
+        value = value[:-1] + contvalue
+        continued = True
+        if contcomment:
+            comment = (comment + ' ' + contcomment).strip()
+    if continued:
+        value = value.rstrip()
+    return key, value, comment
+
+
+class _HeaderComments(object):
+    """Read-only mapping of keyword to comment (like astropy's hdr.comments).
+    """
+
+    def __init__(self, header):
+        self.header = header
+
+    def __getitem__(self, key):
+        return self.header.get_card(key)[2]
+
+    def __contains__(self, key):
+        return key in self.header
+
+
+class ScannedHeader(object):
+    """Header of a single HDU whose cards are parsed when asked for.
+
+    Looks up like an astropy Header (hdr[key], hdr.get, key in hdr,
+    hdr.comments[key]).   For repeated keywords the first card is used.
+    """
+
+    def __init__(self, hdrstr):
+        self.cardstrs = []
+        self.index = {}     # keyword -> position of card in cardstrs
+        for pos in range(0, len(hdrstr), CARD_SIZE):
+            card = hdrstr[pos:pos+CARD_SIZE]
+            key = card_keyword(card)
+            if key == 'END':
+                break
+            if key not in self.index and key not in COMMENTARY_KEYWORDS and \
+                    key != 'CONTINUE':
+                self.index[key] = len(self.cardstrs)
+            self.cardstrs.append(card)
+        self.parsed = {}
+        self.comments = _HeaderComments(self)
+
+    def get_card(self, key):
+        """Return (keyword, value, comment) for given keyword.
+        """
+        nkey = normalize_keyword(key)
+        if nkey not in self.parsed:
+            try:
+                pos = self.index[nkey]
+            except KeyError:
+                raise KeyError("Keyword '%s' not found." % key)
+            self.parsed[nkey] = parse_card(self.cardstrs[pos], self.cardstrs[pos+1:])
+        return self.parsed[nkey]
+
+    def __getitem__(self, key):
+        return self.get_card(key)[1]
+
+    def get(self, key, default=None):
+        """Return value of keyword or default if not in header.
+        """
+        try:
+            return self.get_card(key)[1]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return normalize_keyword(key) in self.index
+
+    def __len__(self):
+        return len(self.cardstrs)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        """Return the (non-commentary) keywords in header order.
+        """
+        return sorted(self.index, key=self.index.get)
+
+    def all_keywords(self):
+        """Return the keywords of all cards in header order (like astropy's keys()).
+
+        Includes commentary keywords and repeated keywords.
+        """
+        return [card_keyword(card) for card in self.cardstrs
+                if card_keyword(card) != 'CONTINUE']
+
+    def items(self):
+        """Return (keyword, value) of the non-commentary cards.
+        """
+        return [(key, self[key]) for key in self.keys()]
+
+    @property
+    def cards(self):
+        """All cards as (keyword, value, comment) including commentary cards.
+        """
+        cards = []
+        for pos, card in enumerate(self.cardstrs):
+            if card_keyword(card) != 'CONTINUE':
+                cards.append(parse_card(card, self.cardstrs[pos+1:]))
+        return cards
+
+
+class LazyHDUList(object):
+    """HDUList proxy which only opens the file when an HDU is first needed.
+
+    opener is called (once) with no arguments to open the file and must
+    return an astropy HDUList or a HeaderList.
+    """
+
+    def __init__(self, fullname, opener):
+        self.fullname = fullname
+        self.opener = opener
+        self.hdulist = None
+
+    @property
+    def opened(self):
+        """Whether the file has been opened.
+        """
+        return self.hdulist is not None
+
+    def _open(self):
+        if self.hdulist is None:
+            self.hdulist = self.opener()
+        return self.hdulist
+
+    def __len__(self):
+        return len(self._open())
+
+    def __iter__(self):
+        return iter(self._open())
+
+    def __contains__(self, key):
+        return key in self._open()
+
+    def __getitem__(self, key):
+        return self._open()[key]
+
+    def __getattr__(self, name):
+        # anything else (e.g., index_of, info) comes from the opened list
+        if name in ('fullname', 'opener', 'hdulist'):
+            raise AttributeError(name)
+        return getattr(self._open(), name)
+
+    def close(self):
+        """Close the file if it was opened.
+        """
+        if self.hdulist is not None:
+            self.hdulist.close()
+
+
+def image_keywords(header):
+    """Return keywords of header the way astropy shows them when opening the file.
+
+    For tile compressed images, these are the keywords of the image
+    header instead of those of the table holding the compressed image.
+    """
+    if isinstance(header, ScannedHeader):
+        keys = header.all_keywords()
+    else:
+        keys = list(header.keys())
+    if header.get('ZIMAGE', False) is not True:
+        return keys
+
+    imgkeys = []
+    for key in keys:
+        match = _COMPRESSED_ZNAXIS_RE.match(key)
+        if key in _COMPRESSED_KEYWORDS:
+            imgkeys.append(_COMPRESSED_KEYWORDS[key])
+        elif match:
+            imgkeys.append('NAXIS%s' % match.group(1))
+        elif not _COMPRESSED_TABLE_RE.match(key):
+            imgkeys.append(key)
+
+    if 'SIMPLE' not in imgkeys:
+        for key in ['XTENSION', 'PCOUNT', 'GCOUNT']:
+            if key not in imgkeys:
+                imgkeys.append(key)
+    return imgkeys
+
+
+def astropy_header(hdrstr):
+    """Parse header string with astropy.
+    """
+    return fits.Header.fromstring(hdrstr)
+
+
+def has_end_card(block):
+    """Whether a header block contains the END card.
+    """
+    for pos in range(0, len(block), CARD_SIZE):
+        if block[pos:pos+8].rstrip() == b'END':
+            return True
+    return False
+
+
+def decode_header(hdrbytes):
+    """Convert header bytes to str replacing any non-ascii characters.
+    """
+    try:
+        return hdrbytes.decode('ascii')
+    except UnicodeDecodeError:
+        return bytes([c if c < 128 else ord('?') for c in hdrbytes]).decode('ascii')
+
+
+def data_size(header):
+    """Size in bytes of the data following given header, padded to BLOCK_SIZE.
+    """
+    naxis = header.get('NAXIS', 0)
+    if naxis == 0:
+        return 0
+
+    dims = [header.get('NAXIS%d' % i, 0) for i in range(1, naxis + 1)]
+    if header.get('GROUPS', False) and dims[0] == 0:   # random groups
+        dims = dims[1:]
+
+    npix = 1
+    for dim in dims:
+        npix *= dim
+
+    size = abs(header['BITPIX']) // 8 * header.get('GCOUNT', 1) * \
+        (header.get('PCOUNT', 0) + npix)
+    return ((size + BLOCK_SIZE - 1) // BLOCK_SIZE) * BLOCK_SIZE
+
+
+def open_file_id(fitsfh):
+    """Return (inode, mtime in ns, size) of an open file.
+    """
+    fstat = os.fstat(fitsfh.fileno())
+    return (fstat.st_ino, fstat.st_mtime_ns, fstat.st_size)
+
+
+def read_hdus(fitsfh, fullname, make_header, md5=None, max_hdus=None, blksize=2**20):
+    """Read headers from an open FITS file returning list of HeaderHDUs.
+
+    With md5, every byte read is given to it and data is read (and
+    checksummed) instead of skipped.
+    """
+    hdus = []
+    offset = fitsfh.tell()
+    while max_hdus is None or len(hdus) < max_hdus:
+        header_offset = offset
+        block = fitsfh.read(BLOCK_SIZE)
+        if not block:
+            break
+        if md5 is not None:
+            md5.update(block)
+        offset += len(block)
+
+        expected = b'SIMPLE' if len(hdus) == 0 else b'XTENSION'
+        hdrblocks = [block]
+        complete = len(block) == BLOCK_SIZE and block.startswith(expected)
+        while complete and not has_end_card(block):
+            block = fitsfh.read(BLOCK_SIZE)
+            if md5 is not None:
+                md5.update(block)
+            offset += len(block)
+            hdrblocks.append(block)
+            complete = len(block) == BLOCK_SIZE
+
+        if not complete:
+            if len(hdus) == 0:
+                raise IOError("Empty or corrupt FITS file: %s" % fullname)
+            break
+
+        header = make_header(decode_header(b''.join(hdrblocks)))
+        hdu = HeaderHDU(fullname, len(hdus), header, header_offset, offset,
+                        data_size(header))
+        hdus.append(hdu)
+
+        if md5 is None:
+            offset = fitsfh.seek(hdu.data_size, 1)
+        else:
+            # data is only checksummed
+            remaining = hdu.data_size
+            while remaining > 0:
+                chunk = fitsfh.read(min(blksize, remaining))
+                if not chunk:
+                    break
+                md5.update(chunk)
+                remaining -= len(chunk)
+                offset += len(chunk)
+    return hdus
+
+
+def read_headers_md5(fullname, blksize=2**20, make_header=astropy_header):
+    """Read the headers of all HDUs and the md5sum of given FITS file.
+
+    Returns (HeaderList, md5sum hexdigest).  Like astropy, anything after
+    the last valid HDU is ignored (but included in the md5sum).
+    """
+    md5 = hashlib.md5()
+    with open(fullname, 'rb') as fitsfh:
+        fileid = open_file_id(fitsfh)
+        hdus = read_hdus(fitsfh, fullname, make_header, md5, None, blksize)
+
+        # checksum anything after the last HDU
+        for chunk in iter(lambda: fitsfh.read(blksize), b''):
+            md5.update(chunk)
+
+    return HeaderList(fullname, hdus, fileid), md5.hexdigest()
+
+
+def scan_headers(fullname, max_hdus=None, make_header=ScannedHeader):
+    """Read the headers of given FITS file (first max_hdus only if given).
+
+    Only header blocks are read, data is seeked past.
+    """
+    with open(fullname, 'rb') as fitsfh:
+        fileid = open_file_id(fitsfh)
+        hdus = read_hdus(fitsfh, fullname, make_header, None, max_hdus)
+    return HeaderList(fullname, hdus, fileid, max_hdus is None or len(hdus) < max_hdus)
@@ -35,6 +35,11 @@ class FtMgmtDatafile(FtMgmtGeneric):
 
         return results
 
+    def get_contents_table(self):
+        """Return (table, filename column) checked by has_contents_ingested.
+        """
+        return (self.tablename, 'filename')
+
     def ingest_contents(self, listfullnames, **kwargs):
         """Ingest certain content into a non-metadata table.
         """
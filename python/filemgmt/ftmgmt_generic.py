@@ -6,12 +6,12 @@ Generic filetype management class used to do filetype specific tasks
 """
 
 from collections import OrderedDict
-import copy
 import re
 
 
 import despymisc.miscutils as miscutils
-import despydmdb.dmdb_defs as dmdbdefs
+import filemgmt.filemgmt_defs as fmdefs
+import filemgmt.metadata_plan as metaplan
 
 
 class FtMgmtGeneric(object):
@@ -28,6 +28,15 @@ class FtMgmtGeneric(object):
         self.dbh = dbh
         self.config = config
         self.filepat = filepat
+        self.header_cache = None   # HeaderCache shared with the FileMgmtDB object
+        self.metadata_plan = None  # see get_metadata_plan
+
+    def __getstate__(self):
+        """Drop the DB handle when pickled (e.g., sent to a worker process).
+        """
+        state = self.__dict__.copy()
+        state['dbh'] = None
+        return state
 
     def has_metadata_ingested(self, listfullnames):
         """Check if file has row in metadata table.
@@ -39,12 +48,13 @@ class FtMgmtGeneric(object):
         byfilename = {}
         for fname in listfullnames:
             filename = miscutils.parse_fullname(fname, miscutils.CU_PARSE_FILENAME)
-            byfilename[filename] = fname
+            if filename not in byfilename:
+                byfilename[filename] = []
+            byfilename[filename].append(fname)
 
-        self.dbh.empty_gtt(dmdbdefs.DB_GTT_FILENAME)
         if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
             miscutils.fwdebug_print("Loading filename_gtt with: %s" % list(byfilename.keys()))
-        self.dbh.load_filename_gtt(list(byfilename.keys()))
+        gtt_name = self.dbh.acquire_filename_gtt(list(byfilename.keys()), with_compression=False)
 
         metadata_table = self.config['filetype_metadata'][self.filetype]['metadata_table']
 
@@ -52,7 +62,7 @@ class FtMgmtGeneric(object):
             metadata_table = 'desfile'
 
         dbq = "select m.filename from %s m, %s g where m.filename=g.filename" % \
-            (metadata_table, dmdbdefs.DB_GTT_FILENAME)
+            (metadata_table, gtt_name)
         curs = self.dbh.cursor()
         if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
             miscutils.fwdebug_print("Metadata check query: %s" % dbq)
@@ -60,13 +70,16 @@ class FtMgmtGeneric(object):
 
         results = {}
         for row in curs:
-            results[byfilename[row[0]]] = True
+            # GTT may hold more files (file set)
+            if row[0] in byfilename:
+                for fname in byfilename[row[0]]:
+                    results[fname] = True
 
         for fname in listfullnames:
             if fname not in results:
                 results[fname] = False
 
-        self.dbh.empty_gtt(dmdbdefs.DB_GTT_FILENAME)
+        self.dbh.release_filename_gtt(gtt_name)
 
         if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
             miscutils.fwdebug_print("Metadata check results: %s" % results)
@@ -84,6 +97,14 @@ class FtMgmtGeneric(object):
 
         return results
 
+    def get_contents_table(self):
+        """Return (table, filename column) checked by has_contents_ingested.
+
+        None if contents aren't in a table that can be joined on filename
+        (has_contents_ingested is then called instead).
+        """
+        return None
+
     def check_valid(self, listfullnames):
         """Check if a valid file of the filetype.
         """
@@ -117,6 +138,52 @@ class FtMgmtGeneric(object):
             miscutils.fwdebug_print("INFO: end")
         return metadata
 
+    def reads_md5sum(self, fullname, do_update):
+        """Whether perform_metadata_tasks_md5 computes the file's md5sum.
+        """
+        return False
+
+    def perform_metadata_tasks_md5(self, fullname, do_update, update_info):
+        """Like perform_metadata_tasks, but also returns the md5sum if it was
+        computed while reading the file (else None).
+        """
+        return self.perform_metadata_tasks(fullname, do_update, update_info), None
+
+    def reuses_headers(self):
+        """Whether headers read for metadata are needed again (e.g., contents).
+
+        If so, worker processes reading metadata give them back to be cached.
+        """
+        return False
+
+    def cached_headers(self, fullname, complete=False):
+        """Return file's headers (HeaderList) from the header cache or None.
+        """
+        if self.header_cache is None:
+            return None
+        return self.header_cache.get(fullname, complete)
+
+    def cache_headers(self, headers):
+        """Save headers (HeaderList) read from a file in the header cache.
+        """
+        if self.header_cache is not None:
+            self.header_cache.put(headers)
+
+    def get_metadata_plan(self):
+        """Return the filetype's MetadataPlan (compiled on first use).
+        """
+        if self.metadata_plan is None:
+            metadefs = self.config['filetype_metadata'][self.filetype]
+            if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
+                miscutils.fwdebug_print("INFO: metadefs=%s" % (metadefs))
+            self.metadata_plan = self._compile_metadata_plan(metadefs)
+        return self.metadata_plan
+
+    def _compile_metadata_plan(self, metadefs):
+        """Compile filetype's metadata definition into a MetadataPlan.
+        """
+        return metaplan.MetadataPlan(self.filetype, metadefs)
+
     def _gather_metadata_file(self, fullname, **kwargs):
         """Gather metadata for a single file.
         """
@@ -125,38 +192,32 @@ class FtMgmtGeneric(object):
 
         metadata = OrderedDict()
 
-        metadefs = self.config['filetype_metadata'][self.filetype]
-        if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
-            miscutils.fwdebug_print("INFO: metadefs=%s" % (metadefs))
-        for hdname, hddict in list(metadefs['hdus'].items()):
-            for status_sect in hddict:  # don't worry about missing here, ingest catches
-                # get value from filename
-                if 'f' in hddict[status_sect]:
-                    metakeys = list(hddict[status_sect]['f'].keys())
-                    mdata2 = self._gather_metadata_from_filename(fullname, metakeys)
-                    metadata.update(mdata2)
-
-                # get value from wcl/config
-                if 'w' in hddict[status_sect]:
-                    metakeys = list(hddict[status_sect]['w'].keys())
-                    mdata2 = self._gather_metadata_from_config(fullname, metakeys)
-                    metadata.update(mdata2)
-
-                # get value directly from header
-                if 'h' in hddict[status_sect]:
-                    miscutils.fwdie("ERROR (%s): cannot read values from header %s = %s" %
-                                    (self.__class__.__name__, hdname,
-                                     list(hddict[status_sect]['h'].keys())), 1)
-
-                # calculate value from different header values(s)
-                if 'c' in hddict[status_sect]:
-                    miscutils.fwdie("ERROR (%s): cannot calculate values = %s" %
-                                    (self.__class__.__name__, list(hddict[status_sect]['c'].keys())), 1)
-
-                # copy value from 1 hdu to primary
-                if 'p' in hddict[status_sect]:
-                    miscutils.fwdie("ERROR (%s): cannot copy values between headers = %s" %
-                                    (self.__class__.__name__, list(hddict[status_sect]['p'].keys())), 1)
+        # don't worry about missing here, ingest catches
+        for step in self.get_metadata_plan().steps:
+            # get value from filename
+            if step.section == fmdefs.META_FILENAME:
+                mdata2 = self._gather_metadata_from_filename(fullname, step.keys)
+                metadata.update(mdata2)
+
+            # get value from wcl/config
+            elif step.section == fmdefs.META_WCL:
+                mdata2 = self._gather_metadata_from_config(fullname, step.keys)
+                metadata.update(mdata2)
+
+            # get value directly from header
+            elif step.section == fmdefs.META_HEADERS:
+                miscutils.fwdie("ERROR (%s): cannot read values from header %s = %s" %
+                                (self.__class__.__name__, step.hdname, step.keys), 1)
+
+            # calculate value from different header values(s)
+            elif step.section == fmdefs.META_COMPUTE:
+                miscutils.fwdie("ERROR (%s): cannot calculate values = %s" %
+                                (self.__class__.__name__, step.keys), 1)
+
+            # copy value from 1 hdu to primary
+            elif step.section == fmdefs.META_COPY:
+                miscutils.fwdie("ERROR (%s): cannot copy values between headers = %s" %
+                                (self.__class__.__name__, step.keys), 1)
 
         if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
             miscutils.fwdebug_print("INFO: end")
@@ -191,55 +252,96 @@ class FtMgmtGeneric(object):
         if self.filepat is None:
             raise TypeError("None filepat for filetype %s" % self.filetype)
 
-        # change wcl file pattern into a pattern usable by re
-        newfilepat = copy.deepcopy(self.filepat)
-        varpat = r"\$\{([^$}]+:\d+)\}|\$\{([^$}]+)\}"
-        listvar = []
-        m = re.search(varpat, newfilepat)
-        while m:
-            #print m.group(1), m.group(2)
-            if m.group(1) is not None:
-                m2 = re.search('([^:]+):(\d+)', m.group(1))
-                #print m2.group(1), m2.group(2)
-                listvar.append(m2.group(1))
-
-                # create a pattern that will remove the 0-padding
-                newfilepat = re.sub(r"\${%s}" % (m.group(1)), '(\d{%s})' % m2.group(2), newfilepat)
-            else:
-                newfilepat = re.sub(r"\${%s}" % (m.group(2)), '(\S+)', newfilepat)
-                listvar.append(m.group(2))
+        (filepat_re, listvar) = compile_filepat(self.filepat)
+        return parse_filename_metadata(filepat_re, listvar, fullname, metakeys)
 
-            m = re.search(varpat, newfilepat)
+    def gather_metadata_from_filenames(self, fullnames, metakeys):
+        """Parse many filenames using given filepat.
 
-        # now that have re pattern, parse the filename for values
-        filename = miscutils.parse_fullname(fullname, miscutils.CU_PARSE_FILENAME)
+        Returns dictionary of fullname to dictionary of metadata.
+        """
+        if self.filepat is None:
+            raise TypeError("None filepat for filetype %s" % self.filetype)
 
-        if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
-            miscutils.fwdebug_print("INFO: newfilepat = %s" % newfilepat)
-            miscutils.fwdebug_print("INFO: filename = %s" % filename)
+        (filepat_re, listvar) = compile_filepat(self.filepat)
+        results = {}
+        for fullname in fullnames:
+            results[fullname] = parse_filename_metadata(filepat_re, listvar, fullname, metakeys)
+        return results
 
-        m = re.search(newfilepat, filename)
-        if m is None:
-            miscutils.fwdebug_print("INFO: newfilepat = %s" % newfilepat)
-            miscutils.fwdebug_print("INFO: filename = %s" % filename)
-            raise ValueError("Pattern (%s) did not match filename (%s)" % (newfilepat, filename))
 
-        if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
-            miscutils.fwdebug_print("INFO: m.group() = %s" % m.group())
-            miscutils.fwdebug_print("INFO: listvar = %s" % listvar)
-
-        # only save values parsed from filename that were requested per metakeys
-        mddict = {}
-        for cnt in range(0, len(listvar)):
-            key = listvar[cnt]
-            if key in metakeys:
-                if miscutils.fwdebug_check(6, 'FTMGMT_DEBUG'):
-                    miscutils.fwdebug_print("INFO: saving as metadata key = %s, cnt = %s" % (key, cnt))
-                mddict[key] = m.group(cnt+1)
-            elif miscutils.fwdebug_check(6, 'FTMGMT_DEBUG'):
-                miscutils.fwdebug_print("INFO: skipping key = %s because not in metakeys" % key)
+# wcl file pattern -> (compiled re pattern, list of variable names)
+_FILEPAT_CACHE = {}
 
-        if miscutils.fwdebug_check(6, 'FTMGMT_DEBUG'):
-            miscutils.fwdebug_print("INFO: mddict = %s" % mddict)
 
-        return mddict
+def compile_filepat(filepat):
+    """Change wcl file pattern into a compiled re pattern.
+
+    Returns (compiled pattern, variable names in order of the pattern's
+    groups).  Results are cached as filepats are shared by many files.
+    """
+    if filepat in _FILEPAT_CACHE:
+        return _FILEPAT_CACHE[filepat]
+
+    newfilepat = filepat
+    varpat = r"\$\{([^$}]+:\d+)\}|\$\{([^$}]+)\}"
+    listvar = []
+    m = re.search(varpat, newfilepat)
+    while m:
+        #print m.group(1), m.group(2)
+        if m.group(1) is not None:
+            m2 = re.search(r'([^:]+):(\d+)', m.group(1))
+            #print m2.group(1), m2.group(2)
+            listvar.append(m2.group(1))
+
+            # create a pattern that will remove the 0-padding
+            # (function as replacement so the \d isn't taken as an escape)
+            repl = r'(\d{%s})' % m2.group(2)
+            newfilepat = re.sub(r"\${%s}" % (m.group(1)), lambda _, r=repl: r, newfilepat)
+        else:
+            newfilepat = re.sub(r"\${%s}" % (m.group(2)), lambda _: r'(\S+)', newfilepat)
+            listvar.append(m.group(2))
+
+        m = re.search(varpat, newfilepat)
+
+    if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
+        miscutils.fwdebug_print("INFO: newfilepat = %s" % newfilepat)
+
+    _FILEPAT_CACHE[filepat] = (re.compile(newfilepat), listvar)
+    return _FILEPAT_CACHE[filepat]
+
+
+def parse_filename_metadata(filepat_re, listvar, fullname, metakeys):
+    """Return values for metakeys parsed from filename with compiled pattern.
+    """
+    filename = miscutils.parse_fullname(fullname, miscutils.CU_PARSE_FILENAME)
+
+    if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
+        miscutils.fwdebug_print("INFO: filename = %s" % filename)
+
+    m = filepat_re.search(filename)
+    if m is None:
+        miscutils.fwdebug_print("INFO: newfilepat = %s" % filepat_re.pattern)
+        miscutils.fwdebug_print("INFO: filename = %s" % filename)
+        raise ValueError("Pattern (%s) did not match filename (%s)" %
+                         (filepat_re.pattern, filename))
+
+    if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
+        miscutils.fwdebug_print("INFO: m.group() = %s" % m.group())
+        miscutils.fwdebug_print("INFO: listvar = %s" % listvar)
+
+    # only save values parsed from filename that were requested per metakeys
+    mddict = {}
+    for cnt in range(0, len(listvar)):
+        key = listvar[cnt]
+        if key in metakeys:
+            if miscutils.fwdebug_check(6, 'FTMGMT_DEBUG'):
+                miscutils.fwdebug_print("INFO: saving as metadata key = %s, cnt = %s" % (key, cnt))
+            mddict[key] = m.group(cnt+1)
+        elif miscutils.fwdebug_check(6, 'FTMGMT_DEBUG'):
+            miscutils.fwdebug_print("INFO: skipping key = %s because not in metakeys" % key)
+
+    if miscutils.fwdebug_check(6, 'FTMGMT_DEBUG'):
+        miscutils.fwdebug_print("INFO: mddict = %s" % mddict)
+
+    return mddict
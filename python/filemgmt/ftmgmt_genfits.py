@@ -13,6 +13,9 @@ from filemgmt.ftmgmt_generic import FtMgmtGeneric
 import despymisc.miscutils as miscutils
 import despyfitsutils.fits_special_metadata as spmeta
 import despyfitsutils.fitsutils as fitsutils
+import filemgmt.fits_headers as fitshdrs
+import filemgmt.filemgmt_defs as fmdefs
+import filemgmt.metadata_plan as metaplan
 
 
 class FtMgmtGenFits(FtMgmtGeneric):
@@ -33,11 +36,12 @@ class FtMgmtGenFits(FtMgmtGeneric):
         if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
             miscutils.fwdebug_print("INFO: beg")
 
-        # open file
+        # open file (not until a header is needed unless updating it)
         if do_update:
             hdulist = fits.open(fullname, 'update')
         else:
-            hdulist = fits.open(fullname)
+            hdulist = fitshdrs.LazyHDUList(fullname,
+                                           lambda: self._open_headers(fullname))
 
         # read metadata and call any special calc functions
         metadata, datadefs = self._gather_metadata_file(fullname, hdulist=hdulist)
@@ -50,11 +54,89 @@ class FtMgmtGenFits(FtMgmtGeneric):
 
         # close file
         hdulist.close()
+        if do_update and self.header_cache is not None:
+            self.header_cache.discard(fullname)
 
         if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
             miscutils.fwdebug_print("INFO: end")
         return metadata
 
+    def _open_headers(self, fullname):
+        """Open file for reading headers (cached, scanned or with astropy).
+        """
+        hdulist = None
+        if miscutils.parse_fullname(fullname, miscutils.CU_PARSE_COMPRESSION) is None:
+            # cached headers are as read from disk, so only for uncompressed files
+            hdulist = self.cached_headers(fullname, complete=True)
+
+        if hdulist is None:
+            if self.use_header_scan(fullname):
+                hdulist = fitshdrs.scan_headers(fullname)
+                self.cache_headers(hdulist)
+            else:
+                hdulist = fits.open(fullname)
+        return hdulist
+
+    def needs_headers(self):
+        """Whether any metadata comes from the file (h, c or p sections).
+
+        If not, metadata comes from the filename and config only and the
+        file isn't opened unless its headers are being updated.
+        """
+        return self.get_metadata_plan().needs_headers
+
+    def use_header_scan(self, fullname):
+        """Whether to read headers with the header scanner instead of astropy.
+
+        Set by config value fits_header_backend.  Compressed files always
+        use astropy, which gives the headers of the uncompressed images.
+        """
+        backend = self.config.get(fmdefs.FITS_HEADER_BACKEND, fmdefs.FITS_BACKEND_ASTROPY)
+        if backend == fmdefs.FITS_BACKEND_SCAN:
+            return miscutils.parse_fullname(fullname, miscutils.CU_PARSE_COMPRESSION) is None
+        if backend != fmdefs.FITS_BACKEND_ASTROPY:
+            miscutils.fwdie("Error: invalid %s (%s)" % (fmdefs.FITS_HEADER_BACKEND, backend), 1)
+        return False
+
+    def reads_md5sum(self, fullname, do_update):
+        """Whether perform_metadata_tasks_md5 computes the file's md5sum.
+
+        Only for uncompressed files which aren't being updated (else the
+        md5sum must be of the updated file) and whose metadata comes from
+        the headers.
+        """
+        if do_update or not self.needs_headers():
+            return False
+        return miscutils.parse_fullname(fullname, miscutils.CU_PARSE_COMPRESSION) is None
+
+    def perform_metadata_tasks_md5(self, fullname, do_update, update_info):
+        """Read metadata and md5sum from file in a single pass if possible.
+        """
+        if not self.reads_md5sum(fullname, do_update):
+            return FtMgmtGeneric.perform_metadata_tasks_md5(self, fullname, do_update,
+                                                            update_info)
+
+        # headers already read, so just the md5sum (done by caller) needs the whole file
+        hdulist = self.cached_headers(fullname, complete=True)
+        if hdulist is not None:
+            metadata, _ = self._gather_metadata_file(fullname, hdulist=hdulist)
+            return metadata, None
+
+        if self.use_header_scan(fullname):
+            hdulist, md5sum = fitshdrs.read_headers_md5(fullname,
+                                                        make_header=fitshdrs.ScannedHeader)
+        else:
+            hdulist, md5sum = fitshdrs.read_headers_md5(fullname)
+        self.cache_headers(hdulist)
+        metadata, _ = self._gather_metadata_file(fullname, hdulist=hdulist)
+        hdulist.close()
+        return metadata, md5sum
+
+    def _compile_metadata_plan(self, metadefs):
+        """Compile filetype's metadata definition into a MetadataPlan.
+        """
+        return metaplan.MetadataPlan(self.filetype, metadefs, spmeta)
+
     def _gather_metadata_file(self, fullname, **kwargs):
         """Gather metadata for a single file.
         """
@@ -66,57 +148,37 @@ class FtMgmtGenFits(FtMgmtGeneric):
         metadata = OrderedDict()
         datadef = OrderedDict()
 
-        metadefs = self.config['filetype_metadata'][self.filetype]
-        for hdname, hddict in list(metadefs['hdus'].items()):
-            for status_sect in hddict:  # don't worry about missing here, ingest catches
-                # get value from filename
-                if 'f' in hddict[status_sect]:
-                    metakeys = list(hddict[status_sect]['f'].keys())
-                    mdata2 = self._gather_metadata_from_filename(fullname, metakeys)
-                    metadata.update(mdata2)
-
-                # get value from wcl/config
-                if 'w' in hddict[status_sect]:
-                    metakeys = list(hddict[status_sect]['w'].keys())
-                    mdata2 = self._gather_metadata_from_config(fullname, metakeys)
-                    metadata.update(mdata2)
-
-                # get value directly from header
-                if 'h' in hddict[status_sect]:
-                    if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
-                        miscutils.fwdebug_print("INFO: headers=%s" %
-                                                (list(hddict[status_sect]['h'].keys())))
-                    metakeys = list(hddict[status_sect]['h'].keys())
-                    mdata2, ddef2 = self._gather_metadata_from_header(fullname, hdulist,
-                                                                      hdname, metakeys)
-                    metadata.update(mdata2)
-                    datadef.update(ddef2)
-
-                # calculate value from different header values(s)
-                if 'c' in hddict[status_sect]:
-                    for funckey in list(hddict[status_sect]['c'].keys()):
-                        try:
-                            specmf = getattr(spmeta, 'func_%s' % funckey.lower())
-                        except AttributeError:
+        # don't worry about missing here, ingest catches
+        for step in self.get_metadata_plan().steps:
+            # get value from filename
+            if step.section == fmdefs.META_FILENAME:
+                mdata2 = self._gather_metadata_from_filename(fullname, step.keys)
+                metadata.update(mdata2)
+
+            # get value from wcl/config
+            elif step.section == fmdefs.META_WCL:
+                mdata2 = self._gather_metadata_from_config(fullname, step.keys)
+                metadata.update(mdata2)
+
+            # get value directly from header or copy value from 1 hdu to primary
+            elif step.section == fmdefs.META_HEADERS or step.section == fmdefs.META_COPY:
+                if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
+                    miscutils.fwdebug_print("INFO: headers=%s" % (step.keys))
+                mdata2, ddef2 = self._gather_metadata_from_header(fullname, hdulist,
+                                                                  step.hdname, step.keys)
+                metadata.update(mdata2)
+                datadef.update(ddef2)
+
+            # calculate value from different header values(s)
+            elif step.section == fmdefs.META_COMPUTE:
+                for funckey, specmf in step.funcs:
+                    try:
+                        val = specmf(fullname, hdulist, step.hdname)
+                        metadata[funckey] = val
+                    except KeyError:
+                        if miscutils.fwdebug_check(1, 'FTMGMT_DEBUG'):
                             miscutils.fwdebug_print(
-                                "WARN: Couldn't find func_%s in despyfits.fits_special_metadata" % (funckey))
-
-                        try:
-                            val = specmf(fullname, hdulist, hdname)
-                            metadata[funckey] = val
-                        except KeyError:
-                            if miscutils.fwdebug_check(1, 'FTMGMT_DEBUG'):
-                                miscutils.fwdebug_print(
-                                    "INFO: couldn't create value for key %s in %s header of file %s" % (funckey, hdname, fullname))
-
-                # copy value from 1 hdu to primary
-                if 'p' in hddict[status_sect]:
-                    metakeys = list(hddict[status_sect]['p'].keys())
-                    mdata2, ddef2 = self._gather_metadata_from_header(fullname, hdulist,
-                                                                      hdname, metakeys)
-                    #print 'ddef2 = ', ddef2
-                    metadata.update(mdata2)
-                    datadef.update(ddef2)
+                                "INFO: couldn't create value for key %s in %s header of file %s" % (funckey, step.hdname, fullname))
 
         if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
             miscutils.fwdebug_print("INFO: metadata = %s" % metadata)
@@ -127,48 +189,45 @@ class FtMgmtGenFits(FtMgmtGeneric):
     def _get_update_values_metadata(self, metadata, datadefs):
         """Put metadata values for update in data structure easy to use.
         """
-        metadefs = self.config['filetype_metadata'][self.filetype]
+        plan = self.get_metadata_plan()
         update_info = OrderedDict()
         update_info[0] = OrderedDict()   # update primary header
-
-        for hdname, hddict in list(metadefs['hdus'].items()):
+        for hdname in plan.hdnames:
             update_info[hdname] = OrderedDict()
-            for stdict in list(hddict.values()):
-                # include values created by metadata functions and those copied from other hdu
-                for derived in ['c', 'p', 'w']:
-                    if derived in stdict:
-                        for key in stdict[derived]:
-                            uvalue = ucomment = udatatype = None
-                            # we don't write filetype nor pfw_attempt_id to headers
-                            if key == 'filename':
-                                # write filename to header as DESFNAME
-                                fitscomment = 'DES production filename'
-
-                                # shorten comment if file name is so long the comment won't fit
-                                if len(metadata['filename']) + \
-                                        len('\' / %s' % fitscomment) + \
-                                        len('DESFNAME= \'') > 80:
-                                    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
-                                        miscutils.fwdebug_print("WARN: %s's filename too long for DESFNAME: %s" %
-                                                                (metadata['filename'], len(metadata['filename'])))
-                                        fitscomment = fitscomment[:min(
-                                            len(fitscomment), 80 - len(metadata['filename']) - 16)]
-
-                                update_info[0]['DESFNAME'] = (metadata['filename'], fitscomment, 'str')
-
-                            elif key != 'filetype' and key != 'pfw_attempt_id':
-                                if key in metadata:
-                                    uvalue = metadata[key]
-                                    if key in datadefs:
-                                        ucomment = datadefs[key][0]
-                                        udatatype = datadefs[key][1]
-                                    elif miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
-                                        miscutils.fwdebug_print(
-                                            "WARN: could not find comment for key=%s" % (key))
-                                    update_info[0][key] = (uvalue, ucomment, udatatype)
-                                else:
-                                    miscutils.fwdebug_print(
-                                        "WARN: could not find metadata for key=%s" % (key))
+
+        # values created by metadata functions, copied from other hdu or from wcl
+        for key in plan.update_keys:
+            uvalue = ucomment = udatatype = None
+            # we don't write filetype nor pfw_attempt_id to headers
+            if key == 'filename':
+                # write filename to header as DESFNAME
+                fitscomment = 'DES production filename'
+
+                # shorten comment if file name is so long the comment won't fit
+                if len(metadata['filename']) + \
+                        len('\' / %s' % fitscomment) + \
+                        len('DESFNAME= \'') > 80:
+                    if miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+                        miscutils.fwdebug_print("WARN: %s's filename too long for DESFNAME: %s" %
+                                                (metadata['filename'], len(metadata['filename'])))
+                        fitscomment = fitscomment[:min(
+                            len(fitscomment), 80 - len(metadata['filename']) - 16)]
+
+                update_info[0]['DESFNAME'] = (metadata['filename'], fitscomment, 'str')
+
+            elif key != 'filetype' and key != 'pfw_attempt_id':
+                if key in metadata:
+                    uvalue = metadata[key]
+                    if key in datadefs:
+                        ucomment = datadefs[key][0]
+                        udatatype = datadefs[key][1]
+                    elif miscutils.fwdebug_check(3, "PFWRUNJOB_DEBUG"):
+                        miscutils.fwdebug_print(
+                            "WARN: could not find comment for key=%s" % (key))
+                    update_info[0][key] = (uvalue, ucomment, udatatype)
+                else:
+                    miscutils.fwdebug_print(
+                        "WARN: could not find metadata for key=%s" % (key))
         return update_info
 
     def _get_file_header_key_info(self, key):
@@ -222,16 +281,26 @@ class FtMgmtGenFits(FtMgmtGeneric):
 
     @classmethod
     def _gather_metadata_from_header(cls, fullname, hdulist, hdname, metakeys):
-        """Get values from config.
+        """Get values from header.
+
+        hdulist is an astropy HDUList or a fits_headers.HeaderList.
         """
         metadata = OrderedDict()
         datadef = OrderedDict()
+
+        # find header once instead of for every key
+        try:
+            hdr = fitsutils.get_hdr(hdulist, hdname)
+        except KeyError:
+            hdr = {}
+
         for key in metakeys:
             if miscutils.fwdebug_check(6, 'FTMGMT_DEBUG'):
                 miscutils.fwdebug_print("INFO: key=%s" % (key))
+            ukey = key.upper()
             try:
-                metadata[key] = fitsutils.get_hdr_value(hdulist, key.upper(), hdname)
-                datadef[key] = fitsutils.get_hdr_extra(hdulist, key.upper(), hdname)
+                metadata[key] = hdr[ukey]
+                datadef[key] = (hdr.comments[ukey], type(metadata[key]))
             except KeyError:
                 if miscutils.fwdebug_check(1, 'FTMGMT_DEBUG'):
                     miscutils.fwdebug_print("INFO: didn't find key %s in %s header of file %s" %
@@ -7,11 +7,15 @@ as metadata and content ingestion.
 from datetime import datetime
 from astropy.io import fits
 import os
+import functools
+import concurrent.futures
+import multiprocessing
 
-import despydmdb.dmdb_defs as dmdbdefs
 from filemgmt.ftmgmt_genfits import FtMgmtGenFits
 import despymisc.miscutils as miscutils
 import despymisc.create_special_metadata as spmeta
+import filemgmt.fits_headers as fitshdrs
+import filemgmt.filemgmt_defs as fmdefs
 
 
 class FtMgmtRaw(FtMgmtGenFits):
@@ -34,38 +38,45 @@ class FtMgmtRaw(FtMgmtGenFits):
         byfilename = {}
         for fname in listfullnames:
             filename = miscutils.parse_fullname(fname, miscutils.CU_PARSE_FILENAME)
-            byfilename[filename] = fname
+            if filename not in byfilename:
+                byfilename[filename] = []
+            byfilename[filename].append(fname)
 
-        self.dbh.empty_gtt(dmdbdefs.DB_GTT_FILENAME)
-        self.dbh.load_filename_gtt(list(byfilename.keys()))
+        gtt_name = self.dbh.acquire_filename_gtt(list(byfilename.keys()), with_compression=False)
 
         dbq = "select r.filename from rasicam_decam r, %s g where r.filename=g.filename" % \
-            (dmdbdefs.DB_GTT_FILENAME)
+            (gtt_name)
         curs = self.dbh.cursor()
         curs.execute(dbq)
 
         results = {}
         for row in curs:
-            results[byfilename[row[0]]] = True
+            # GTT may hold more files (file set)
+            if row[0] in byfilename:
+                for fname in byfilename[row[0]]:
+                    results[fname] = True
         for fname in listfullnames:
             if fname not in results:
                 results[fname] = False
 
-        self.dbh.empty_gtt(dmdbdefs.DB_GTT_FILENAME)
+        self.dbh.release_filename_gtt(gtt_name)
 
         return results
 
+    def get_contents_table(self):
+        """Return (table, filename column) checked by has_contents_ingested.
+        """
+        return ('rasicam_decam', 'filename')
+
     def perform_metadata_tasks(self, fullname, do_update, update_info):
         """Read metadata from file, updating file values.
         """
         if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
             miscutils.fwdebug_print("INFO: beg")
 
-        # open file
+        # open file (not until the primary header is needed)
         #hdulist = fits.open(fullname, 'update')
-        primary_hdr = fits.getheader(fullname, 0)
-        prihdu = fits.PrimaryHDU(header=primary_hdr)
-        hdulist = fits.HDUList([prihdu])
+        hdulist = fitshdrs.LazyHDUList(fullname, lambda: self._open_headers(fullname))
 
         # read metadata and call any special calc functions
         metadata, _ = self._gather_metadata_file(fullname, hdulist=hdulist)
@@ -83,6 +94,79 @@ class FtMgmtRaw(FtMgmtGenFits):
             miscutils.fwdebug_print("INFO: end")
         return metadata
 
+    def _open_headers(self, fullname):
+        """Return list with just the primary header (cached, scanned or astropy).
+        """
+        headers = self.cached_headers(fullname)
+        if headers is not None:
+            hdulist = fitshdrs.HeaderList(fullname, headers.hdus[:1])
+        elif self.use_header_scan(fullname):
+            hdulist = fitshdrs.scan_headers(fullname, max_hdus=1)
+            self.cache_headers(hdulist)
+        else:
+            primary_hdr = fits.getheader(fullname, 0)
+            prihdu = fits.PrimaryHDU(header=primary_hdr)
+            hdulist = fits.HDUList([prihdu])
+        return hdulist
+
+    def use_header_scan(self, fullname):
+        """Whether to read headers with the header scanner instead of astropy.
+
+        Only the primary header is used, which is the same in fpacked
+        files, so compressed files can be scanned too.
+        """
+        backend = self.config.get(fmdefs.FITS_HEADER_BACKEND, fmdefs.FITS_BACKEND_ASTROPY)
+        if backend == fmdefs.FITS_BACKEND_SCAN:
+            return True
+        return FtMgmtGenFits.use_header_scan(self, fullname)
+
+    def reads_md5sum(self, fullname, do_update):
+        """Whether perform_metadata_tasks_md5 computes the file's md5sum.
+
+        Raw metadata only comes from the primary header, which is the same
+        in fpacked files, and raw files are never updated.
+        """
+        return self.needs_headers()
+
+    def reuses_headers(self):
+        """Whether headers read for metadata are needed again.
+
+        The primary header is needed again to ingest contents.
+        """
+        return True
+
+    def perform_metadata_tasks_md5(self, fullname, do_update, update_info):
+        """Read metadata and md5sum from file in a single pass.
+
+        If the headers were already read (e.g., by check_valid), the md5sum
+        is left for the caller to compute.
+        """
+        if not self.needs_headers():
+            return self.perform_metadata_tasks(fullname, do_update, update_info), None
+
+        md5sum = None
+        headers = self.cached_headers(fullname)
+        if headers is not None:
+            hdulist = fitshdrs.HeaderList(fullname, headers.hdus[:1])
+        elif self.use_header_scan(fullname):
+            headers, md5sum = fitshdrs.read_headers_md5(fullname,
+                                                        make_header=fitshdrs.ScannedHeader)
+            self.cache_headers(headers)
+            hdulist = fitshdrs.HeaderList(fullname, headers.hdus[:1])
+        else:
+            headers, md5sum = fitshdrs.read_headers_md5(fullname)
+            self.cache_headers(headers)
+            prihdu = fits.PrimaryHDU(header=headers[0].header)
+            hdulist = fits.HDUList([prihdu])
+
+        metadata, _ = self._gather_metadata_file(fullname, hdulist=hdulist)
+
+        if do_update:
+            miscutils.fwdebug_print("WARN: cannot update a raw file's metadata")
+
+        hdulist.close()
+        return metadata, md5sum
+
     def ingest_contents(self, listfullnames, **kwargs):
         """Ingest data into non-metadata table - rasicam_decam.
         """
@@ -103,7 +187,14 @@ class FtMgmtRaw(FtMgmtGenFits):
                 hdulist = kwargs['hdulist']
                 primary_hdr = hdulist[0].header
             else:
-                primary_hdr = fits.getheader(fullname, 0)
+                # last time the headers are needed, so free cache entry
+                headers = self.cached_headers(fullname)
+                if self.header_cache is not None:
+                    self.header_cache.discard(fullname)
+                if headers is not None:
+                    primary_hdr = headers[0].header
+                else:
+                    primary_hdr = fits.getheader(fullname, 0)
 
             row = get_vals_from_header(primary_hdr)
             row['filename'] = filename
@@ -132,31 +223,136 @@ class FtMgmtRaw(FtMgmtGenFits):
 
         miscutils.fwdebug_print("keyfile = %s" % keyfile)
         if keyfile is not None and os.path.exists(keyfile):
-            keywords = {'pri': {}, 'ext': {}}
-            with open(keyfile, 'r') as keyfh:
-                for line in keyfh:
-                    line = line.upper()
-                    (keyname, pri, ext) = miscutils.fwsplit(line, ',')[0:3]
-                    if pri != 'Y' and pri != 'N' and pri != 'R':
-                        raise ValueError('Invalid primary entry in keyword file (%s)' % line)
-                    if ext != 'Y' and ext != 'N' and ext != 'R':
-                        raise ValueError('Invalid extenstion entry in keyword file (%s)' % line)
-                    keywords['pri'][keyname] = pri
-                    keywords['ext'][keyname] = ext
+            rawkeys = load_raw_keywords(keyfile)
 
+            num_workers = int(self.config.get('raw_validate_workers',
+                                              fmdefs.FM_RAW_VALIDATE_WORKERS))
+            # headers read here are cached for reading metadata and contents
+            cached = {}
             for fname in listfullnames:
-                results[fname] = check_single_valid(keywords, fname, 0)
+                headers = self.cached_headers(fname, complete=True)
+                if headers is not None:
+                    cached[fname] = headers
+            toread = [fname for fname in listfullnames if fname not in cached]
+
+            num_workers = min(num_workers, len(toread))
+            if num_workers <= 1:
+                for fname in listfullnames:
+                    headers = cached.get(fname)
+                    if headers is None and self.use_header_scan(fname):
+                        headers = fitshdrs.scan_headers(fname)
+                    results[fname] = check_single_valid(rawkeys, fname, 0, headers)
+                    self.cache_headers(headers)
+            else:
+                # raises the exception of the first invalid file in list order
+                mpcontext = multiprocessing.get_context(fmdefs.FM_WORKER_START_METHOD)
+                with concurrent.futures.ProcessPoolExecutor(num_workers,
+                                                            mp_context=mpcontext) as pool:
+                    readheaders = pool.map(functools.partial(read_valid_headers, rawkeys),
+                                           toread, [self.use_header_scan(fname)
+                                                    for fname in toread],
+                                           chunksize=4)
+                    for fname in listfullnames:
+                        if fname in cached:
+                            headers = cached[fname]
+                            check_single_valid(rawkeys, fname, 0, headers)
+                        else:
+                            headers = next(readheaders)
+                        results[fname] = True
+                        self.cache_headers(headers)
         else:
             raise OSError('Error:  Could not find keywords file')
 
         return results
 
 
-def check_single_valid(keywords, fullname, verbose): # should raise exception if not valid
+# keyword file -> (mtime, RawKeywords)
+_RAW_KEYWORDS_CACHE = {}
+
+
+class RawKeywords(object):
+    """Keyword table from a raw keywords file as sets per HDU type.
+
+    Each line of the file is "keyword, primary status, extension status"
+    where status is R (required), Y (wanted) or N (not wanted).
+    """
+
+    def __init__(self, keywords):
+        # {'pri': {keyword: status}, 'ext': {keyword: status}}
+        self.keywords = keywords
+
+        self.required = {}
+        self.wanted = {}
+        self.allowed = {}
+        for hdutype, keystats in keywords.items():
+            self.required[hdutype] = frozenset([k for k, s in keystats.items() if s == 'R'])
+            self.wanted[hdutype] = frozenset([k for k, s in keystats.items() if s == 'Y'])
+            self.allowed[hdutype] = frozenset([k for k, s in keystats.items() if s != 'N'])
+
+    @staticmethod
+    def hdutype(hdunum):
+        """Return which keyword table applies to given HDU.
+        """
+        if hdunum == 0:
+            return 'pri'
+        return 'ext'
+
+    def missing_required(self, hdunum, hdrkeys):
+        """Return set of required keywords not in hdrkeys (a set).
+        """
+        return self.required[self.hdutype(hdunum)] - hdrkeys
+
+    def check_header(self, hdunum, hdrkeys):
+        """Return (required missing, wanted missing, extra) keywords.
+
+        Same as check_header_keywords, but given the header's keywords.
+        """
+        hdutype = self.hdutype(hdunum)
+        keyset = set(hdrkeys)
+        req_missing = sorted(self.required[hdutype] - keyset)
+        want_missing = sorted(self.wanted[hdutype] - keyset)
+        extra = [keyw for keyw in hdrkeys if keyw not in self.allowed[hdutype]]
+        return (req_missing, want_missing, extra)
+
+
+def load_raw_keywords(keyfile):
+    """Return RawKeywords for given keyword file, parsing it only if it changed.
+    """
+    mtime = os.path.getmtime(keyfile)
+    if keyfile in _RAW_KEYWORDS_CACHE and _RAW_KEYWORDS_CACHE[keyfile][0] == mtime:
+        return _RAW_KEYWORDS_CACHE[keyfile][1]
+
+    keywords = {'pri': {}, 'ext': {}}
+    with open(keyfile, 'r') as keyfh:
+        for line in keyfh:
+            line = line.upper()
+            (keyname, pri, ext) = miscutils.fwsplit(line, ',')[0:3]
+            if pri != 'Y' and pri != 'N' and pri != 'R':
+                raise ValueError('Invalid primary entry in keyword file (%s)' % line)
+            if ext != 'Y' and ext != 'N' and ext != 'R':
+                raise ValueError('Invalid extenstion entry in keyword file (%s)' % line)
+            keywords['pri'][keyname] = pri
+            keywords['ext'][keyname] = ext
+
+    rawkeys = RawKeywords(keywords)
+    _RAW_KEYWORDS_CACHE[keyfile] = (mtime, rawkeys)
+    return rawkeys
+
+
+def check_single_valid(keywords, fullname, verbose, hdulist=None): # should raise exception if not valid
     """Check whether the given file is a valid raw file.
+
+    keywords is a RawKeywords or a dictionary as used by check_header_keywords.
+    The file is opened with astropy unless its headers are given as
+    hdulist (e.g., from fits_headers.scan_headers).
     """
+    if not isinstance(keywords, RawKeywords):
+        keywords = RawKeywords(keywords)
+
     # check fits file
-    hdulist = fits.open(fullname)
+    if hdulist is None:
+        with fits.open(fullname) as fitslist:
+            return check_single_valid(keywords, fullname, verbose, fitslist)
     prihdr = hdulist[0].header
 
     # check exposure has correct filename (sometimes get NOAO-science-archive renamed exposures)
@@ -178,23 +374,39 @@ def check_single_valid(keywords, fullname, verbose): # should raise exception if
     if num_hdus != req_num_hdus:
         raise ValueError('Error:  Invalid number of hdus (%s)' % num_hdus)
 
-    # check keywords
+    # check keywords (as seen in the uncompressed image headers)
     for hdunum in range(0, num_hdus):
-        hdr = hdulist[hdunum].header
-        (req, want, extra) = check_header_keywords(keywords, hdunum, hdr)
+        hdrkeys = fitshdrs.image_keywords(hdulist[hdunum].header)
 
         if verbose > 1:
+            (req, want, extra) = keywords.check_header(hdunum, hdrkeys)
             if want is not None and len(want) > 0:
                 print("HDU #%02d Missing requested keywords: %s" % (hdunum, want))
             if extra is not None and len(extra) > 0:
                 print("HDU #%02d Extra keywords: %s" % (hdunum, extra))
+        else:
+            req = keywords.missing_required(hdunum, set(hdrkeys))
 
         if req is not None and len(req) > 0:
-            raise ValueError('Error: HDU #%02d Missing required keywords (%s)' % (hdunum, req))
+            raise ValueError('Error: HDU #%02d Missing required keywords (%s)' %
+                             (hdunum, sorted(req)))
 
     return True
 
 
+def read_valid_headers(keywords, fullname, use_scan=True):
+    """Read headers of a raw file and check it is valid, returning the headers.
+
+    Used by check_valid's worker processes so the headers can be cached.
+    Without use_scan, the file is checked with astropy and None is returned.
+    """
+    hdulist = None
+    if use_scan:
+        hdulist = fitshdrs.scan_headers(fullname)
+    check_single_valid(keywords, fullname, 0, hdulist)
+    return hdulist
+
+
 def check_header_keywords(keywords, hdunum, hdr):
     """Check for keywords in header.
     """
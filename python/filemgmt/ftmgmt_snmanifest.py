@@ -9,7 +9,6 @@ from collections import defaultdict
 import json
 
 from filemgmt.ftmgmt_generic import FtMgmtGeneric
-import despydmdb.dmdb_defs as dmdbdefs
 import despymisc.miscutils as miscutils
 import filemgmt.fmutils as fmutils
 import despymisc.misctime as misctime
@@ -36,28 +35,37 @@ class FtMgmtSNManifest(FtMgmtGeneric):
         byfilename = {}
         for fname in listfullnames:
             filename = miscutils.parse_fullname(fname, miscutils.CU_PARSE_FILENAME)
-            byfilename[filename] = fname
+            if filename not in byfilename:
+                byfilename[filename] = []
+            byfilename[filename].append(fname)
 
-        self.dbh.empty_gtt(dmdbdefs.DB_GTT_FILENAME)
-        self.dbh.load_filename_gtt(list(byfilename.keys()))
+        gtt_name = self.dbh.acquire_filename_gtt(list(byfilename.keys()), with_compression=False)
 
         dbq = "select m.manifest_filename from %s m, %s g where m.manifest_filename=g.filename" % \
-            ("MANIFEST_EXPOSURE", dmdbdefs.DB_GTT_FILENAME)
+            ("MANIFEST_EXPOSURE", gtt_name)
         curs = self.dbh.cursor()
         curs.execute(dbq)
 
         results = {}
         for row in curs:
-            results[byfilename[row[0]]] = True
+            # GTT may hold more files (file set)
+            if row[0] in byfilename:
+                for fname in byfilename[row[0]]:
+                    results[fname] = True
 
         for fname in listfullnames:
             if fname not in results:
                 results[fname] = False
 
-        self.dbh.empty_gtt(dmdbdefs.DB_GTT_FILENAME)
+        self.dbh.release_filename_gtt(gtt_name)
 
         return results
 
+    def get_contents_table(self):
+        """Return (table, filename column) checked by has_contents_ingested.
+        """
+        return ('manifest_exposure', 'manifest_filename')
+
     def _gather_metadata_file(self, fullname, **kwargs):
         """Gather metadata for a single file.
         """
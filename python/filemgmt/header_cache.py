@@ -0,0 +1,110 @@
+"""Cache of FITS headers read while registering files.
+
+Validation, metadata gathering and contents ingestion can all need the
+headers of the same file.  FileMgmtDB keeps one HeaderCache and gives it
+to its filetype mgmt objects (ftmgmt.header_cache) so a file's headers
+are read from disk once.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import despymisc.miscutils as miscutils
+import filemgmt.filemgmt_defs as fmdefs
+
+
+def file_id(fullname):
+    """Return (inode, mtime in ns, size) of file or None if it can't be stat'ed.
+    """
+    try:
+        fstat = os.stat(fullname)
+    except OSError:
+        return None
+    return (fstat.st_ino, fstat.st_mtime_ns, fstat.st_size)
+
+
+class HeaderCache(object):
+    """Bounded LRU cache of fits_headers.HeaderLists by file.
+
+    An entry is only used while the file's (inode, mtime, size) is the
+    same as when its headers were read (HeaderList.fileid).
+    """
+
+    def __init__(self, maxfiles=None):
+        if maxfiles is None:
+            maxfiles = fmdefs.FM_HEADER_CACHE_SIZE
+        self.maxfiles = maxfiles
+        self.entries = OrderedDict()    # fullname -> HeaderList
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        """Pickle as an empty cache (e.g., copy in a worker process).
+        """
+        return {'maxfiles': self.maxfiles}
+
+    def __setstate__(self, state):
+        self.__init__(state['maxfiles'])
+
+    def get(self, fullname, complete=False):
+        """Return cached HeaderList for file or None.
+
+        With complete, only return headers of all the file's HDUs.
+        """
+        with self.lock:
+            headers = self.entries.get(fullname)
+        if headers is not None and complete and not headers.complete:
+            headers = None
+        if headers is not None and file_id(fullname) != headers.fileid:
+            self.discard(fullname)
+            headers = None
+
+        with self.lock:
+            if headers is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                if fullname in self.entries:
+                    self.entries.move_to_end(fullname)
+
+        if miscutils.fwdebug_check(6, 'HEADER_CACHE_DEBUG'):
+            miscutils.fwdebug_print("%s %s" % (fullname, 'hit' if headers is not None else 'miss'))
+        return headers
+
+    def put(self, headers):
+        """Save HeaderList (keeps existing complete headers of unchanged file).
+        """
+        if headers is None or headers.fileid is None:
+            return
+
+        with self.lock:
+            current = self.entries.get(headers.fullname)
+            if current is not None and current.fileid == headers.fileid and \
+                    current.complete and not headers.complete:
+                headers = current
+            self.entries[headers.fullname] = headers
+            self.entries.move_to_end(headers.fullname)
+            while len(self.entries) > self.maxfiles:
+                self.entries.popitem(last=False)
+
+    def pop(self, fullname):
+        """Remove and return HeaderList for file (None if not cached).
+        """
+        with self.lock:
+            return self.entries.pop(fullname, None)
+
+    def discard(self, fullname):
+        """Remove file from cache (e.g., after updating its headers).
+        """
+        self.pop(fullname)
+
+    def clear(self):
+        """Empty the cache.
+        """
+        with self.lock:
+            self.entries.clear()
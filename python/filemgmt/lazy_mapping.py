@@ -0,0 +1,100 @@
+"""Mapping whose entries are read the first time they are used.
+
+FileMgmtDB can use these for config['filetype_metadata'] and
+config['file_header'] (config lazy_filetype_metadata) so a run touching a
+few filetypes doesn't read the definitions of all of them from the DB.
+"""
+
+import copy
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+
+class LazyMapping(MutableMapping):
+    """Mapping loading single entries with loadone(key) on first use.
+
+    loadone returns the value or None if there is no such key.  Listing
+    the keys (iteration, len, copies, pickling) loads all entries once
+    with loadall(), which returns a dict.  Copies and pickles are plain
+    OrderedDicts.
+    """
+
+    def __init__(self, loadone, loadall):
+        self.loadone = loadone
+        self.loadall = loadall
+        self.entries = OrderedDict()
+        self.missing = set()     # keys known not to exist (or deleted)
+        self.complete = False    # whether all entries have been loaded
+
+    def _load(self, key):
+        """Load entry if needed, return whether it exists.
+        """
+        if key in self.entries:
+            return True
+        if self.complete or key in self.missing:
+            return False
+
+        value = self.loadone(key)
+        if value is None:
+            self.missing.add(key)
+            return False
+        self.entries[key] = value
+        return True
+
+    def update_loaded(self, entries):
+        """Save already read entries (not replacing ones loaded or set before).
+        """
+        for key, value in entries.items():
+            if key not in self.entries and key not in self.missing:
+                self.entries[key] = value
+
+    def load_all(self):
+        """Load all entries (once).
+        """
+        if not self.complete:
+            self.update_loaded(self.loadall())
+            self.complete = True
+
+    def __getitem__(self, key):
+        if not self._load(key):
+            raise KeyError(key)
+        return self.entries[key]
+
+    def __contains__(self, key):
+        return self._load(key)
+
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+        self.missing.discard(key)
+
+    def __delitem__(self, key):
+        if not self._load(key):
+            raise KeyError(key)
+        del self.entries[key]
+        self.missing.add(key)
+
+    def __iter__(self):
+        self.load_all()
+        return iter(list(self.entries.keys()))
+
+    def __len__(self):
+        self.load_all()
+        return len(self.entries)
+
+    def __repr__(self):
+        return "LazyMapping(%s loaded%s)" % (list(self.entries.keys()),
+                                             ', complete' if self.complete else '')
+
+    def copy(self):
+        """Return all entries as an OrderedDict.
+        """
+        self.load_all()
+        return OrderedDict(self.entries)
+
+    def __deepcopy__(self, memo):
+        self.load_all()
+        return copy.deepcopy(self.entries, memo)
+
+    def __reduce__(self):
+        self.load_all()
+        return (OrderedDict, (list(self.entries.items()),))
@@ -0,0 +1,143 @@
+"""Cache of files' archive locations.
+
+Jobs ask for the location of the same files (calibrations, config files,
+...) many times.  FileMgmtDB can keep a LocationCache (config
+location_cache_size > 0) so repeated get_file_location/get_file_archive_info
+calls for a file don't query the DB again.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import despymisc.miscutils as miscutils
+import filemgmt.filemgmt_defs as fmdefs
+
+
+class LocationCache(object):
+    """Bounded LRU cache of ArchiveFileInfo by (archive, filename, compress_order).
+
+    Entries expire ttl seconds after being saved (ttl <= 0 means never).
+    Files not found in the archive aren't cached.  Files whose locations
+    are written in the current transaction (see mark_written) are removed again
+    by rollback(), other entries stay.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        if ttl is None:
+            ttl = fmdefs.FM_LOCATION_CACHE_TTL
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()    # (archive, filename, compress_order) -> (expires, record)
+        self.bykey = {}                 # (archive, filename) -> set of compress_orders cached
+        self.written_files = set()      # (archive or None, filename) written since last commit
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """Return dict of hits, misses and number of entries.
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+    def get(self, arname, filename, compress_order):
+        """Return cached ArchiveFileInfo for file or None.
+        """
+        key = (arname, filename, tuple(compress_order))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] < time.time():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, arname, compress_order, record):
+        """Save ArchiveFileInfo of file found with given compress_order.
+        """
+        key = (arname, record.filename, tuple(compress_order))
+        expires = None
+        if self.ttl > 0:
+            expires = time.time() + self.ttl
+
+        with self.lock:
+            self.entries[key] = (expires, record)
+            self.entries.move_to_end(key)
+            self.bykey.setdefault(key[:2], set()).add(key[2])
+            while len(self.entries) > self.maxsize:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        """Remove entry (caller holds lock).
+        """
+        self.entries.pop(key, None)
+        corders = self.bykey.get(key[:2])
+        if corders is not None:
+            corders.discard(key[2])
+            if len(corders) == 0:
+                del self.bykey[key[:2]]
+
+    def invalidate(self, filenames, arname=None):
+        """Remove given files (for all compress_orders) from cache.
+
+        If arname is None, the files are removed for every archive.
+        """
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        filenames = set(filenames)
+
+        with self.lock:
+            if arname is None:
+                keys = [key for key in self.bykey if key[1] in filenames]
+            else:
+                keys = [(arname, fname) for fname in filenames if (arname, fname) in self.bykey]
+            for key in keys:
+                for corder in self.bykey.pop(key):
+                    self.entries.pop(key + (corder,), None)
+
+        if miscutils.fwdebug_check(6, 'LOCATION_CACHE_DEBUG'):
+            miscutils.fwdebug_print("invalidated %s of %s files" % (len(keys), len(filenames)))
+
+    def mark_written(self, filenames, arname=None):
+        """Remove files whose locations are changed in the current transaction.
+
+        They are removed again at rollback (entries cached meanwhile
+        could be of uncommitted rows).
+        """
+        if isinstance(filenames, str):
+            filenames = [filenames]
+        self.invalidate(filenames, arname)
+        with self.lock:
+            self.written_files.update([(arname, fname) for fname in filenames])
+
+    def commit(self):
+        """Forget files written in the committed transaction.
+        """
+        with self.lock:
+            self.written_files.clear()
+
+    def rollback(self):
+        """Remove files written in the rolled back transaction.
+        """
+        with self.lock:
+            written = self.written_files
+            self.written_files = set()
+        for arname in set([key[0] for key in written]):
+            self.invalidate([key[1] for key in written if key[0] == arname], arname)
+
+    def clear(self):
+        """Empty the cache.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.bykey.clear()
+            self.written_files.clear()
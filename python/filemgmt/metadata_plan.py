@@ -0,0 +1,91 @@
+"""Plan of how to get a filetype's metadata from a file.
+
+A filetype's metadata definition (filetype_metadata[filetype]['hdus'],
+nested by HDU, required/optional status and section) is turned once into a
+flat list of MetadataSteps which the filetype mgmt objects run per file.
+"""
+
+from collections import OrderedDict
+
+import despymisc.miscutils as miscutils
+import filemgmt.filemgmt_defs as fmdefs
+
+# order in which sections are done for each HDU/status
+SECTION_ORDER = [fmdefs.META_FILENAME, fmdefs.META_WCL, fmdefs.META_HEADERS,
+                 fmdefs.META_COMPUTE, fmdefs.META_COPY]
+
+# sections whose values come from the file's headers
+HEADER_SECTIONS = [fmdefs.META_HEADERS, fmdefs.META_COMPUTE, fmdefs.META_COPY]
+
+# sections whose values are written to the primary header when updating
+UPDATE_SECTIONS = [fmdefs.META_COMPUTE, fmdefs.META_COPY, fmdefs.META_WCL]
+
+
+class MetadataStep(object):
+    """Get the values of keys of a single section for a single HDU.
+
+    For compute (c) sections, funcs has (key, special metadata function)
+    for each key.
+    """
+
+    def __init__(self, section, hdname, keys, funcs=None):
+        self.section = section
+        self.hdname = hdname
+        self.keys = keys
+        self.funcs = funcs
+
+
+class MetadataPlan(object):
+    """Flat list of steps getting a filetype's metadata.
+
+    Adjacent steps of the same section and HDU are merged.  spmeta is the
+    module with the special metadata functions (func_<key>) for c sections.
+    """
+
+    def __init__(self, filetype, metadefs, spmeta=None):
+        self.filetype = filetype
+        self.steps = []
+        self.hdnames = []
+        self.update_keys = []   # keys written to primary header, in order
+        self.needs_headers = False
+
+        updkeys = OrderedDict()
+        for hdname, hddict in list(metadefs['hdus'].items()):
+            self.hdnames.append(hdname)
+            for stdict in list(hddict.values()):
+                for sect in SECTION_ORDER:
+                    if sect in stdict:
+                        self._add_step(sect, hdname, list(stdict[sect].keys()), spmeta)
+                for sect in UPDATE_SECTIONS:
+                    if sect in stdict:
+                        for key in stdict[sect]:
+                            updkeys[key] = True
+        self.update_keys = list(updkeys.keys())
+
+        if miscutils.fwdebug_check(3, 'FTMGMT_DEBUG'):
+            miscutils.fwdebug_print("INFO: %s plan has %s steps" % (filetype, len(self.steps)))
+
+    def _add_step(self, sect, hdname, keys, spmeta):
+        """Add step to plan, merging with previous step if possible.
+        """
+        if sect in HEADER_SECTIONS:
+            self.needs_headers = True
+
+        funcs = None
+        if sect == fmdefs.META_COMPUTE and spmeta is not None:
+            funcs = []
+            for funckey in keys:
+                try:
+                    funcs.append((funckey, getattr(spmeta, 'func_%s' % funckey.lower())))
+                except AttributeError:
+                    miscutils.fwdebug_print(
+                        "WARN: Couldn't find func_%s in %s" % (funckey, spmeta.__name__))
+
+        if len(self.steps) > 0:
+            last = self.steps[-1]
+            if last.section == sect and last.hdname == hdname:
+                last.keys.extend(keys)
+                if funcs is not None:
+                    last.funcs.extend(funcs)
+                return
+        self.steps.append(MetadataStep(sect, hdname, keys, funcs))
@@ -0,0 +1,82 @@
+"""Local journal of file registration progress.
+
+Used by register_files.py so that a restarted run can skip the files
+an earlier run already finished, without asking the DB about them.
+"""
+
+import os
+import sqlite3
+import time
+
+import despymisc.miscutils as miscutils
+
+# file read and DESFILE + metadata rows saved
+STAGE_METADATA = 'metadata'
+# contents ingested (if filetype has any)
+STAGE_CONTENTS = 'contents'
+# location saved in FILE_ARCHIVE_INFO
+STAGE_ARCHIVE = 'archive'
+
+ALL_STAGES = [STAGE_METADATA, STAGE_CONTENTS, STAGE_ARCHIVE]
+
+
+class RegistrationJournal(object):
+    """SQLite file recording which registration stages are done per file.
+
+    Stages should only be marked done after the DB work was committed.
+    A journal belongs to a single archive and DB section; opening it for
+    a different one is an error.
+    """
+
+    def __init__(self, journalname, archive_name, section):
+        self.journalname = journalname
+        self.conn = sqlite3.connect(journalname)
+        self.conn.execute("create table if not exists journal_info "
+                          "(name text primary key, value text)")
+        self.conn.execute("create table if not exists journal "
+                          "(fullname text, stage text, filetype text, donetime real, "
+                          "primary key (fullname, stage))")
+
+        info = dict(self.conn.execute("select name, value from journal_info").fetchall())
+        expected = {'archive_name': archive_name, 'section': str(section)}
+        if len(info) == 0:
+            self.conn.executemany("insert into journal_info (name, value) values (?, ?)",
+                                  list(expected.items()))
+            self.conn.commit()
+        elif info != expected:
+            miscutils.fwdie("Error: journal %s was written for %s, not %s" %
+                            (journalname, info, expected), 1)
+
+        if miscutils.fwdebug_check(3, 'REGJOURNAL_DEBUG'):
+            miscutils.fwdebug_print("Using journal %s (exists = %s)" %
+                                    (journalname, os.path.exists(journalname)))
+
+    def done_files(self, stages=None):
+        """Return set of fullnames for which all given stages are done.
+        """
+        if stages is None:
+            stages = ALL_STAGES
+
+        sql = ("select fullname from journal where stage in (%s) "
+               "group by fullname having count(distinct stage) = ?") % \
+              ','.join(['?'] * len(stages))
+        curs = self.conn.execute(sql, list(stages) + [len(stages)])
+        return set([row[0] for row in curs])
+
+    def mark_done(self, fullnames, filetype, stages):
+        """Record that the given stages are done for the given files.
+        """
+        now = time.time()
+        rows = []
+        for stage in stages:
+            for fname in fullnames:
+                rows.append((fname, stage, filetype, now))
+        self.conn.executemany("insert or replace into journal "
+                              "(fullname, stage, filetype, donetime) values (?, ?, ?, ?)",
+                              rows)
+        self.conn.commit()
+
+    def close(self):
+        """Close the journal file.
+        """
+        self.conn.close()
@@ -0,0 +1,204 @@
+"""Register files with the scan, read and DB stages running at the same time.
+
+    scan --(queue)--> metadata + md5sum --(queue)--> DB writer
+
+Files are found by the scan stage and read (metadata, disk info and
+md5sum, see FileMgmtDB.gather_file_data) by the extraction stage, each
+in its own thread.  The DB writer runs in the caller's thread, and it is
+the only stage that uses the DB connection.  The queues between stages
+are bounded, so memory use doesn't depend on how many files there are.
+"""
+
+import queue
+import sys
+import threading
+import time
+
+import despymisc.miscutils as miscutils
+import filemgmt.dirwalk as dirwalk
+import filemgmt.filemgmt_defs as fmdefs
+import filemgmt.reg_journal as regjournal
+
+# put on a queue after a stage's last item
+_END = object()
+
+
+def walk_files(path):
+    """Yield fullnames of the files under path as the directories are read.
+    """
+    for (dirpath, _, files) in dirwalk.walk(path):
+        for entry in files:
+            yield dirpath + '/' + entry.name
+
+
+class RegistrationPipeline(object):
+    """Register files (DESFILE, metadata, contents, archive location).
+
+    Every batch_size files the writer saves what was read, registers
+    the files in the archive and commits (if do_commit).
+    """
+
+    def __init__(self, filemgmt, task_id, archive_name, do_commit, num_workers=1,
+                 batch_size=None, queue_size=None, journal=None):
+        self.filemgmt = filemgmt
+        self.task_id = task_id
+        self.archive_name = archive_name
+        self.do_commit = do_commit
+        self.num_workers = num_workers
+        self.journal = journal
+
+        self.batch_size = batch_size
+        if self.batch_size is None or self.batch_size <= 0:
+            self.batch_size = fmdefs.FM_REGISTER_BATCH_SIZE
+        self.queue_size = queue_size
+        if self.queue_size is None or self.queue_size <= 0:
+            self.queue_size = fmdefs.FM_PIPELINE_QUEUE_SIZE
+
+        self.stop = threading.Event()
+        self.errors = []
+        self.numfound = 0
+        self.numskipped = 0
+        self.numdone = 0
+        self.problemfiles = set()
+
+    def _put(self, outq, item):
+        """Put item on queue waiting for room, unless pipeline is stopping.
+        """
+        while not self.stop.is_set():
+            try:
+                outq.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _iter_queue(self, inq):
+        """Yield items from queue until the end marker or pipeline stops.
+        """
+        while not self.stop.is_set():
+            try:
+                item = inq.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is _END:
+                return
+            yield item
+
+    def _run_stage(self, name, func, *args):
+        """Thread target saving a stage's exception and stopping the pipeline.
+        """
+        try:
+            func(*args)
+        except BaseException:
+            self.errors.append((name, sys.exc_info()))
+            self.stop.set()
+
+    def _scan(self, fullnames, outq, skip):
+        """Scan stage: pass on names of files which still need registering.
+        """
+        for fname in fullnames:
+            self.numfound += 1
+            if skip is not None and fname in skip:
+                self.numskipped += 1
+                continue
+            if not self._put(outq, fname):
+                return
+        self._put(outq, _END)
+
+    def _extract(self, inq, outq):
+        """Extraction stage: read metadata and disk info of files.
+        """
+        for item in self.filemgmt.gather_file_data(self._iter_queue(inq), False, None,
+                                                   self.num_workers):
+            if not self._put(outq, item):
+                return
+        self._put(outq, _END)
+
+    def _write_batch(self, ftype, batch):
+        """DB writer stage: save a batch of read files and commit.
+        """
+        starttime = time.time()
+        # batch's names are loaded into the filename GTT once for all the checks
+        with self.filemgmt.file_set([item[0] for item in batch]):
+            results = self.filemgmt.register_gathered_file_data(ftype, batch, None,
+                                                                self.task_id)
+            goodlist = [fname for fname in results if results[fname] is not None]
+            self.problemfiles.update([fname for fname in results if results[fname] is None])
+
+            if len(goodlist) > 0:
+                existing = set(self.filemgmt.is_file_in_archive(goodlist, self.archive_name))
+                missing = [fname for fname in goodlist
+                           if miscutils.parse_fullname(fname, miscutils.CU_PARSE_BASENAME)
+                           not in existing]
+                if len(missing) > 0:
+                    problems = self.filemgmt.register_file_in_archive(missing,
+                                                                      self.archive_name)
+                    if problems is not None and len(problems) > 0:
+                        print("\n\n\nError: putting %0d files into archive" % len(problems))
+                        for pfile in problems:
+                            print(pfile, problems[pfile])
+                        miscutils.fwdie("Error: problems registering files in archive", 1)
+
+            if self.do_commit:
+                self.filemgmt.commit()
+                # only record files as done once the DB has them
+                if self.journal is not None:
+                    self.journal.mark_done(goodlist, ftype, regjournal.ALL_STAGES)
+
+        self.numdone += len(goodlist)
+        print("\t%0d file(s) registered, %0d found so far (batch %0.2f secs)" %
+              (self.numdone, self.numfound, time.time() - starttime))
+
+    def run(self, ftype, fullnames, skip=None):
+        """Register files of a single filetype.
+
+        fullnames can be any iterable (e.g., walk_files) and is read by
+        the scan stage as the pipeline needs more files.  Files in skip
+        are passed over.  Returns set of files which couldn't be saved.
+        """
+        self.stop.clear()
+        self.errors = []
+        self.numfound = 0
+        self.numskipped = 0
+        self.numdone = 0
+        self.problemfiles = set()
+
+        # load before starting stages so extraction uses the same object
+        self.filemgmt.dynam_load_ftmgmt(ftype)
+
+        scanq = queue.Queue(self.queue_size)
+        dataq = queue.Queue(self.queue_size)
+        threads = [threading.Thread(target=self._run_stage,
+                                    args=('scan', self._scan, fullnames, scanq, skip)),
+                   threading.Thread(target=self._run_stage,
+                                    args=('extract', self._extract, scanq, dataq))]
+        for thd in threads:
+            thd.daemon = True
+            thd.start()
+
+        try:
+            batch = []
+            for item in self._iter_queue(dataq):
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    self._write_batch(ftype, batch)
+                    batch = []
+            if len(batch) > 0 and not self.stop.is_set():
+                self._write_batch(ftype, batch)
+        except BaseException:
+            self.stop.set()
+            raise
+        finally:
+            for thd in threads:
+                thd.join()
+
+        if len(self.errors) > 0:
+            (name, excinfo) = self.errors[0]
+            print("Error: %s stage of registration pipeline failed" % name)
+            raise excinfo[1].with_traceback(excinfo[2])
+
+        if miscutils.fwdebug_check(3, 'REGPIPELINE_DEBUG'):
+            miscutils.fwdebug_print("found=%s skipped=%s done=%s problems=%s" %
+                                    (self.numfound, self.numskipped, self.numdone,
+                                     len(self.problemfiles)))
+        return self.problemfiles
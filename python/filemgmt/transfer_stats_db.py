@@ -47,6 +47,12 @@ class TransferStatsDB(desdmdbi.DesDmDbi):
             miscutils.fwdie("Error: problem connecting to database: %s\n"
                             "\tCheck desservices file and environment variables" % err, 1)
 
+        self.refresh_config(config)
+
+    def refresh_config(self, config):
+        """Set values from config (also when reusing this object, see dbpool).
+        """
+        self.__initialize_values__()
         self.parent_task_id = config['parent_task_id']
         self.root_task_id = config['root_task_id']
 
@@ -0,0 +1,8 @@
+"""Make the filemgmt package importable when running pytest from a checkout.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'python'))
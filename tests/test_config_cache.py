@@ -0,0 +1,50 @@
+"""Tests of the on-disk config cache.
+"""
+
+import os
+
+import pytest
+
+import filemgmt.config_cache as configcache
+
+CONFIG = {'archive': {'ar': {'root': '/archive'}},
+          'filetype_metadata': {'raw': {'filetype_mgmt': 'x', 'metadata_table': 'exposure'}}}
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    return str(tmp_path)
+
+
+def test_cache_filename(cache_home):
+    name = configcache.cache_filename('~/.desservices.ini', 'db-test')
+    assert os.path.dirname(name) == os.path.join(cache_home, 'filemgmt')
+    assert name != configcache.cache_filename('~/.desservices.ini', 'db-other')
+    assert name == configcache.cache_filename(os.path.expanduser('~/.desservices.ini'),
+                                              'db-test')
+
+
+def test_write_read():
+    name = configcache.cache_filename(None, 'db-test')
+    assert configcache.read_config(name, ('fp',)) is None
+    configcache.write_config(name, ('fp',), CONFIG)
+    assert configcache.read_config(name, ('fp',)) == CONFIG
+    # tables changed
+    assert configcache.read_config(name, ('other',)) is None
+    assert [fname for fname in os.listdir(os.path.dirname(name))] == [os.path.basename(name)]
+
+
+def test_other_version(monkeypatch):
+    name = configcache.cache_filename(None, 'db-test')
+    configcache.write_config(name, ('fp',), CONFIG)
+    monkeypatch.setattr(configcache, 'CACHE_VERSION', configcache.CACHE_VERSION + 1)
+    assert configcache.read_config(name, ('fp',)) is None
+
+
+def test_corrupt_file():
+    name = configcache.cache_filename(None, 'db-test')
+    os.makedirs(os.path.dirname(name))
+    with open(name, 'wb') as cachefh:
+        cachefh.write(b'not a pickle')
+    assert configcache.read_config(name, ('fp',)) is None
@@ -0,0 +1,56 @@
+"""Tests of the threaded directory walk.
+"""
+
+import os
+
+import pytest
+
+import filemgmt.dirwalk as dirwalk
+
+
+@pytest.fixture
+def tree(tmp_path):
+    for dirname in ['a/b/c', 'a/d', 'e']:
+        os.makedirs(str(tmp_path / dirname))
+    for fname in ['z.fits', 'a/y.fits', 'a/b/x.fits', 'a/b/c/w.fits', 'a/d/v.fits',
+                  'a/d/u.fits', 'e/t.fits']:
+        with open(str(tmp_path / fname), 'w') as outfh:
+            outfh.write(fname)
+    os.symlink(str(tmp_path / 'a' / 'b'), str(tmp_path / 'e' / 'link'))
+    return str(tmp_path)
+
+
+def os_walk(top, followlinks=False):
+    """os.walk in the order dirwalk.walk yields (names sorted).
+    """
+    result = []
+    for (dirpath, dirs, files) in os.walk(top, followlinks=followlinks):
+        dirs.sort()
+        result.append((dirpath, sorted(dirs), sorted(files)))
+    return result
+
+
+@pytest.mark.parametrize('num_threads', [1, 4])
+@pytest.mark.parametrize('followlinks', [False, True])
+def test_walk_like_os_walk(tree, num_threads, followlinks):
+    walked = [(dirpath, [entry.name for entry in dirs], [entry.name for entry in files])
+              for (dirpath, dirs, files) in dirwalk.walk(tree, followlinks,
+                                                         num_threads=num_threads, prefetch=2)]
+    assert walked == os_walk(tree, followlinks)
+
+
+def test_walk_files(tree):
+    paths = [entry.path for entry in dirwalk.walk_files(tree, stat_files=True)]
+    expected = [os.path.join(dirpath, fname)
+                for (dirpath, _, files) in os_walk(tree) for fname in files]
+    assert paths == expected
+
+
+def test_missing_top(tmp_path):
+    assert list(dirwalk.walk(str(tmp_path / 'nope'))) == []
+
+
+def test_stop_early(tree):
+    walker = dirwalk.walk(tree, num_threads=2)
+    assert next(walker)[0] == tree
+    walker.close()
@@ -0,0 +1,26 @@
+"""Tests of compiling wcl file patterns.
+"""
+
+import filemgmt.ftmgmt_generic as ftmgmtgen
+
+FILEPAT = 'D${expnum:8}_${band}_c${ccdnum:2}_r${reqnum}p${attnum:2}_immasked.fits'
+
+
+def test_compile_filepat():
+    (pattern, listvar) = ftmgmtgen.compile_filepat(FILEPAT)
+    assert listvar == ['expnum', 'band', 'ccdnum', 'reqnum', 'attnum']
+    match = pattern.search('D00123456_g_c05_r1234p01_immasked.fits')
+    assert match.groups() == ('00123456', 'g', '05', '1234', '01')
+    assert pattern.search('D123_g_c05_r1234p01_immasked.fits') is None
+
+
+def test_compile_filepat_cached():
+    assert ftmgmtgen.compile_filepat(FILEPAT) is ftmgmtgen.compile_filepat(FILEPAT)
+
+
+def test_parse_filename_metadata():
+    (pattern, listvar) = ftmgmtgen.compile_filepat(FILEPAT)
+    mddict = ftmgmtgen.parse_filename_metadata(pattern, listvar,
+                                               '/a/b/D00123456_g_c05_r1234p01_immasked.fits.fz',
+                                               ['expnum', 'ccdnum'])
+    assert mddict == {'expnum': '00123456', 'ccdnum': '05'}
@@ -0,0 +1,184 @@
+"""Tests of the header-only FITS scanner against astropy.
+"""
+
+import hashlib
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+import filemgmt.fits_headers as fitshdrs
+
+
+def astropy_value(value):
+    """Value as the scanner returns it (undefined values are None).
+    """
+    if isinstance(value, fits.card.Undefined):
+        return None
+    return value
+
+
+def make_header():
+    """Header with all kinds of cards the scanner has to parse.
+    """
+    hdr = fits.Header()
+    hdr['STR'] = ("it's a string", 'with quote')
+    hdr['LONGSTR'] = ('x' * 50 + ' ' + 'y' * 60 + ' end', 'long comment ' * 3)
+    hdr['INTV'] = (42, 'int')
+    hdr['NEGF'] = -1.5e-10
+    hdr['BOOLT'] = True
+    hdr['BOOLF'] = False
+    hdr['CPLX'] = complex(1.5, -2)
+    hdr['UNDEF'] = None
+    hdr['EMPTYSTR'] = ''
+    hdr['HIERARCH ESO DET CHIP NAME'] = 'chip 1'
+    hdr['HIERARCH ESO DET GAIN'] = 3.25
+    hdr.add_comment('first comment')
+    hdr.add_history('some history')
+    hdr.add_history('more history')
+    hdr.add_blank('blank text')
+    hdr.append(fits.Card.fromstring("DEXP    =               1.5D3 / d exponent"))
+    return hdr
+
+
+@pytest.fixture
+def fitsfile(tmp_path):
+    """Primary image with many card types, an image extension and a table.
+    """
+    prim = fits.PrimaryHDU(data=np.arange(100, dtype=np.int16).reshape(10, 10),
+                           header=make_header())
+    sci = fits.ImageHDU(data=np.ones((7, 3), dtype=np.float32), name='SCI')
+    tab = fits.BinTableHDU.from_columns([fits.Column(name='a', format='J',
+                                                     array=np.arange(5))], name='TAB')
+    fullname = str(tmp_path / 'test.fits')
+    fits.HDUList([prim, sci, tab]).writeto(fullname)
+    return fullname
+
+
+def test_scan_matches_astropy(fitsfile):
+    scanned = fitshdrs.scan_headers(fitsfile)
+    with fits.open(fitsfile) as hdulist:
+        assert len(scanned) == len(hdulist)
+        assert scanned.complete
+        for hdu, shdu in zip(hdulist, scanned):
+            assert shdu.data_offset == hdu.fileinfo()['datLoc']
+            hdr = hdu.header
+            shdr = shdu.header
+            keys = [key for key in hdr.keys() if key not in fitshdrs.COMMENTARY_KEYWORDS]
+            assert [key.upper() for key in keys] == list(shdr.keys())
+            for key in keys:
+                assert key in shdr
+                assert shdr[key] == astropy_value(hdr[key]), key
+                assert shdr.comments[key] == hdr.comments[key], key
+
+
+def test_scan_values(fitsfile):
+    hdr = fitshdrs.scan_headers(fitsfile)[0].header
+    assert hdr['STR'] == "it's a string"
+    assert hdr['LONGSTR'] == 'x' * 50 + ' ' + 'y' * 60 + ' end'
+    assert hdr.comments['LONGSTR'] == ('long comment ' * 3).strip()
+    assert hdr['INTV'] == 42 and isinstance(hdr['INTV'], int)
+    assert hdr['BOOLT'] is True and hdr['BOOLF'] is False
+    assert hdr['CPLX'] == complex(1.5, -2)
+    assert hdr['UNDEF'] is None
+    assert hdr['EMPTYSTR'] == ''
+    assert hdr['DEXP'] == 1500.0
+    assert hdr['ESO DET CHIP NAME'] == 'chip 1'
+    assert hdr['HIERARCH ESO DET GAIN'] == 3.25
+    assert hdr.get('NOSUCHKEY', 'dflt') == 'dflt'
+    assert 'NOSUCHKEY' not in hdr
+    with pytest.raises(KeyError):
+        hdr['NOSUCHKEY']
+
+
+def test_commentary_cards(fitsfile):
+    cards = fitshdrs.scan_headers(fitsfile)[0].header.cards
+    commentary = [(key, value) for (key, value, comment) in cards
+                  if key in fitshdrs.COMMENTARY_KEYWORDS]
+    assert commentary == [('COMMENT', 'first comment'), ('HISTORY', 'some history'),
+                          ('HISTORY', 'more history'), ('', 'blank text')]
+    # CONTINUE cards are part of LONGSTR's card
+    assert 'CONTINUE' not in [card[0] for card in cards]
+
+
+def test_parse_card():
+    assert fitshdrs.parse_card("KEY     = 'O''Hara '           / name") == \
+        ('KEY', "O'Hara", 'name')
+    assert fitshdrs.parse_card("KEY     =                      / no value") == \
+        ('KEY', None, 'no value')
+    assert fitshdrs.parse_card("KEY     =                 1.5D-2") == ('KEY', 0.015, '')
+    assert fitshdrs.parse_card("HISTORY   did things / not a comment") == \
+        ('HISTORY', '  did things / not a comment', None)
+    assert fitshdrs.parse_card("HIERARCH A B C = 7 / hier") == ('A B C', 7, 'hier')
+    card = "LONG    = 'abc&'".ljust(80)
+    nextcards = ["CONTINUE  'def&'".ljust(80), "CONTINUE  'ghi' / end".ljust(80),
+                 "OTHER   = 1".ljust(80)]
+    assert fitshdrs.parse_card(card, nextcards) == ('LONG', 'abcdefghi', 'end')
+
+
+def test_convert_value():
+    assert fitshdrs.convert_value('') is None
+    assert fitshdrs.convert_value('T') is True
+    assert fitshdrs.convert_value('-12') == -12
+    assert fitshdrs.convert_value('1.0E3') == 1000.0
+    assert fitshdrs.convert_value('(1, -2.5)') == complex(1, -2.5)
+    assert fitshdrs.convert_value('junk') == 'junk'
+
+
+def test_header_list_indexing(fitsfile):
+    scanned = fitshdrs.scan_headers(fitsfile)
+    assert scanned['sci'].index == 1
+    assert scanned['TAB'] is scanned[2]
+    assert scanned[0].name == 'PRIMARY'
+    assert 'SCI' in scanned and 'NOPE' not in scanned
+    with pytest.raises(KeyError):
+        scanned['NOPE']
+    with pytest.raises(IndexError):
+        scanned[3]
+
+
+def test_max_hdus(fitsfile):
+    scanned = fitshdrs.scan_headers(fitsfile, max_hdus=2)
+    assert len(scanned) == 2
+    assert not scanned.complete
+    assert list(scanned['SCI'].header.keys())[:2] == ['XTENSION', 'BITPIX']
+
+    scanned = fitshdrs.scan_headers(fitsfile, max_hdus=3)
+    assert len(scanned) == 3
+    assert not scanned.complete
+
+    scanned = fitshdrs.scan_headers(fitsfile, max_hdus=5)
+    assert len(scanned) == 3
+    assert scanned.complete
+
+
+@pytest.mark.parametrize('make_header', [fitshdrs.astropy_header, fitshdrs.ScannedHeader])
+def test_read_headers_md5(fitsfile, make_header):
+    with open(fitsfile, 'rb') as fitsfh:
+        expected = hashlib.md5(fitsfh.read()).hexdigest()
+
+    # small blocks so data is read in several chunks
+    headers, md5sum = fitshdrs.read_headers_md5(fitsfile, blksize=1000, make_header=make_header)
+    assert md5sum == expected
+    assert len(headers) == 3
+    assert headers[1].header['EXTNAME'] == 'SCI'
+    assert headers[0].header['INTV'] == 42
+
+
+def test_read_headers_md5_trailing_bytes(fitsfile):
+    with open(fitsfile, 'ab') as fitsfh:
+        fitsfh.write(b'trailing junk')
+    with open(fitsfile, 'rb') as fitsfh:
+        expected = hashlib.md5(fitsfh.read()).hexdigest()
+
+    headers, md5sum = fitshdrs.read_headers_md5(fitsfile)
+    assert md5sum == expected
+    assert len(headers) == 3
+
+
+def test_not_fits(tmp_path):
+    fullname = str(tmp_path / 'bad.fits')
+    with open(fullname, 'wb') as fitsfh:
+        fitsfh.write(b'not a fits file' * 300)
+    with pytest.raises(IOError):
+        fitshdrs.scan_headers(fullname)
@@ -0,0 +1,109 @@
+"""Tests of raw validation with scanned headers against astropy.
+"""
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+import filemgmt.filemgmt_defs as fmdefs
+import filemgmt.fits_headers as fitshdrs
+import filemgmt.ftmgmt_raw as ftmgmtraw
+
+NUM_HDUS = 71   # of a DECam raw
+
+KEYWORDS = {'pri': {'FILENAME': 'R', 'INSTRUME': 'R', 'EXPNUM': 'R', 'COMMENT': 'Y',
+                    'AIRMASS': 'Y', 'SIMPLE': 'N'},
+            'ext': {'CCDNUM': 'R', 'DETPOS': 'R', 'BITPIX': 'R', 'NAXIS1': 'R',
+                    'XTENSION': 'R', 'PCOUNT': 'R', 'GCOUNT': 'R', 'COMMENT': 'Y',
+                    'GAINA': 'Y'}}
+
+
+def write_raw(fullname, compress, drop=None):
+    """Write a small raw-like DECam file (tile compressed with compress).
+    """
+    prim = fits.PrimaryHDU()
+    prim.header['FILENAME'] = 'DECam_00123456.fits'
+    prim.header['INSTRUME'] = 'DECam'
+    prim.header['EXPNUM'] = 123456
+    prim.header.add_comment('raw-like test file')
+    prim.header.add_history('written by test')
+    hdus = [prim]
+    for ccdnum in range(1, NUM_HDUS):
+        data = np.arange(16 * 8, dtype=np.int16).reshape(16, 8)
+        if compress:
+            hdu = fits.CompImageHDU(data=data, name='S%d' % ccdnum)
+        else:
+            hdu = fits.ImageHDU(data=data, name='S%d' % ccdnum)
+        hdu.header['CCDNUM'] = ccdnum
+        hdu.header['DETPOS'] = 'S%d' % ccdnum
+        hdu.header['DATASEC'] = '[1:8,1:16]'
+        hdu.header.add_comment('ccd %d' % ccdnum)
+        if drop is not None and ccdnum == 5:
+            del hdu.header[drop]
+        hdus.append(hdu)
+    fits.HDUList(hdus).writeto(fullname)
+
+
+@pytest.fixture(params=[True, False], ids=['fpacked', 'uncompressed'])
+def rawfile(request, tmp_path):
+    fullname = str(tmp_path / 'DECam_00123456.fits')
+    if request.param:
+        fullname += '.fz'
+    write_raw(fullname, request.param)
+    return fullname
+
+
+def test_image_keywords_match_astropy(rawfile):
+    scanned = fitshdrs.scan_headers(rawfile)
+    with fits.open(rawfile) as hdulist:
+        assert len(scanned) == len(hdulist)
+        for hdunum in range(len(hdulist)):
+            assert fitshdrs.image_keywords(scanned[hdunum].header) == \
+                list(hdulist[hdunum].header.keys()), hdunum
+
+
+def test_check_header_same_as_astropy(rawfile):
+    rawkeys = ftmgmtraw.RawKeywords(KEYWORDS)
+    scanned = fitshdrs.scan_headers(rawfile)
+    with fits.open(rawfile) as hdulist:
+        for hdunum in range(len(hdulist)):
+            assert rawkeys.check_header(hdunum,
+                                        fitshdrs.image_keywords(scanned[hdunum].header)) == \
+                rawkeys.check_header(hdunum, list(hdulist[hdunum].header.keys()))
+
+
+@pytest.mark.parametrize('scan', [True, False], ids=['scan', 'astropy'])
+def test_check_single_valid(rawfile, scan):
+    hdulist = None
+    if scan:
+        hdulist = fitshdrs.scan_headers(rawfile)
+    assert ftmgmtraw.check_single_valid(KEYWORDS, rawfile, 0, hdulist)
+
+
+@pytest.mark.parametrize('compress', [True, False], ids=['fpacked', 'uncompressed'])
+@pytest.mark.parametrize('scan', [True, False], ids=['scan', 'astropy'])
+def test_missing_required(tmp_path, compress, scan):
+    fullname = str(tmp_path / 'DECam_00123456.fits')
+    write_raw(fullname, compress, drop='DETPOS')
+    hdulist = None
+    if scan:
+        hdulist = fitshdrs.scan_headers(fullname)
+    with pytest.raises(ValueError, match='HDU #05 Missing required keywords'):
+        ftmgmtraw.check_single_valid(KEYWORDS, fullname, 0, hdulist)
+
+
+def test_check_valid_astropy_backend(rawfile, tmp_path, monkeypatch):
+    keyfile = str(tmp_path / 'keywords.txt')
+    with open(keyfile, 'w') as keyfh:
+        for key in sorted(set(KEYWORDS['pri']) | set(KEYWORDS['ext'])):
+            keyfh.write('%s,%s,%s\n' % (key, KEYWORDS['pri'].get(key, 'N'),
+                                        KEYWORDS['ext'].get(key, 'N')))
+
+    def no_scan(*args, **kwargs):
+        raise AssertionError('headers scanned with astropy backend')
+
+    config = {'raw_keywords_file': keyfile, 'raw_validate_workers': 1,
+              fmdefs.FITS_HEADER_BACKEND: fmdefs.FITS_BACKEND_ASTROPY}
+    monkeypatch.setattr(fitshdrs, 'scan_headers', no_scan)
+    ftmgmt = ftmgmtraw.FtMgmtRaw('raw', None, config)
+    assert ftmgmt.check_valid([rawfile]) == {rawfile: True}
@@ -0,0 +1,93 @@
+"""Tests of the header cache.
+"""
+
+import os
+import pickle
+
+import filemgmt.fits_headers as fitshdrs
+import filemgmt.header_cache as headercache
+
+
+def make_headers(fullname, complete=True):
+    """HeaderList for file as read now (no HDUs needed for caching).
+    """
+    return fitshdrs.HeaderList(fullname, [], headercache.file_id(fullname), complete)
+
+
+def write_file(fullname, text):
+    with open(fullname, 'w') as outfh:
+        outfh.write(text)
+
+
+def test_get_put(tmp_path):
+    fullname = str(tmp_path / 'a.fits')
+    write_file(fullname, 'x')
+    cache = headercache.HeaderCache(10)
+    assert cache.get(fullname) is None
+    headers = make_headers(fullname)
+    cache.put(headers)
+    assert cache.get(fullname) is headers
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_changed_file_not_used(tmp_path):
+    fullname = str(tmp_path / 'a.fits')
+    write_file(fullname, 'x')
+    cache = headercache.HeaderCache(10)
+    cache.put(make_headers(fullname))
+    write_file(fullname, 'longer')
+    assert cache.get(fullname) is None
+    assert len(cache) == 0
+
+
+def test_complete(tmp_path):
+    fullname = str(tmp_path / 'a.fits')
+    write_file(fullname, 'x')
+    cache = headercache.HeaderCache(10)
+    partial = make_headers(fullname, complete=False)
+    cache.put(partial)
+    assert cache.get(fullname) is partial
+    assert cache.get(fullname, complete=True) is None
+
+    # complete headers aren't replaced by partial ones of the same file
+    complete = make_headers(fullname)
+    cache.put(complete)
+    cache.put(make_headers(fullname, complete=False))
+    assert cache.get(fullname, complete=True) is complete
+
+
+def test_bounded(tmp_path):
+    cache = headercache.HeaderCache(2)
+    names = []
+    for i in range(3):
+        names.append(str(tmp_path / ('%d.fits' % i)))
+        write_file(names[-1], 'x')
+    cache.put(make_headers(names[0]))
+    cache.put(make_headers(names[1]))
+    cache.get(names[0])
+    cache.put(make_headers(names[2]))
+    assert cache.get(names[1]) is None
+    assert cache.get(names[0]) is not None
+    assert len(cache) == 2
+
+
+def test_missing_file_or_id(tmp_path):
+    fullname = str(tmp_path / 'a.fits')
+    cache = headercache.HeaderCache(10)
+    cache.put(None)
+    cache.put(fitshdrs.HeaderList(fullname, []))
+    assert len(cache) == 0
+    assert headercache.file_id(fullname) is None
+
+
+def test_pickle_empty(tmp_path):
+    fullname = str(tmp_path / 'a.fits')
+    write_file(fullname, 'x')
+    cache = headercache.HeaderCache(5)
+    cache.put(make_headers(fullname))
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.maxfiles == 5
+    assert len(copy) == 0
+    copy.put(make_headers(fullname))
+    assert len(copy) == 1
+    assert os.path.exists(fullname)
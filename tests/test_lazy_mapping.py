@@ -0,0 +1,90 @@
+"""Tests of LazyMapping.
+"""
+
+import copy
+import pickle
+from collections import OrderedDict
+
+import pytest
+
+import filemgmt.lazy_mapping as lazymapping
+
+ALL = OrderedDict([('a', 1), ('b', 2), ('c', 3)])
+
+
+class Loader(object):
+    """Counts loads of single entries and of all entries.
+    """
+
+    def __init__(self):
+        self.loaded = []
+        self.alls = 0
+
+    def loadone(self, key):
+        self.loaded.append(key)
+        return ALL.get(key)
+
+    def loadall(self):
+        self.alls += 1
+        return ALL
+
+
+@pytest.fixture
+def loader():
+    return Loader()
+
+
+@pytest.fixture
+def mapping(loader):
+    return lazymapping.LazyMapping(loader.loadone, loader.loadall)
+
+
+def test_loads_once(mapping, loader):
+    assert mapping['a'] == 1
+    assert mapping['a'] == 1
+    assert 'a' in mapping
+    assert mapping.get('b') == 2
+    assert loader.loaded == ['a', 'b']
+    assert loader.alls == 0
+
+
+def test_missing(mapping, loader):
+    assert 'x' not in mapping
+    with pytest.raises(KeyError):
+        mapping['x']
+    assert mapping.get('x', 'dflt') == 'dflt'
+    assert loader.loaded == ['x']
+
+
+def test_listing_loads_all(mapping, loader):
+    assert mapping['b'] == 2
+    assert sorted(mapping) == ['a', 'b', 'c']
+    assert len(mapping) == 3
+    assert loader.alls == 1
+    assert 'z' not in mapping
+    assert loader.loaded == ['b']
+
+
+def test_set_delete(mapping, loader):
+    mapping['new'] = 10
+    assert mapping['new'] == 10
+    del mapping['a']
+    assert 'a' not in mapping
+    with pytest.raises(KeyError):
+        del mapping['x']
+    assert sorted(mapping) == ['b', 'c', 'new']
+
+
+def test_update_loaded(mapping, loader):
+    mapping['a'] = 'mine'
+    mapping.update_loaded({'a': 'theirs', 'b': 'read'})
+    assert mapping['a'] == 'mine'
+    assert mapping['b'] == 'read'
+    assert loader.loaded == []
+
+
+def test_copies_are_plain(mapping):
+    for result in [mapping.copy(), copy.deepcopy(mapping),
+                   pickle.loads(pickle.dumps(mapping))]:
+        assert type(result) is OrderedDict
+        assert result == ALL
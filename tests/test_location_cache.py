@@ -0,0 +1,83 @@
+"""Tests of the archive location cache.
+"""
+
+import filemgmt.location_cache as locationcache
+
+
+class Record(object):
+    """Stand-in for ArchiveFileInfo (only filename is used by the cache).
+    """
+
+    def __init__(self, filename, path='p'):
+        self.filename = filename
+        self.path = path
+
+
+def test_get_put():
+    cache = locationcache.LocationCache(10, 0)
+    assert cache.get('ar', 'a.fits', ['.fz', None]) is None
+    rec = Record('a.fits')
+    cache.put('ar', ['.fz', None], rec)
+    assert cache.get('ar', 'a.fits', ['.fz', None]) is rec
+    assert cache.get('ar', 'a.fits', [None]) is None
+    assert cache.get('other', 'a.fits', ['.fz', None]) is None
+    assert cache.stats() == {'hits': 1, 'misses': 3, 'size': 1}
+
+
+def test_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(locationcache.time, 'time', lambda: now[0])
+    cache = locationcache.LocationCache(10, 60)
+    cache.put('ar', [None], Record('a.fits'))
+    now[0] += 59
+    assert cache.get('ar', 'a.fits', [None]) is not None
+    now[0] += 2
+    assert cache.get('ar', 'a.fits', [None]) is None
+    assert len(cache) == 0
+
+
+def test_bounded():
+    cache = locationcache.LocationCache(2, 0)
+    for name in ['a', 'b']:
+        cache.put('ar', [None], Record(name))
+    cache.get('ar', 'a', [None])
+    cache.put('ar', [None], Record('c'))
+    assert cache.get('ar', 'b', [None]) is None
+    assert cache.get('ar', 'a', [None]) is not None
+    assert len(cache) == 2
+
+
+def test_invalidate():
+    cache = locationcache.LocationCache(10, 0)
+    for arname in ['ar1', 'ar2']:
+        cache.put(arname, [None], Record('a'))
+        cache.put(arname, ['.fz'], Record('a'))
+        cache.put(arname, [None], Record('b'))
+    cache.invalidate('a', 'ar1')
+    assert cache.get('ar1', 'a', [None]) is None
+    assert cache.get('ar1', 'a', ['.fz']) is None
+    assert cache.get('ar2', 'a', [None]) is not None
+    cache.invalidate(['a', 'b'])
+    assert len(cache) == 0
+
+
+def test_rollback_keeps_committed():
+    cache = locationcache.LocationCache(10, 0)
+    cache.put('ar', [None], Record('old'))
+    cache.mark_written(['new'], 'ar')
+    cache.put('ar', [None], Record('new'))
+    cache.mark_written(['gone'])
+    cache.put('ar2', [None], Record('gone'))
+    cache.rollback()
+    assert cache.get('ar', 'old', [None]) is not None
+    assert cache.get('ar', 'new', [None]) is None
+    assert cache.get('ar2', 'gone', [None]) is None
+
+
+def test_commit():
+    cache = locationcache.LocationCache(10, 0)
+    cache.mark_written(['new'], 'ar')
+    cache.put('ar', [None], Record('new'))
+    cache.commit()
+    cache.rollback()
+    assert cache.get('ar', 'new', [None]) is not None
@@ -0,0 +1,63 @@
+"""Tests of compiling metadata definitions into MetadataPlans.
+"""
+
+from collections import OrderedDict
+
+import filemgmt.metadata_plan as metaplan
+
+
+class SpecialMetadata(object):
+    """Stand-in for despymisc.create_special_metadata.
+    """
+    __name__ = 'spmeta'
+
+    @staticmethod
+    def func_band(filename, hdulist, whichhdu):
+        return 'g'
+
+
+def make_defs():
+    return {'hdus': OrderedDict([
+        ('primary', OrderedDict([
+            ('r', OrderedDict([('h', OrderedDict([('expnum', 'expnum')])),
+                               ('c', OrderedDict([('band', 'band')])),
+                               ('f', OrderedDict([('filename', 'filename')]))])),
+            ('o', OrderedDict([('h', OrderedDict([('airmass', 'airmass')])),
+                               ('w', OrderedDict([('pfw_attempt_id', 'pfw_attempt_id')]))]))])),
+        ('sci', OrderedDict([
+            ('o', OrderedDict([('h', OrderedDict([('gaina', 'gaina')]))]))]))])}
+
+
+def test_steps():
+    plan = metaplan.MetadataPlan('ft', make_defs(), SpecialMetadata)
+    steps = [(step.section, step.hdname, step.keys) for step in plan.steps]
+    assert steps == [('f', 'primary', ['filename']),
+                     ('h', 'primary', ['expnum']),
+                     ('c', 'primary', ['band']),
+                     ('w', 'primary', ['pfw_attempt_id']),
+                     ('h', 'primary', ['airmass']),
+                     ('h', 'sci', ['gaina'])]
+    assert plan.hdnames == ['primary', 'sci']
+    assert plan.needs_headers
+    assert plan.update_keys == ['band', 'pfw_attempt_id']
+    funcs = plan.steps[2].funcs
+    assert [key for key, _ in funcs] == ['band']
+    assert funcs[0][1](None, None, None) == 'g'
+
+
+def test_adjacent_steps_merged():
+    defs = {'hdus': OrderedDict([
+        ('primary', OrderedDict([
+            ('r', OrderedDict([('h', OrderedDict([('a', 'a')]))])),
+            ('o', OrderedDict([('h', OrderedDict([('b', 'b')]))]))]))])}
+    plan = metaplan.MetadataPlan('ft', defs)
+    assert [(step.section, step.keys) for step in plan.steps] == [('h', ['a', 'b'])]
+
+
+def test_filename_only():
+    defs = {'hdus': OrderedDict([
+        ('primary', OrderedDict([
+            ('r', OrderedDict([('f', OrderedDict([('expnum', 'expnum')])),
+                               ('w', OrderedDict([('pfw_attempt_id', 'x')]))]))]))])}
+    plan = metaplan.MetadataPlan('ft', defs)
+    assert not plan.needs_headers
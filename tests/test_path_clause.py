@@ -0,0 +1,49 @@
+"""Tests of the path condition used for archive path queries.
+"""
+
+import sqlite3
+
+import pytest
+
+import filemgmt.db_utils_local as dbutils
+
+
+class BindDB(object):
+    """Minimal handle with named binds the way the sqlite dbh writes them.
+    """
+    def get_named_bind_string(self, name):
+        return ':' + name
+
+
+PATHS = ['a', 'a/', 'a/b', 'a/b/c', 'a0', 'a-b', 'ab', 'b']
+
+
+def select(relpath, recursive):
+    (sql, binds) = dbutils.path_clause(BindDB(), 'path', relpath, recursive)
+    conn = sqlite3.connect(':memory:')
+    conn.execute('create table fai (path text)')
+    conn.executemany('insert into fai values (?)', [(path,) for path in PATHS])
+    rows = conn.execute('select path from fai where %s' % sql, binds).fetchall()
+    conn.close()
+    return sorted([row[0] for row in rows])
+
+
+@pytest.mark.parametrize('relpath', ['a', 'a/'])
+def test_recursive(relpath):
+    assert select(relpath, True) == ['a', 'a/', 'a/b', 'a/b/c']
+
+
+def test_not_recursive():
+    assert select('a/', False) == ['a', 'a/']
+
+
+@pytest.mark.parametrize('relpath', ['', '/'])
+def test_empty_recursive(relpath):
+    assert dbutils.path_clause(BindDB(), 'path', relpath) == ('1=1', {})
+    assert select(relpath, True) == sorted(PATHS)
+
+
+@pytest.mark.parametrize('relpath', ['', '/'])
+def test_empty_not_recursive(relpath):
+    with pytest.raises(ValueError):
+        dbutils.path_clause(BindDB(), 'path', relpath, recursive=False)
@@ -0,0 +1,31 @@
+"""Tests of the registration journal.
+"""
+
+import pytest
+
+import filemgmt.reg_journal as regjournal
+
+
+def test_done_files(tmp_path):
+    journalname = str(tmp_path / 'journal.db')
+    journal = regjournal.RegistrationJournal(journalname, 'ar', 'db-test')
+    assert journal.done_files() == set()
+    journal.mark_done(['/a.fits', '/b.fits'], 'raw', [regjournal.STAGE_METADATA])
+    journal.mark_done(['/a.fits'], 'raw', [regjournal.STAGE_CONTENTS,
+                                           regjournal.STAGE_ARCHIVE])
+    assert journal.done_files() == set(['/a.fits'])
+    assert journal.done_files([regjournal.STAGE_METADATA]) == set(['/a.fits', '/b.fits'])
+    # marking again is fine
+    journal.mark_done(['/a.fits'], 'raw', regjournal.ALL_STAGES)
+    journal.close()
+
+    journal = regjournal.RegistrationJournal(journalname, 'ar', 'db-test')
+    assert journal.done_files() == set(['/a.fits'])
+    journal.close()
+
+
+def test_other_archive(tmp_path):
+    journalname = str(tmp_path / 'journal.db')
+    regjournal.RegistrationJournal(journalname, 'ar', 'db-test').close()
+    with pytest.raises(SystemExit):
+        regjournal.RegistrationJournal(journalname, 'other', 'db-test')